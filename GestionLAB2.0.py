@@ -7,10 +7,52 @@ from matplotlib import pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import webbrowser
 import os
+import queue
+import threading
+from pathlib import Path
+import calendar
+import argparse
+import laboratorio_db as db
+import impresion_reportes as impresion
+import salud_equipos as salud
+import informes
+import autenticacion as auth
+from cache_consultas import CacheConsultas
+from almacen_filas import TablaColumnar
+from filtro_filas import ResultadoFiltrable
+from laboratorio_db import parsear_fecha, a_timestamp, normalizar_fecha, timestamp_hasta
+
+# Intervalos del archivado automático de registros antiguos
+INTERVALO_ARCHIVO_INICIAL_MS = 10 * 1000
+INTERVALO_ARCHIVO_MS = 6 * 60 * 60 * 1000
+
+# Cada cuánto se revisa si terminó una tarea en segundo plano (impresión, informes)
+INTERVALO_HILO_MS = 100
+
+# Cada cuánto se revisa si hay informes programados pendientes
+INTERVALO_INFORMES_MS = 15 * 60 * 1000
+
+# Filas que se agregan a una tabla grande cada vez que el desplazamiento se acerca al final
+FILAS_POR_PAGINA_TABLA = 500
+
+# Listas de los combobox que se guardan en memoria: clave -> (tabla de la que dependen, consulta)
+LISTAS_CACHE = {
+    "equipos": ("equipos", "SELECT id, nombre FROM equipos ORDER BY nombre"),
+    "equipos_operativos": ("equipos", "SELECT id, nombre FROM equipos WHERE estado = 'Operativo' ORDER BY nombre"),
+    "usuarios": ("usuarios", "SELECT id, nombre FROM usuarios ORDER BY nombre"),
+    "equipos_operativos_ubicacion": ("equipos", "SELECT id, nombre, ubicacion FROM equipos WHERE estado = 'Operativo' ORDER BY nombre"),
+    "equipos_calendario": ("equipos", "SELECT id, nombre, ubicacion FROM equipos WHERE COALESCE(estado, '') != 'Retirado' ORDER BY nombre"),
+    "ubicaciones_equipos": ("equipos", "SELECT DISTINCT ubicacion FROM equipos WHERE ubicacion IS NOT NULL AND ubicacion != '' ORDER BY ubicacion"),
+    "ubicaciones_inventario": ("inventario", "SELECT DISTINCT ubicacion FROM inventario WHERE ubicacion IS NOT NULL AND ubicacion != '' ORDER BY ubicacion"),
+    "reportes_abiertos": ("reportes", "SELECT id, '#' || id || ' ' || COALESCE(tipo, '') || ' (' || COALESCE(fecha, '') || ')' FROM reportes WHERE estado != 'Resuelto' ORDER BY fecha_ts DESC"),
+    "mantenimientos_pendientes": ("mantenimientos", "SELECT id, '#' || id || ' ' || COALESCE(tipo, '') || ' (' || COALESCE(fecha_programada, '') || ')' FROM mantenimientos WHERE estado = 'Pendiente' ORDER BY fecha_programada_ts"),
+}
 
 class SistemaGestionLaboratorio:
-    def __init__(self, root):
+    def __init__(self, root, servidor=None, archivo_clave=None):
         self.root = root
+        self.servidor = servidor  # "host:puerto" del servicio central, o None para usar laboratorio.db local
+        self.archivo_clave = archivo_clave  # Clave compartida del servicio; sin archivo se lee de la variable de entorno
         self.root.title("Gestión de Laboratorio de Redes")
         self.root.geometry("1200x800")
         self.root.state('zoomed')
@@ -18,12 +60,48 @@ class SistemaGestionLaboratorio:
         # Configuración de estilos
         self.configurar_estilos()
         
-        # Barra de menú
-        self.crear_barra_menu()
-        
         # Conexión a la base de datos
         self.conexion_db()
         
+        # Resultados de las estadísticas guardados en disco entre sesiones
+        self.cache_consultas = CacheConsultas(self.servidor or os.path.abspath(db.RUTA_DB))
+        
+        # Listas de los combobox en memoria: clave -> (versión de la tabla, filas)
+        self.cache_listas = {}
+        
+        # Historial ya leído de cada equipo: equipo_id -> (versiones de sus tablas, filas, completo)
+        self.cache_historial = {}
+        
+        # Puntajes de riesgo de los equipos, recalculados solo cuando cambian los datos
+        self.cache_riesgo = salud.CacheRiesgo()
+        
+        # Resultados de las plantillas de informes: nombre -> (versiones de datos, columnas, filas)
+        self.cache_informes = {}
+        
+        # Tablas con sus filas en un almacén por columnas: tree -> vista (tabla, orden, filas mostradas)
+        self.vistas_columnares = {}
+        
+        # Último resultado consultado de cada pestaña; los filtros más restrictivos se aplican sobre él en memoria
+        self.filtros_reportes = ResultadoFiltrable()
+        self.filtros_equipos = ResultadoFiltrable()
+        self.filtros_inventario = ResultadoFiltrable()
+        
+        # Identificador del after() que revisa los estados de las reservas
+        self.tarea_estados_reservas = None
+        
+        # Usuario que inició sesión; la ventana principal solo se muestra después de iniciarla
+        self.sesion = None
+        self.root.withdraw()
+        self.iniciar_sesion()
+        if self.sesion is None:
+            self.root.destroy()
+            return
+        self.root.title(f"Gestión de Laboratorio de Redes - {self.sesion.nombre}")
+        self.root.deiconify()
+        
+        # Barra de menú (sus opciones dependen de los permisos de la sesión)
+        self.crear_barra_menu()
+        
         # Crear pestañas principales
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True)
@@ -48,8 +126,207 @@ class SistemaGestionLaboratorio:
         # Cargar datos iniciales
         self.cargar_datos_iniciales()
         
+        # Archivar periódicamente los registros cerrados antiguos (en modo cliente lo hace el servicio)
+        if not self.servidor:
+            self.root.after(INTERVALO_ARCHIVO_INICIAL_MS, self.archivar_periodicamente)
+            
+            # Pasar las reservas a En curso / Finalizada cuando llegan sus horas de inicio y fin
+            self.actualizar_estados_reservas()
+            
+            # Escribir los informes programados que estén pendientes
+            self.root.after(INTERVALO_ARCHIVO_INICIAL_MS, self.generar_informes_periodicamente)
+        
         # Configurar cierre seguro
         self.root.protocol("WM_DELETE_WINDOW", self.cerrar_aplicacion)
+        
+        self.registrar_acceso("Inició sesión")
+    
+    def iniciar_sesion(self):
+        """Pide usuario y contraseña y espera hasta que se inicie sesión o se cierre la ventana"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Iniciar Sesión")
+        ventana.geometry("350x180")
+        ventana.resizable(False, False)
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        ttk.Label(frame_principal, text="Usuario:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        entry_usuario = ttk.Entry(frame_principal)
+        entry_usuario.grid(row=0, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Contraseña:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        entry_contrasena = ttk.Entry(frame_principal, show="*")
+        entry_contrasena.grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        
+        lbl_estado = ttk.Label(frame_principal, text="", foreground='red')
+        lbl_estado.grid(row=2, column=0, columnspan=2, pady=5)
+        
+        btn_entrar = ttk.Button(frame_principal, text="Entrar")
+        btn_entrar.grid(row=3, column=0, columnspan=2, pady=5)
+        frame_principal.columnconfigure(1, weight=1)
+        
+        entrar = lambda: self.validar_inicio_sesion(entry_usuario.get().strip(), entry_contrasena.get(),
+                                                    ventana, lbl_estado, btn_entrar)
+        btn_entrar.config(command=entrar)
+        ventana.bind("<Return>", lambda e: entrar())
+        entry_usuario.focus_set()
+        
+        # wait_window sigue atendiendo eventos, así que el hash se verifica sin congelar la ventana
+        self.root.wait_window(ventana)
+    
+    def validar_inicio_sesion(self, usuario, contrasena, ventana, lbl_estado, btn_entrar):
+        """Verifica la contraseña en un hilo de fondo y, si es correcta, guarda la sesión"""
+        if not usuario or str(btn_entrar['state']) == 'disabled':
+            return
+        
+        try:
+            fila = self.conn.execute("""SELECT id, nombre, rol, contrasena FROM usuarios
+                                        WHERE usuario = ? AND COALESCE(estado, 'Activo') = 'Activo'""",
+                                     (usuario,)).fetchone()
+            # Los permisos del rol se leen una sola vez y quedan en la sesión
+            permisos = db.leer_permisos(self.conn, fila[2]) if fila else frozenset()
+            id_administrador = db.id_administrador(self.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo iniciar sesión: {e}", parent=ventana)
+            return
+        
+        # Solo el administrador principal recién creado, que aún no tiene contraseña, entra con la contraseña
+        # vacía, y debe definir una antes de que se cree la sesión; los demás usuarios sin contraseña no entran
+        sin_contrasena = fila is not None and not fila[3] and fila[0] == id_administrador
+        
+        def verificar():
+            if sin_contrasena:
+                return contrasena == "", None
+            guardado = fila[3] if fila else None
+            valido = auth.verificar_contrasena(contrasena, guardado)
+            # Una contraseña que sigue en texto plano se reemplaza por su hash, también fuera del hilo de la interfaz
+            nuevo_hash = auth.generar_hash(contrasena) if valido and auth.necesita_hash_nuevo(guardado) else None
+            return valido, nuevo_hash
+        
+        def al_terminar(correcto, resultado):
+            if not ventana.winfo_exists():
+                return
+            btn_entrar.config(state='normal')
+            if not correcto:
+                lbl_estado.config(text=f"Error al verificar la contraseña: {resultado}")
+                return
+            valido, nuevo_hash = resultado
+            if not valido:
+                lbl_estado.config(text="Usuario o contraseña incorrectos")
+                return
+            if nuevo_hash:
+                try:
+                    self.conn.execute("UPDATE usuarios SET contrasena = ? WHERE id = ? AND contrasena = ?",
+                                      (nuevo_hash, fila[0], fila[3]))
+                    self.conn.commit()
+                except sqlite3.Error:
+                    # Se reintentará en el próximo inicio de sesión; la contraseña ya se verificó
+                    self.conn.rollback()
+            if sin_contrasena:
+                self.definir_contrasena_inicial(fila, usuario, permisos, ventana)
+                return
+            self.sesion = auth.Sesion(fila[0], usuario, fila[1], fila[2], permisos)
+            ventana.destroy()
+        
+        btn_entrar.config(state='disabled')
+        lbl_estado.config(text="Verificando...")
+        self.ejecutar_en_hilo(verificar, al_terminar)
+    
+    def definir_contrasena_inicial(self, fila, usuario, permisos, ventana):
+        """Pide al administrador principal su primera contraseña y, una vez guardada, crea la sesión"""
+        dialogo = tk.Toplevel(ventana)
+        dialogo.title("Definir Contraseña")
+        dialogo.geometry("400x210")
+        dialogo.resizable(False, False)
+        dialogo.transient(ventana)
+        dialogo.grab_set()
+        
+        frame_principal = ttk.Frame(dialogo, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        ttk.Label(frame_principal, text="Defina la contraseña del administrador para continuar").grid(
+            row=0, column=0, columnspan=2, pady=5)
+        
+        ttk.Label(frame_principal, text="Nueva contraseña:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        entry_nueva = ttk.Entry(frame_principal, show="*")
+        entry_nueva.grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Confirmar:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        entry_confirmar = ttk.Entry(frame_principal, show="*")
+        entry_confirmar.grid(row=2, column=1, padx=5, pady=5, sticky='we')
+        
+        lbl_estado = ttk.Label(frame_principal, text="", foreground='red')
+        lbl_estado.grid(row=3, column=0, columnspan=2, pady=5)
+        
+        btn_guardar = ttk.Button(frame_principal, text="Guardar")
+        btn_guardar.grid(row=4, column=0, columnspan=2, pady=5)
+        frame_principal.columnconfigure(1, weight=1)
+        
+        def guardar():
+            if str(btn_guardar['state']) == 'disabled':
+                return
+            nueva = entry_nueva.get()
+            if not nueva:
+                lbl_estado.config(text="La contraseña es obligatoria")
+                return
+            if nueva != entry_confirmar.get():
+                lbl_estado.config(text="Las contraseñas no coinciden")
+                return
+            
+            # El hash se calcula en un hilo de fondo y se guarda al terminar, en el hilo de la interfaz
+            def al_terminar(correcto, valor):
+                if not dialogo.winfo_exists():
+                    return
+                btn_guardar.config(state='normal')
+                if not correcto:
+                    lbl_estado.config(text=f"No se pudo guardar la contraseña: {valor}")
+                    return
+                try:
+                    # Solo si sigue sin contraseña: otra estación pudo definirla mientras tanto
+                    cursor = self.conn.execute("UPDATE usuarios SET contrasena = ? WHERE id = ? AND contrasena IS NULL",
+                                               (valor, fila[0]))
+                    if cursor.rowcount != 1:
+                        self.conn.rollback()
+                        messagebox.showwarning("Advertencia", "La contraseña ya fue definida; inicie sesión con ella",
+                                               parent=ventana)
+                        dialogo.destroy()
+                        return
+                    db.registrar_acceso(self.conn, "Definió la contraseña inicial", usuario_id=fila[0], commit=False)
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    lbl_estado.config(text=f"No se pudo guardar la contraseña: {e}")
+                    return
+                self.sesion = auth.Sesion(fila[0], usuario, fila[1], fila[2], permisos)
+                ventana.destroy()
+            
+            btn_guardar.config(state='disabled')
+            lbl_estado.config(text="Guardando...")
+            self.ejecutar_en_hilo(lambda: auth.generar_hash(nueva), al_terminar)
+        
+        btn_guardar.config(command=guardar)
+        dialogo.bind("<Return>", lambda e: guardar())
+        entry_nueva.focus_set()
+    
+    def verificar_permiso(self, permiso):
+        """Indica si el rol del usuario permite una acción; si no, avisa al usuario"""
+        if self.sesion.puede(permiso):
+            return True
+        messagebox.showerror("Acceso denegado",
+                             f"Su rol ({self.sesion.rol or 'sin rol'}) no permite {auth.PERMISOS[permiso]}")
+        return False
+    
+    def ocultar_sin_permiso(self, permiso, *widgets):
+        """Quita de la ventana los controles de una acción que el rol del usuario no permite"""
+        if self.sesion.puede(permiso):
+            return
+        for widget in widgets:
+            if widget.winfo_manager() == 'grid':
+                widget.grid_remove()
+            else:
+                widget.pack_forget()
     
     def configurar_estilos(self):
         """Configura los estilos visuales de la aplicación"""
@@ -73,9 +350,12 @@ class SistemaGestionLaboratorio:
         
         # Menú Archivo
         menu_archivo = tk.Menu(menubar, tearoff=0)
-        menu_archivo.add_command(label="Copia de seguridad", command=self.crear_respaldo)
-        menu_archivo.add_command(label="Restaurar", command=self.restaurar_respaldo)
-        menu_archivo.add_separator()
+        if self.sesion.puede("administrar_sistema"):
+            menu_archivo.add_command(label="Copia de seguridad", command=self.crear_respaldo)
+            menu_archivo.add_command(label="Restaurar", command=self.restaurar_respaldo)
+            menu_archivo.add_separator()
+            menu_archivo.add_command(label="Informes", command=self.gestionar_informes)
+            menu_archivo.add_separator()
         menu_archivo.add_command(label="Salir", command=self.cerrar_aplicacion)
         menubar.add_cascade(label="Archivo", menu=menu_archivo)
         
@@ -90,114 +370,20 @@ class SistemaGestionLaboratorio:
     def conexion_db(self):
         """Establece conexión con la base de datos SQLite"""
         try:
-            self.conn = sqlite3.connect('laboratorio.db')
+            if self.servidor:
+                # Modo cliente: el servicio central es el único que abre el archivo de la base de datos
+                from servicio_laboratorio import ConexionRemota, PUERTO_POR_DEFECTO, leer_clave
+                host, _, puerto = self.servidor.partition(":")
+                self.conn = ConexionRemota(host, int(puerto or PUERTO_POR_DEFECTO), leer_clave(self.archivo_clave))
+            else:
+                # Crea las tablas que falten, aplica las migraciones pendientes y activa la integridad referencial
+                self.conn = db.conectar()
             self.c = self.conn.cursor()
-            
-            # Crear tablas si no existen
-            self.crear_tablas()
-                    
-        except sqlite3.Error as e:
+        
+        except (sqlite3.Error, OSError, ValueError) as e:
             messagebox.showerror("Error de Base de Datos", f"No se pudo conectar a la base de datos: {e}")
             self.root.destroy()
     
-    def crear_tablas(self):
-        """Crea las tablas necesarias en la base de datos"""
-        tablas = [
-            """CREATE TABLE IF NOT EXISTS equipos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                tipo TEXT,
-                modelo TEXT,
-                serial TEXT UNIQUE,
-                estado TEXT,
-                ubicacion TEXT,
-                fecha_adquisicion TEXT,
-                ultimo_mantenimiento TEXT,
-                observaciones TEXT
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS inventario (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                componente TEXT NOT NULL,
-                tipo TEXT,
-                cantidad INTEGER,
-                minimo INTEGER,
-                proveedor TEXT,
-                ubicacion TEXT,
-                fecha_actualizacion TEXT,
-                observaciones TEXT
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS reportes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                equipo_id INTEGER,
-                tipo TEXT,
-                descripcion TEXT,
-                fecha TEXT,
-                estado TEXT,
-                solucion TEXT,
-                usuario TEXT,
-                prioridad TEXT,
-                FOREIGN KEY (equipo_id) REFERENCES equipos (id)
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS reservas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                equipo_id INTEGER,
-                usuario_id INTEGER,
-                fecha_inicio TEXT,
-                fecha_fin TEXT,
-                proposito TEXT,
-                estado TEXT,
-                fecha_solicitud TEXT,
-                FOREIGN KEY (equipo_id) REFERENCES equipos (id),
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS mantenimientos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                equipo_id INTEGER,
-                tipo TEXT,
-                fecha_programada TEXT,
-                fecha_realizado TEXT,
-                descripcion TEXT,
-                tecnico TEXT,
-                estado TEXT,
-                costo REAL,
-                observaciones TEXT,
-                FOREIGN KEY (equipo_id) REFERENCES equipos (id)
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                apellido TEXT,
-                email TEXT UNIQUE,
-                rol TEXT,
-                usuario TEXT UNIQUE,
-                contrasena TEXT,
-                fecha_registro TEXT,
-                estado TEXT
-            )""",
-            
-            """CREATE TABLE IF NOT EXISTS accesos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER,
-                fecha_hora TEXT,
-                accion TEXT,
-                detalles TEXT,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
-            )"""
-        ]
-        
-        for tabla in tablas:
-            try:
-                self.c.execute(tabla)
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"No se pudo crear tabla: {e}")
-        
-        self.conn.commit()
-    
     def cargar_datos_iniciales(self):
         """Carga datos iniciales en las tablas"""
         self.buscar_reportes()
@@ -231,12 +417,10 @@ class SistemaGestionLaboratorio:
         self.combo_prioridad_reporte.set("Todos")
         
         ttk.Label(frame_filtros, text="Fecha Desde:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-        self.entry_fecha_desde = ttk.Entry(frame_filtros)
-        self.entry_fecha_desde.grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        self.entry_fecha_desde = self.crear_campo_fecha(frame_filtros, row=1, column=1)
         
         ttk.Label(frame_filtros, text="Fecha Hasta:").grid(row=1, column=2, padx=5, pady=5, sticky='e')
-        self.entry_fecha_hasta = ttk.Entry(frame_filtros)
-        self.entry_fecha_hasta.grid(row=1, column=3, padx=5, pady=5, sticky='we')
+        self.entry_fecha_hasta = self.crear_campo_fecha(frame_filtros, row=1, column=3)
         
         btn_buscar = ttk.Button(frame_filtros, text="Buscar", command=self.buscar_reportes)
         btn_buscar.grid(row=1, column=4, padx=5, pady=5)
@@ -244,16 +428,21 @@ class SistemaGestionLaboratorio:
         btn_limpiar = ttk.Button(frame_filtros, text="Limpiar", command=self.limpiar_filtros_reportes)
         btn_limpiar.grid(row=1, column=5, padx=5, pady=5)
         
+        self.var_archivados_reportes = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_filtros, text="Incluir archivados", variable=self.var_archivados_reportes,
+                        command=self.buscar_reportes).grid(row=0, column=6, padx=5, pady=5, sticky='w')
+        
         # Frame para la tabla de reportes
         frame_tabla = ttk.Frame(self.frame_reportes)
         frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
         
         # Tabla de reportes
         columns = ("ID", "Equipo", "Tipo", "Descripción", "Fecha", "Estado", "Prioridad")
-        self.tree_reportes = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='browse')
+        self.tree_reportes = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='extended')
         
-        for col in columns:
-            self.tree_reportes.heading(col, text=col)
+        for posicion, col in enumerate(columns):
+            self.tree_reportes.heading(col, text=col,
+                                       command=lambda p=posicion: self.ordenar_tabla(self.tree_reportes, p))
             self.tree_reportes.column(col, width=100, anchor='center')
         
         self.tree_reportes.column("Descripción", width=250)
@@ -262,7 +451,7 @@ class SistemaGestionLaboratorio:
         # Scrollbar
         scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=self.tree_reportes.yview)
         scrollbar.pack(side='right', fill='y')
-        self.tree_reportes.configure(yscrollcommand=scrollbar.set)
+        self.configurar_desplazamiento(self.tree_reportes, scrollbar)
         
         # Frame inferior para acciones
         frame_acciones = ttk.Frame(self.frame_reportes)
@@ -279,6 +468,24 @@ class SistemaGestionLaboratorio:
         
         btn_imprimir = ttk.Button(frame_acciones, text="Imprimir", command=self.imprimir_reporte)
         btn_imprimir.pack(side='left', padx=5)
+        
+        btn_pdf = ttk.Button(frame_acciones, text="Exportar PDF", command=lambda: self.imprimir_reporte("pdf"))
+        btn_pdf.pack(side='left', padx=5)
+        
+        # Acciones sobre varios reportes seleccionados
+        btn_estado_lote = ttk.Button(frame_acciones, text="Cambiar Estado", command=self.cambiar_estado_reportes_lote)
+        btn_estado_lote.pack(side='left', padx=5)
+        
+        btn_resolver_lote = ttk.Button(frame_acciones, text="Resolver Seleccionados", command=self.resolver_reportes_lote)
+        btn_resolver_lote.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("gestionar_reportes", btn_estado_lote, btn_resolver_lote)
+    
+        btn_sla = ttk.Button(frame_acciones, text="Tiempos de Resolución", command=self.mostrar_indicadores_sla)
+        btn_sla.pack(side='right', padx=5)
+        
+        # Cantidad de reportes encontrados y memoria que ocupan
+        self.lbl_filas_reportes = ttk.Label(frame_acciones, text="")
+        self.lbl_filas_reportes.pack(side='right', padx=10)
     
     def limpiar_filtros_reportes(self):
         """Limpia los filtros de búsqueda de reportes"""
@@ -287,69 +494,97 @@ class SistemaGestionLaboratorio:
         self.combo_prioridad_reporte.set("Todos")
         self.entry_fecha_desde.delete(0, 'end')
         self.entry_fecha_hasta.delete(0, 'end')
+        self.var_archivados_reportes.set(False)
         self.buscar_reportes()
     
     def buscar_reportes(self):
         """Busca reportes según los filtros aplicados"""
         try:
-            # Limpiar tabla
-            for item in self.tree_reportes.get_children():
-                self.tree_reportes.delete(item)
-            
-            # Construir consulta SQL
-            query = """SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado, r.prioridad 
-                       FROM reportes r LEFT JOIN equipos e ON r.equipo_id = e.id 
-                       WHERE 1=1"""
+            # Construir consulta SQL (la vista reportes_todos incluye los archivados) y, en paralelo,
+            # las mismas condiciones para filtrar en memoria el resultado anterior
+            if self.var_archivados_reportes.get():
+                query = """SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado, r.prioridad, r.archivado, r.fecha_ts 
+                           FROM reportes_todos r LEFT JOIN equipos e ON r.equipo_id = e.id 
+                           WHERE 1=1"""
+                condiciones = []
+            else:
+                query = """SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado, r.prioridad, 0, r.fecha_ts 
+                           FROM reportes r LEFT JOIN equipos e ON r.equipo_id = e.id 
+                           WHERE 1=1"""
+                condiciones = [("archivado", "=", 0)]
             params = []
             
             tipo = self.combo_tipo_reporte.get()
             if tipo != "Todos":
                 query += " AND r.tipo = ?"
                 params.append(tipo)
+                condiciones.append(("tipo", "=", tipo))
                 
             estado = self.combo_estado_reporte.get()
             if estado != "Todos":
                 query += " AND r.estado = ?"
                 params.append(estado)
+                condiciones.append(("estado", "=", estado))
                 
             prioridad = self.combo_prioridad_reporte.get()
             if prioridad != "Todos":
                 query += " AND r.prioridad = ?"
                 params.append(prioridad)
+                condiciones.append(("prioridad", "=", prioridad))
                 
-            fecha_desde = self.entry_fecha_desde.get()
+            # Los rangos de fecha se filtran sobre la columna normalizada e indexada fecha_ts
+            fecha_desde = self.entry_fecha_desde.get().strip()
             if fecha_desde:
-                query += " AND r.fecha >= ?"
-                params.append(fecha_desde)
+                if a_timestamp(fecha_desde) is None:
+                    messagebox.showwarning("Advertencia", "La fecha desde no es válida (use AAAA-MM-DD)")
+                    return
+                query += " AND r.fecha_ts >= ?"
+                params.append(a_timestamp(fecha_desde))
+                condiciones.append(("fecha_ts", ">=", a_timestamp(fecha_desde)))
                 
-            fecha_hasta = self.entry_fecha_hasta.get()
+            fecha_hasta = self.entry_fecha_hasta.get().strip()
             if fecha_hasta:
-                query += " AND r.fecha <= ?"
-                params.append(fecha_hasta)
-            
-            query += " ORDER BY r.fecha DESC"
-            
-            # Ejecutar consulta
-            self.c.execute(query, params)
-            reportes = self.c.fetchall()
-            
-            # Llenar tabla
-            for reporte in reportes:
-                self.tree_reportes.insert('', 'end', values=reporte)
-                
-            # Resaltar reportes según prioridad
-            for item in self.tree_reportes.get_children():
-                valores = self.tree_reportes.item(item, 'values')
-                if valores[6] == "Alta":
-                    self.tree_reportes.tag_configure('alta', foreground='red')
-                    self.tree_reportes.item(item, tags=('alta',))
-                elif valores[6] == "Media":
-                    self.tree_reportes.tag_configure('media', foreground='orange')
-                    self.tree_reportes.item(item, tags=('media',))
+                if timestamp_hasta(fecha_hasta) is None:
+                    messagebox.showwarning("Advertencia", "La fecha hasta no es válida (use AAAA-MM-DD)")
+                    return
+                query += " AND r.fecha_ts < ?"
+                params.append(timestamp_hasta(fecha_hasta))
+                condiciones.append(("fecha_ts", "<", timestamp_hasta(fecha_hasta)))
+            
+            query += " ORDER BY r.fecha_ts DESC"
+            
+            # La consulta solo se ejecuta si el filtro es más amplio que el anterior o cambiaron los datos
+            clave = (db.leer_version_datos(self.conn, "reportes"), db.leer_version_datos(self.conn, "equipos"))
+            reportes, indices = self.filtros_reportes.obtener(
+                clave, condiciones,
+                lambda: self.consultar_tabla_columnar(
+                    query, params,
+                    ["id", "equipo", "tipo", "descripcion", "fecha", "estado", "prioridad", "archivado", "fecha_ts"],
+                    ["equipo", "tipo", "estado", "prioridad"]))
+            
+            # Llenar tabla resaltando los reportes según prioridad y los archivados
+            self.tree_reportes.tag_configure('alta', foreground='red')
+            self.tree_reportes.tag_configure('media', foreground='orange')
+            self.tree_reportes.tag_configure('archivado', background='#eeeeee')
+            self.mostrar_filas_columnares(self.tree_reportes, reportes, self.etiquetas_reporte, visibles=7,
+                                          indices=indices)
+            self.lbl_filas_reportes.config(
+                text=f"{len(indices)} reportes ({reportes.memoria() / (1024 * 1024):.1f} MB)")
                 
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"Error al buscar reportes: {e}")
     
+    def etiquetas_reporte(self, reporte):
+        """Devuelve las etiquetas de una fila de reportes según su prioridad y si está archivado"""
+        etiquetas = []
+        if reporte[6] == "Alta":
+            etiquetas.append('alta')
+        elif reporte[6] == "Media":
+            etiquetas.append('media')
+        if reporte[7]:
+            etiquetas.append('archivado')
+        return etiquetas
+    
     def abrir_nuevo_reporte(self):
         """Abre ventana para crear nuevo reporte"""
         ventana = tk.Toplevel(self.root)
@@ -369,13 +604,11 @@ class SistemaGestionLaboratorio:
         
         # Equipo
         ttk.Label(frame_form, text="Equipo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        combo_equipo = ttk.Combobox(frame_form, textvariable=self.var_equipo, state='readonly')
+        combo_equipo = ttk.Combobox(frame_form, textvariable=self.var_equipo)
         combo_equipo.grid(row=0, column=1, padx=5, pady=5, sticky='we')
         
         # Cargar equipos disponibles
-        self.c.execute("SELECT id, nombre FROM equipos ORDER BY nombre")
-        equipos = self.c.fetchall()
-        combo_equipo['values'] = [f"{e[1]} (ID: {e[0]})" for e in equipos]
+        self.configurar_combo_ids(combo_equipo, self.obtener_lista("equipos"))
         
         # Tipo de reporte
         ttk.Label(frame_form, text="Tipo de Reporte:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
@@ -404,7 +637,7 @@ class SistemaGestionLaboratorio:
         frame_botones.pack(fill='x', padx=10, pady=5)
         
         btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_reporte(
-            self.var_equipo.get().split("(ID: ")[1].rstrip(")") if self.var_equipo.get() else None,
+            self.id_seleccionado(combo_equipo),
             self.var_tipo.get(),
             text_desc.get("1.0", "end").strip(),
             self.var_prioridad.get(),
@@ -423,7 +656,7 @@ class SistemaGestionLaboratorio:
             
         try:
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            usuario = "admin"  # En una aplicación real, obtendríamos el usuario actual
+            usuario = self.sesion.usuario
             
             self.c.execute("""INSERT INTO reportes 
                               (equipo_id, tipo, descripcion, fecha, estado, usuario, prioridad) 
@@ -451,8 +684,8 @@ class SistemaGestionLaboratorio:
         
         try:
             self.c.execute("""SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado, 
-                              r.solucion, r.usuario, r.prioridad 
-                              FROM reportes r LEFT JOIN equipos e ON r.equipo_id = e.id 
+                              r.solucion, r.usuario, r.prioridad, r.fecha_resuelto_ts - r.fecha_ts 
+                              FROM reportes_todos r LEFT JOIN equipos e ON r.equipo_id = e.id 
                               WHERE r.id = ?""", (reporte_id,))
             reporte = self.c.fetchone()
             
@@ -481,7 +714,10 @@ class SistemaGestionLaboratorio:
             ttk.Label(frame_principal, text=reporte[4]).grid(row=4, column=1, sticky='w', pady=2)
             
             ttk.Label(frame_principal, text="Estado:").grid(row=5, column=0, sticky='w', pady=2)
-            ttk.Label(frame_principal, text=reporte[5], 
+            estado_texto = reporte[5]
+            if reporte[9] is not None:
+                estado_texto += f" (resuelto en {reporte[9] / 3600:.1f} h)"
+            ttk.Label(frame_principal, text=estado_texto, 
                      foreground='green' if reporte[5] == "Resuelto" else 'blue' if reporte[5] == "En Progreso" else 'black').grid(row=5, column=1, sticky='w', pady=2)
             
             ttk.Label(frame_principal, text="Reportado por:").grid(row=6, column=0, sticky='w', pady=2)
@@ -522,12 +758,15 @@ class SistemaGestionLaboratorio:
                 btn_resolver = ttk.Button(frame_botones, text="Resolver", 
                                         command=lambda: self.resolver_reporte(reporte_id, ventana))
                 btn_resolver.pack(side='left', padx=5)
+                self.ocultar_sin_permiso("gestionar_reportes", btn_en_progreso, btn_resolver)
             
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar el detalle: {e}")
     
     def cambiar_estado_reporte(self, reporte_id, estado, ventana):
         """Cambia el estado de un reporte"""
+        if not self.verificar_permiso("gestionar_reportes"):
+            return
         try:
             self.c.execute("UPDATE reportes SET estado = ? WHERE id = ?", (estado, reporte_id))
             self.conn.commit()
@@ -543,6 +782,8 @@ class SistemaGestionLaboratorio:
     
     def resolver_reporte(self, reporte_id, ventana):
         """Abre ventana para registrar solución a un reporte"""
+        if not self.verificar_permiso("gestionar_reportes"):
+            return
         ventana_sol = tk.Toplevel(self.root)
         ventana_sol.title("Registrar Solución")
         ventana_sol.geometry("500x300")
@@ -575,6 +816,8 @@ class SistemaGestionLaboratorio:
     
     def guardar_solucion(self, reporte_id, solucion, ventana_sol, ventana_detalle):
         """Guarda la solución y marca el reporte como resuelto"""
+        if not self.verificar_permiso("gestionar_reportes"):
+            return
         if not solucion:
             messagebox.showwarning("Advertencia", "La solución es obligatoria")
             return
@@ -594,12 +837,215 @@ class SistemaGestionLaboratorio:
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo guardar la solución: {e}")
     
+    def cambiar_estado_reportes_lote(self):
+        """Cambia el estado de todos los reportes seleccionados"""
+        if not self.verificar_permiso("gestionar_reportes"):
+            return
+        # Los reportes archivados ya están cerrados y no se modifican
+        items = [item for item in self.tree_reportes.selection()
+                 if 'archivado' not in self.tree_reportes.item(item, 'tags')]
+        if not items:
+            messagebox.showwarning("Advertencia", "Seleccione uno o más reportes no archivados")
+            return
+        
+        self.pedir_valor_lote("Cambiar Estado", f"Nuevo estado para {len(items)} reporte(s):",
+                              ["Abierto", "En Progreso"],
+                              lambda estado: self.aplicar_estado_reportes_lote(items, estado))
+    
+    def aplicar_estado_reportes_lote(self, items, estado):
+        """Actualiza el estado de varios reportes en una sola transacción"""
+        ids = [self.tree_reportes.item(item, 'values')[0] for item in items]
+        
+        try:
+            self.c.executemany("UPDATE reportes SET estado = ? WHERE id = ?", [(estado, i) for i in ids])
+            self.registrar_acceso(f"Cambió estado de {len(ids)} reportes a {estado}",
+                                  f"Reportes: {', '.join(ids)}", commit=False)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudo cambiar el estado: {e}")
+            return
+        
+        self.actualizar_filas(self.tree_reportes, items, 5, estado, self.combo_estado_reporte.get())
+    
+    def resolver_reportes_lote(self):
+        """Abre ventana para registrar una misma solución en varios reportes"""
+        if not self.verificar_permiso("gestionar_reportes"):
+            return
+        # Los reportes archivados ya están cerrados y no se modifican
+        items = [item for item in self.tree_reportes.selection()
+                 if 'archivado' not in self.tree_reportes.item(item, 'tags')]
+        if not items:
+            messagebox.showwarning("Advertencia", "Seleccione uno o más reportes no archivados")
+            return
+        
+        ventana_sol = tk.Toplevel(self.root)
+        ventana_sol.title(f"Resolver {len(items)} Reporte(s)")
+        ventana_sol.geometry("500x300")
+        ventana_sol.grab_set()
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana_sol, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        ttk.Label(frame_principal, text="Solución aplicada:").pack(anchor='w', pady=5)
+        text_sol = tk.Text(frame_principal, height=10, width=50, wrap='word')
+        text_sol.pack(fill='both', expand=True, pady=5)
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana_sol)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        btn_guardar = ttk.Button(frame_botones, text="Guardar",
+                                command=lambda: self.guardar_solucion_lote(items, text_sol.get("1.0", "end").strip(),
+                                                                         ventana_sol))
+        btn_guardar.pack(side='left', padx=5)
+        
+        btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana_sol.destroy)
+        btn_cancelar.pack(side='left', padx=5)
+    
+    def guardar_solucion_lote(self, items, solucion, ventana_sol):
+        """Guarda la solución en todos los reportes seleccionados y los marca como resueltos"""
+        if not solucion:
+            messagebox.showwarning("Advertencia", "La solución es obligatoria")
+            return
+        
+        ids = [self.tree_reportes.item(item, 'values')[0] for item in items]
+        
+        try:
+            self.c.executemany("UPDATE reportes SET solucion = ?, estado = 'Resuelto' WHERE id = ?",
+                              [(solucion, i) for i in ids])
+            self.registrar_acceso(f"Resolvió {len(ids)} reportes", f"Reportes: {', '.join(ids)}", commit=False)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudo guardar la solución: {e}")
+            return
+        
+        ventana_sol.destroy()
+        self.actualizar_filas(self.tree_reportes, items, 5, "Resuelto", self.combo_estado_reporte.get())
+        messagebox.showinfo("Éxito", f"{len(ids)} reporte(s) marcados como resueltos")
+    
+    def mostrar_indicadores_sla(self):
+        """Muestra los tiempos de resolución y el cumplimiento de objetivos por prioridad, tipo y equipo"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Tiempos de Resolución de Reportes")
+        ventana.geometry("900x650")
+        
+        # Resumen general
+        lbl_resumen = ttk.Label(ventana, text="", font=('Arial', 11, 'bold'))
+        lbl_resumen.pack(anchor='w', padx=10, pady=5)
+        
+        # Una pestaña por dimensión de los agregados
+        notebook = ttk.Notebook(ventana)
+        notebook.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        tablas = {}
+        for dimension, titulo in [("prioridad", "Por Prioridad"), ("tipo", "Por Tipo"), ("equipo", "Por Equipo")]:
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=titulo)
+            columns = ("Valor", "Resueltos", "Horas Promedio", "% Dentro del Objetivo")
+            tree = ttk.Treeview(frame, columns=columns, show='headings', height=8)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=150, anchor='center')
+            tree.pack(side='left', fill='both', expand=True)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            scrollbar.pack(side='right', fill='y')
+            tree.configure(yscrollcommand=scrollbar.set)
+            tablas[dimension] = tree
+        
+        frame_grafico = ttk.Frame(ventana)
+        frame_grafico.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Objetivos por prioridad, guardados en la configuración
+        frame_objetivos = ttk.LabelFrame(ventana, text="Objetivos de Resolución (horas)", padding=5)
+        frame_objetivos.pack(fill='x', padx=10, pady=5)
+        
+        vars_objetivos = {}
+        for i, (prioridad, horas) in enumerate(db.SLA_HORAS_POR_DEFECTO.items()):
+            ttk.Label(frame_objetivos, text=f"{prioridad}:").grid(row=0, column=i * 2, padx=5, pady=2, sticky='e')
+            var = tk.StringVar(value=self.leer_configuracion(f"sla_horas_{prioridad}", horas))
+            ttk.Spinbox(frame_objetivos, textvariable=var, from_=1, to=2000, width=8).grid(row=0, column=i * 2 + 1, padx=5, pady=2)
+            vars_objetivos[prioridad] = var
+        
+        ttk.Button(frame_objetivos, text="Guardar y Recalcular",
+                   command=lambda: self.guardar_objetivos_sla(vars_objetivos, cargar)).grid(row=0, column=6, padx=10, pady=2)
+        self.ocultar_sin_permiso("administrar_sistema", frame_objetivos)
+        
+        def cargar():
+            try:
+                resumen = {dimension: db.resumen_sla(self.conn, dimension) for dimension in ["total"] + list(tablas)}
+                nombres_equipos = {str(equipo_id): nombre for equipo_id, nombre in self.obtener_lista("equipos")}
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"No se pudieron cargar los tiempos de resolución: {e}")
+                return
+            
+            if resumen["total"]:
+                _, resueltos, horas, porcentaje = resumen["total"][0]
+                lbl_resumen.config(text=f"Reportes resueltos: {resueltos}   Promedio: {horas} h   "
+                                        f"Dentro del objetivo: {porcentaje}%")
+            else:
+                lbl_resumen.config(text="Aún no hay reportes resueltos con fechas de resolución")
+            
+            for dimension, tree in tablas.items():
+                for item in tree.get_children():
+                    tree.delete(item)
+                for valor, resueltos, horas, porcentaje in resumen[dimension]:
+                    if dimension == "equipo":
+                        valor = nombres_equipos.get(valor, f"ID {valor}" if valor else "(sin equipo)")
+                    tree.insert('', 'end', values=(valor or "(sin valor)", resueltos, horas, f"{porcentaje}%"))
+            
+            # Gráfico de promedio por prioridad frente a su objetivo
+            for widget in frame_grafico.winfo_children():
+                widget.destroy()
+            por_prioridad = {valor: horas for valor, _, horas, _ in resumen["prioridad"]}
+            prioridades = list(db.SLA_HORAS_POR_DEFECTO)
+            fig, ax = plt.subplots(figsize=(8, 2.5))
+            ax.bar(prioridades, [por_prioridad.get(p, 0) for p in prioridades], color=['#F44336', '#FFC107', '#4CAF50'],
+                   label='Promedio')
+            ax.scatter(prioridades, [float(vars_objetivos[p].get() or 0) for p in prioridades], color='black',
+                       marker='_', s=800, label='Objetivo')
+            ax.set_ylabel('Horas')
+            ax.set_title('Tiempo promedio de resolución por prioridad')
+            ax.legend()
+            fig.tight_layout()
+            canvas = FigureCanvasTkAgg(fig, master=frame_grafico)
+            canvas.draw()
+            canvas.get_tk_widget().pack(fill='both', expand=True)
+            plt.close(fig)
+        
+        cargar()
+    
+    def guardar_objetivos_sla(self, vars_objetivos, al_terminar):
+        """Guarda los objetivos de resolución y reconstruye los agregados con ellos"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
+        try:
+            objetivos = {prioridad: int(var.get()) for prioridad, var in vars_objetivos.items()}
+        except ValueError:
+            messagebox.showwarning("Advertencia", "Los objetivos deben ser números enteros de horas")
+            return
+        if any(horas < 1 for horas in objetivos.values()):
+            messagebox.showwarning("Advertencia", "Los objetivos deben ser de al menos una hora")
+            return
+        
+        try:
+            for prioridad, horas in objetivos.items():
+                self.guardar_valor_configuracion(f"sla_horas_{prioridad}", horas)
+            db.recalcular_tiempos_resolucion(self.conn)
+            self.registrar_acceso("Cambió objetivos de resolución de reportes",
+                                  ", ".join(f"{p}: {h} h" for p, h in objetivos.items()))
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron guardar los objetivos: {e}")
+            return
+        al_terminar()
+    
     def exportar_reportes(self):
         """Exporta los reportes a un archivo Excel"""
         try:
-            # Obtener todos los reportes visibles
-            items = self.tree_reportes.get_children()
-            data = [self.tree_reportes.item(item, 'values') for item in items]
+            # Obtener todos los reportes encontrados, también los que aún no se mostraron en la tabla
+            data = self.filas_tabla(self.tree_reportes)
             
             if not data:
                 messagebox.showwarning("Advertencia", "No hay datos para exportar")
@@ -625,77 +1071,44 @@ class SistemaGestionLaboratorio:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar: {e}")
     
-    def imprimir_reporte(self):
-        """Prepara la impresión de un reporte"""
+    def imprimir_reporte(self, formato="html"):
+        """Prepara la impresión de los reportes seleccionados en un solo documento"""
         seleccion = self.tree_reportes.selection()
-        if not seleccion:
-            messagebox.showwarning("Advertencia", "Seleccione un reporte para imprimir")
-            return
-            
-        reporte_id = self.tree_reportes.item(seleccion[0], 'values')[0]
+        if seleccion:
+            reporte_ids = [self.tree_reportes.item(item, 'values')[0] for item in seleccion]
+        else:
+            reporte_ids = [fila[0] for fila in self.filas_tabla(self.tree_reportes)]
+            if not reporte_ids:
+                messagebox.showwarning("Advertencia", "No hay reportes para imprimir")
+                return
+            if not messagebox.askyesno("Confirmar", f"No hay reportes seleccionados. ¿Imprimir los {len(reporte_ids)} reportes de la lista?"):
+                return
         
         try:
-            self.c.execute("""SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado, 
-                              r.solucion, r.usuario, r.prioridad 
-                              FROM reportes r LEFT JOIN equipos e ON r.equipo_id = e.id 
-                              WHERE r.id = ?""", (reporte_id,))
-            reporte = self.c.fetchone()
-            
-            # Crear contenido HTML para imprimir
-            html = f"""
-            <html>
-            <head>
-                <title>Reporte #{reporte[0]}</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                    h1 {{ color: #333; border-bottom: 1px solid #333; }}
-                    .info {{ margin-bottom: 15px; }}
-                    .label {{ font-weight: bold; }}
-                    .desc {{ border: 1px solid #ddd; padding: 10px; margin: 10px 0; }}
-                    .sol {{ border: 1px solid #ddd; padding: 10px; margin: 10px 0; }}
-                </style>
-            </head>
-            <body>
-                <h1>Reporte #{reporte[0]}</h1>
-                
-                <div class="info">
-                    <span class="label">Equipo:</span> {reporte[1]}<br>
-                    <span class="label">Tipo:</span> {reporte[2]}<br>
-                    <span class="label">Prioridad:</span> {reporte[8]}<br>
-                    <span class="label">Fecha:</span> {reporte[4]}<br>
-                    <span class="label">Estado:</span> {reporte[5]}<br>
-                    <span class="label">Reportado por:</span> {reporte[7]}<br>
-                </div>
-                
-                <div class="info">
-                    <span class="label">Descripción:</span>
-                    <div class="desc">{reporte[3]}</div>
-                </div>
-            """
-            
-            if reporte[6]:
-                html += f"""
-                <div class="info">
-                    <span class="label">Solución:</span>
-                    <div class="sol">{reporte[6]}</div>
-                </div>
-                """
-            
-            html += """
-            </body>
-            </html>
-            """
-            
-            # Guardar temporalmente el HTML
-            temp_file = "temp_reporte.html"
-            with open(temp_file, "w", encoding="utf-8") as f:
-                f.write(html)
-            
-            # Abrir en navegador para imprimir
-            webbrowser.open(temp_file)
-            
+            # La consulta se hace aquí porque la conexión pertenece al hilo de la interfaz
+            reportes = impresion.leer_reportes(self.conn, reporte_ids)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo preparar el reporte para impresión: {e}")
+            return
+        
+        # El documento se genera en un hilo de fondo para no bloquear la ventana con muchos reportes
+        def generar():
+            if formato == "pdf":
+                return impresion.escribir_pdf(reportes)
+            return impresion.escribir_html(reportes, titulo=f"Reportes ({len(reportes)})")
+        
+        def al_terminar(correcto, valor):
+            self.root.config(cursor="")
+            if not correcto:
+                messagebox.showerror("Error", f"No se pudo preparar el reporte para impresión: {valor}")
+                return
+            # Abrir en navegador (o visor de PDF) para imprimir
+            webbrowser.open(Path(valor).as_uri())
+            if formato == "pdf":
+                messagebox.showinfo("Éxito", f"PDF generado en {valor}")
+        
+        self.root.config(cursor="watch")
+        self.ejecutar_en_hilo(generar, al_terminar)
     
     # ------------------------- Pestaña de Inventario -------------------------
     def inicializar_inventario(self):
@@ -720,6 +1133,24 @@ class SistemaGestionLaboratorio:
         btn_exportar = ttk.Button(frame_controles, text="Exportar", command=self.exportar_inventario)
         btn_exportar.pack(side='left', padx=5)
         
+        btn_sugerencias = ttk.Button(frame_controles, text="Sugerencias de Pedido", command=self.mostrar_sugerencias_reposicion)
+        btn_sugerencias.pack(side='left', padx=5)
+        
+        btn_movimiento = ttk.Button(frame_controles, text="Registrar Movimiento", command=self.registrar_movimiento_inventario)
+        btn_movimiento.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("gestionar_inventario", btn_agregar, btn_editar, btn_movimiento)
+        self.ocultar_sin_permiso("eliminar_inventario", btn_eliminar)
+        
+        btn_historial = ttk.Button(frame_controles, text="Historial", command=self.historial_componente)
+        btn_historial.pack(side='left', padx=5)
+        
+        btn_consumo = ttk.Button(frame_controles, text="Consumo", command=self.mostrar_pronostico_consumo)
+        btn_consumo.pack(side='left', padx=5)
+        
+        # Resumen de componentes bajo el mínimo
+        self.lbl_bajo_minimo = ttk.Label(frame_controles, text="")
+        self.lbl_bajo_minimo.pack(side='right', padx=5)
+        
         # Frame para filtros
         frame_filtros = ttk.LabelFrame(self.frame_inventario, text="Filtros", padding=5)
         frame_filtros.pack(fill='x', padx=10, pady=5)
@@ -736,6 +1167,12 @@ class SistemaGestionLaboratorio:
         self.combo_ubicacion_inventario.set("Todos")
         self.combo_ubicacion_inventario.bind("<<ComboboxSelected>>", lambda e: self.actualizar_inventario())
         
+        ttk.Label(frame_filtros, text="Stock:").grid(row=0, column=4, padx=5, pady=2, sticky='e')
+        self.combo_stock_inventario = ttk.Combobox(frame_filtros, values=["Todos", "Bajo mínimo"], state='readonly')
+        self.combo_stock_inventario.grid(row=0, column=5, padx=5, pady=2, sticky='we')
+        self.combo_stock_inventario.set("Todos")
+        self.combo_stock_inventario.bind("<<ComboboxSelected>>", lambda e: self.actualizar_inventario())
+        
         # Cargar ubicaciones disponibles
         self.cargar_ubicaciones_inventario()
         
@@ -745,10 +1182,11 @@ class SistemaGestionLaboratorio:
         
         # Tabla de inventario
         columns = ("ID", "Componente", "Tipo", "Cantidad", "Mínimo", "Proveedor", "Ubicación", "Últ. Actualización")
-        self.tree_inventario = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='browse')
+        self.tree_inventario = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='extended')
         
-        for col in columns:
-            self.tree_inventario.heading(col, text=col)
+        for posicion, col in enumerate(columns):
+            self.tree_inventario.heading(col, text=col,
+                                         command=lambda p=posicion: self.ordenar_tabla(self.tree_inventario, p))
             self.tree_inventario.column(col, width=100, anchor='center')
         
         self.tree_inventario.column("Componente", width=150)
@@ -759,7 +1197,7 @@ class SistemaGestionLaboratorio:
         # Scrollbar
         scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=self.tree_inventario.yview)
         scrollbar.pack(side='right', fill='y')
-        self.tree_inventario.configure(yscrollcommand=scrollbar.set)
+        self.configurar_desplazamiento(self.tree_inventario, scrollbar)
         
         # Frame para gráficos
         frame_graficos = ttk.LabelFrame(self.frame_inventario, text="Estadísticas de Inventario", padding=10)
@@ -771,8 +1209,7 @@ class SistemaGestionLaboratorio:
     def cargar_ubicaciones_inventario(self):
         """Carga las ubicaciones disponibles para filtrar"""
         try:
-            self.c.execute("SELECT DISTINCT ubicacion FROM inventario WHERE ubicacion IS NOT NULL AND ubicacion != '' ORDER BY ubicacion")
-            ubicaciones = ["Todos"] + [u[0] for u in self.c.fetchall()]
+            ubicaciones = ["Todos"] + [u[0] for u in self.obtener_lista("ubicaciones_inventario")]
             self.combo_ubicacion_inventario['values'] = ubicaciones
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudieron cargar las ubicaciones: {e}")
@@ -780,46 +1217,60 @@ class SistemaGestionLaboratorio:
     def actualizar_inventario(self):
         """Actualiza la tabla de inventario con los datos de la base de datos"""
         try:
-            # Limpiar tabla
-            for item in self.tree_inventario.get_children():
-                self.tree_inventario.delete(item)
-            
-            # Construir consulta con filtros
+            # Construir consulta con filtros y las mismas condiciones para filtrar en memoria
             query = "SELECT id, componente, tipo, cantidad, minimo, proveedor, ubicacion, fecha_actualizacion FROM inventario WHERE 1=1"
             params = []
+            condiciones = []
             
             tipo = self.combo_tipo_inventario.get()
             if tipo != "Todos":
                 query += " AND tipo = ?"
                 params.append(tipo)
+                condiciones.append(("tipo", "=", tipo))
                 
             ubicacion = self.combo_ubicacion_inventario.get()
             if ubicacion != "Todos":
                 query += " AND ubicacion = ?"
                 params.append(ubicacion)
+                condiciones.append(("ubicacion", "=", ubicacion))
             
-            query += " ORDER BY componente"
+            # Los componentes bajo el mínimo salen del índice parcial, sin recorrer el inventario
+            if self.combo_stock_inventario.get() == "Bajo mínimo":
+                query += " AND cantidad < minimo"
+                condiciones.append(("cantidad", "<columna", "minimo"))
             
-            # Obtener datos
-            self.c.execute(query, params)
-            componentes = self.c.fetchall()
+            query += " ORDER BY componente"
             
-            # Llenar tabla
-            for comp in componentes:
-                self.tree_inventario.insert('', 'end', values=comp)
-                
-            # Resaltar componentes bajo mínimo
-            for item in self.tree_inventario.get_children():
-                valores = self.tree_inventario.item(item, 'values')
-                if int(valores[3]) < int(valores[4]):
-                    self.tree_inventario.tag_configure('bajo', background='#ffcccc')
-                    self.tree_inventario.item(item, tags=('bajo',))
+            # Obtener datos; solo se consulta si el filtro es más amplio que el anterior o cambió el inventario
+            version = db.leer_version_datos(self.conn, "inventario")
+            consultado = self.filtros_inventario.clave != version
+            componentes, indices = self.filtros_inventario.obtener(
+                version, condiciones,
+                lambda: self.consultar_tabla_columnar(
+                    query, params,
+                    ["id", "componente", "tipo", "cantidad", "minimo", "proveedor", "ubicacion", "fecha_actualizacion"],
+                    ["tipo", "proveedor", "ubicacion"]))
+            
+            # Llenar tabla resaltando los componentes bajo mínimo
+            self.tree_inventario.tag_configure('bajo', background='#ffcccc')
+            self.mostrar_filas_columnares(
+                self.tree_inventario, componentes,
+                lambda comp: ('bajo',) if comp[3] is not None and comp[4] is not None and comp[3] < comp[4] else (),
+                indices=indices)
+            
+            # El total bajo el mínimo no depende de los filtros: solo cambia con el inventario
+            if consultado:
+                bajo_minimo = len(db.componentes_bajo_minimo(self.conn))
+                self.lbl_bajo_minimo.config(text=f"Bajo el mínimo: {bajo_minimo}",
+                                            foreground='red' if bajo_minimo else '')
                     
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar el inventario: {e}")
     
     def agregar_componente(self):
         """Abre ventana para agregar nuevo componente al inventario"""
+        if not self.verificar_permiso("gestionar_inventario"):
+            return
         ventana = tk.Toplevel(self.root)
         ventana.title("Agregar Componente")
         ventana.geometry("500x400")
@@ -896,6 +1347,9 @@ class SistemaGestionLaboratorio:
                                fecha_actualizacion, observaciones) 
                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
                           (componente, tipo, cantidad, minimo, proveedor, ubicacion, fecha_actual, observaciones))
+            
+            # La cantidad inicial abre el libro de movimientos del componente
+            db.registrar_saldo_inicial(self.conn, self.c.lastrowid, self.sesion.usuario_id, commit=False)
             self.conn.commit()
             
             # Registrar en el historial de accesos
@@ -905,6 +1359,7 @@ class SistemaGestionLaboratorio:
             ventana.destroy()
             self.cargar_ubicaciones_inventario()
             self.actualizar_inventario()
+            self.mostrar_alertas_stock()
         except ValueError:
             messagebox.showerror("Error", "Cantidad y mínimo deben ser números enteros")
         except sqlite3.Error as e:
@@ -912,6 +1367,8 @@ class SistemaGestionLaboratorio:
     
     def editar_componente(self):
         """Abre ventana para editar componente seleccionado"""
+        if not self.verificar_permiso("gestionar_inventario"):
+            return
         seleccion = self.tree_inventario.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un componente para editar")
@@ -1001,10 +1458,15 @@ class SistemaGestionLaboratorio:
             fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             self.c.execute("""UPDATE inventario SET 
-                              componente = ?, tipo = ?, cantidad = ?, minimo = ?, 
+                              componente = ?, tipo = ?, minimo = ?, 
                               proveedor = ?, ubicacion = ?, fecha_actualizacion = ?, observaciones = ? 
                               WHERE id = ?""",
-                          (componente, tipo, cantidad, minimo, proveedor, ubicacion, fecha_actual, observaciones, componente_id))
+                          (componente, tipo, minimo, proveedor, ubicacion, fecha_actual, observaciones, componente_id))
+            
+            # Un cambio de cantidad al editar queda en el libro como ajuste de recuento
+            db.registrar_movimiento(self.conn, componente_id, "Ajuste", cantidad,
+                                    observaciones="Edición del componente", usuario_id=self.sesion.usuario_id,
+                                    commit=False)
             self.conn.commit()
             
             # Registrar en el historial de accesos
@@ -1014,88 +1476,343 @@ class SistemaGestionLaboratorio:
             ventana.destroy()
             self.cargar_ubicaciones_inventario()
             self.actualizar_inventario()
+            self.mostrar_alertas_stock()
         except ValueError:
+            self.conn.rollback()
             messagebox.showerror("Error", "Cantidad y mínimo deben ser números enteros")
         except sqlite3.Error as e:
+            self.conn.rollback()
             messagebox.showerror("Error", f"No se pudo actualizar el componente: {e}")
     
     def eliminar_componente(self):
-        """Elimina el componente seleccionado"""
+        """Elimina los componentes seleccionados"""
+        if not self.verificar_permiso("eliminar_inventario"):
+            return
         seleccion = self.tree_inventario.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un componente para eliminar")
             return
-            
-        componente_id = self.tree_inventario.item(seleccion[0], 'values')[0]
-        componente_nombre = self.tree_inventario.item(seleccion[0], 'values')[1]
         
-        if messagebox.askyesno("Confirmar", f"¿Eliminar el componente '{componente_nombre}'?"):
+        ids = [self.tree_inventario.item(item, 'values')[0] for item in seleccion]
+        nombres = [self.tree_inventario.item(item, 'values')[1] for item in seleccion]
+        
+        if len(ids) == 1:
+            mensaje = f"¿Eliminar el componente '{nombres[0]}'?"
+        else:
+            mensaje = f"¿Eliminar los {len(ids)} componentes seleccionados?"
+        
+        if messagebox.askyesno("Confirmar", mensaje):
             try:
-                self.c.execute("DELETE FROM inventario WHERE id = ?", (componente_id,))
-                self.conn.commit()
+                self.c.executemany("DELETE FROM inventario WHERE id = ?", [(i,) for i in ids])
                 
                 # Registrar en el historial de accesos
-                self.registrar_acceso(f"Eliminó componente del inventario: {componente_nombre}")
+                self.registrar_acceso(f"Eliminó {len(ids)} componente(s) del inventario: {', '.join(nombres)}",
+                                      commit=False)
+                self.conn.commit()
                 
-                messagebox.showinfo("Éxito", "Componente eliminado")
+                self.tree_inventario.delete(*seleccion)
                 self.cargar_ubicaciones_inventario()
-                self.actualizar_inventario()
+                messagebox.showinfo("Éxito", "Componente(s) eliminado(s)")
             except sqlite3.Error as e:
+                self.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo eliminar el componente: {e}")
     
-    def exportar_inventario(self):
-        """Exporta el inventario a un archivo Excel"""
+    def mostrar_alertas_stock(self):
+        """Avisa de los componentes que acaban de quedar bajo el mínimo"""
         try:
-            # Obtener todos los componentes
-            items = self.tree_inventario.get_children()
-            data = [self.tree_inventario.item(item, 'values') for item in items]
-            
-            if not data:
-                messagebox.showwarning("Advertencia", "No hay datos para exportar")
-                return
-                
-            # Crear DataFrame
-            df = pd.DataFrame(data, columns=["ID", "Componente", "Tipo", "Cantidad", "Mínimo", "Proveedor", "Ubicación", "Últ. Actualización"])
-            
-            # Preguntar dónde guardar
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
-                title="Guardar inventario como"
-            )
-            
-            if not filepath:
-                return
-                
-            # Guardar en Excel
-            df.to_excel(filepath, index=False)
-            
-            # Registrar en el historial de accesos
-            self.registrar_acceso(f"Exportó inventario a {filepath}")
-            
-            messagebox.showinfo("Éxito", f"Inventario exportado a:\n{filepath}")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo exportar: {e}")
+            alertas = db.leer_alertas_stock(self.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron leer las alertas de stock: {e}")
+            return
+        
+        if alertas:
+            lineas = [f"- {componente}: {cantidad} (mínimo {minimo}, proveedor: {proveedor or '-'})"
+                      for componente, cantidad, minimo, proveedor in alertas]
+            messagebox.showwarning("Stock bajo", "Componentes bajo el mínimo:\n" + "\n".join(lineas))
     
-    def crear_graficos_inventario(self, frame):
-        """Crea gráficos estadísticos del inventario"""
+    def mostrar_sugerencias_reposicion(self):
+        """Muestra los componentes a pedir agrupados por proveedor"""
         try:
-            # Obtener datos para gráficos
-            self.c.execute("SELECT componente, cantidad FROM inventario ORDER BY cantidad DESC LIMIT 10")
-            top_componentes = self.c.fetchall()
-            
-            self.c.execute("SELECT tipo, SUM(cantidad) FROM inventario GROUP BY tipo")
-            tipos_componentes = self.c.fetchall()
-            
-            self.c.execute("SELECT proveedor, COUNT(*) FROM inventario WHERE proveedor IS NOT NULL AND proveedor != '' GROUP BY proveedor")
-            proveedores = self.c.fetchall()
-            
-            # Crear figura con subplots
-            fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(15, 5))
-            fig.suptitle('Estadísticas de Inventario', fontsize=14)
-            
-            # Gráfico 1: Top componentes por cantidad
-            if top_componentes:
+            sugerencias = db.sugerencias_reposicion(self.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron calcular las sugerencias: {e}")
+            return
+        
+        if not sugerencias:
+            messagebox.showinfo("Sugerencias de Pedido", "No hay componentes bajo el mínimo")
+            return
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Sugerencias de Pedido")
+        ventana.geometry("700x400")
+        
+        frame_tabla = ttk.Frame(ventana)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Un nodo por proveedor con sus componentes debajo
+        columns = ("Cantidad", "Mínimo", "Pedir")
+        tree = ttk.Treeview(frame_tabla, columns=columns)
+        tree.heading('#0', text="Proveedor / Componente")
+        tree.column('#0', width=300)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='center')
+        tree.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        for proveedor, componentes in sugerencias.items():
+            nodo = tree.insert('', 'end', text=proveedor, open=True,
+                               values=("", "", sum(c[4] for c in componentes)))
+            for componente_id, componente, cantidad, minimo, pedido in componentes:
+                tree.insert(nodo, 'end', text=componente, values=(cantidad, minimo, pedido))
+        
+        ttk.Button(ventana, text="Cerrar", command=ventana.destroy).pack(pady=10)
+    
+    def registrar_movimiento_inventario(self):
+        """Abre ventana para registrar una entrada, salida o ajuste del componente seleccionado"""
+        if not self.verificar_permiso("gestionar_inventario"):
+            return
+        seleccion = self.tree_inventario.selection()
+        if len(seleccion) != 1:
+            messagebox.showwarning("Advertencia", "Seleccione un componente")
+            return
+        
+        valores = self.tree_inventario.item(seleccion[0], 'values')
+        componente_id, componente = valores[0], valores[1]
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Movimiento de {componente}")
+        ventana.geometry("450x330")
+        ventana.grab_set()
+        
+        # Variables
+        var_tipo = tk.StringVar(value="Salida")
+        var_cantidad = tk.IntVar(value=1)
+        var_observaciones = tk.StringVar()
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        ttk.Label(frame_principal, text=f"Cantidad actual: {valores[3]}").grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+        
+        ttk.Label(frame_principal, text="Tipo:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        ttk.Combobox(frame_principal, textvariable=var_tipo, values=db.TIPOS_MOVIMIENTO, 
+                     state='readonly').grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        
+        # En los ajustes se indica el recuento final, no la diferencia
+        ttk.Label(frame_principal, text="Cantidad:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        ttk.Spinbox(frame_principal, textvariable=var_cantidad, from_=0, to=10000).grid(row=2, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Reporte:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+        combo_reporte = ttk.Combobox(frame_principal)
+        combo_reporte.grid(row=3, column=1, padx=5, pady=5, sticky='we')
+        self.configurar_combo_ids(combo_reporte, self.obtener_lista("reportes_abiertos"))
+        
+        ttk.Label(frame_principal, text="Mantenimiento:").grid(row=4, column=0, padx=5, pady=5, sticky='e')
+        combo_mantenimiento = ttk.Combobox(frame_principal)
+        combo_mantenimiento.grid(row=4, column=1, padx=5, pady=5, sticky='we')
+        self.configurar_combo_ids(combo_mantenimiento, self.obtener_lista("mantenimientos_pendientes"))
+        
+        ttk.Label(frame_principal, text="Observaciones:").grid(row=5, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_observaciones).grid(row=5, column=1, padx=5, pady=5, sticky='we')
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_movimiento(
+            componente_id,
+            componente,
+            var_tipo.get(),
+            var_cantidad,
+            self.id_seleccionado(combo_reporte),
+            self.id_seleccionado(combo_mantenimiento),
+            var_observaciones.get(),
+            ventana
+        ))
+        btn_guardar.pack(side='left', padx=5)
+        
+        btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana.destroy)
+        btn_cancelar.pack(side='left', padx=5)
+    
+    def guardar_movimiento(self, componente_id, componente, tipo, var_cantidad, reporte_id, mantenimiento_id, observaciones, ventana):
+        """Guarda un movimiento de inventario y actualiza la cantidad del componente"""
+        try:
+            cantidad = int(var_cantidad.get())
+        except (ValueError, tk.TclError):
+            messagebox.showwarning("Advertencia", "La cantidad debe ser un número entero")
+            return
+        
+        try:
+            saldo = db.registrar_movimiento(self.conn, componente_id, tipo, cantidad, reporte_id, mantenimiento_id,
+                                            observaciones, self.sesion.usuario_id, commit=False)
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Registró {tipo.lower()} de inventario: {componente}",
+                                  f"{tipo} de {cantidad} unidad(es) de {componente}; saldo: {saldo}", commit=False)
+            self.conn.commit()
+            
+            ventana.destroy()
+            self.actualizar_inventario()
+            self.mostrar_alertas_stock()
+        except ValueError as e:
+            self.conn.rollback()
+            messagebox.showwarning("Advertencia", str(e))
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudo registrar el movimiento: {e}")
+    
+    def historial_componente(self):
+        """Muestra los movimientos del componente seleccionado con su saldo"""
+        seleccion = self.tree_inventario.selection()
+        if len(seleccion) != 1:
+            messagebox.showwarning("Advertencia", "Seleccione un componente")
+            return
+        
+        componente_id, componente = self.tree_inventario.item(seleccion[0], 'values')[:2]
+        try:
+            # El reporte puede estar archivado: se busca en reportes_todos
+            self.c.execute("""SELECT m.fecha, m.tipo, m.cantidad, m.saldo, 
+                              CASE WHEN m.reporte_id IS NOT NULL THEN 'Reporte #' || m.reporte_id || COALESCE(' (' || r.tipo || ')', '') 
+                                   WHEN m.mantenimiento_id IS NOT NULL THEN 'Mantenimiento #' || m.mantenimiento_id 
+                                   ELSE '' END, 
+                              COALESCE(m.observaciones, '') 
+                              FROM movimientos_inventario m 
+                              LEFT JOIN reportes_todos r ON r.id = m.reporte_id 
+                              WHERE m.componente_id = ? 
+                              ORDER BY m.fecha_ts DESC, m.id DESC""", (componente_id,))
+            movimientos = self.c.fetchall()
+            pronostico = db.pronostico_consumo(self.conn, componente_id=componente_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo cargar el historial: {e}")
+            return
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Historial de {componente}")
+        ventana.geometry("800x450")
+        
+        if pronostico:
+            consumo, dias_minimo = pronostico[0][5], pronostico[0][6]
+            texto = f"Consumo medio: {consumo} por día (últimos {db.DIAS_CONSUMO} días)"
+            if dias_minimo is not None:
+                texto += f" - llega al mínimo en {dias_minimo} días"
+            ttk.Label(ventana, text=texto).pack(anchor='w', padx=10, pady=5)
+        
+        frame_tabla = ttk.Frame(ventana)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("Fecha", "Tipo", "Cantidad", "Saldo", "Referencia", "Observaciones")
+        tree = ttk.Treeview(frame_tabla, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='center')
+        tree.column("Fecha", width=140)
+        tree.column("Observaciones", width=200)
+        tree.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        for movimiento in movimientos:
+            tree.insert('', 'end', values=movimiento)
+        
+        ttk.Button(ventana, text="Cerrar", command=ventana.destroy).pack(pady=10)
+    
+    def mostrar_pronostico_consumo(self):
+        """Muestra el consumo diario y los días estimados hasta el mínimo de cada componente"""
+        try:
+            pronostico = db.pronostico_consumo(self.conn)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo calcular el consumo: {e}")
+            return
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Consumo de Inventario (últimos {db.DIAS_CONSUMO} días)")
+        ventana.geometry("850x450")
+        
+        frame_tabla = ttk.Frame(ventana)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("Componente", "Cantidad", "Mínimo", "Proveedor", "Consumo/día", "Días al mínimo", "Días a cero")
+        tree = ttk.Treeview(frame_tabla, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='center')
+        tree.column("Componente", width=180)
+        tree.column("Proveedor", width=150)
+        tree.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        # Primero los que antes llegarán al mínimo; los que no tienen consumo, al final
+        pronostico.sort(key=lambda p: (p[6] is None, p[6] or 0))
+        tree.tag_configure('urgente', background='#ffcccc')
+        for componente_id, componente, cantidad, minimo, proveedor, consumo, dias_minimo, dias_agotado in pronostico:
+            urgente = dias_minimo is not None and dias_minimo <= 7
+            tree.insert('', 'end', tags=('urgente',) if urgente else (),
+                        values=(componente, cantidad, minimo, proveedor or "",
+                                consumo, "-" if dias_minimo is None else dias_minimo,
+                                "-" if dias_agotado is None else dias_agotado))
+        
+        ttk.Button(ventana, text="Cerrar", command=ventana.destroy).pack(pady=10)
+    
+    def exportar_inventario(self):
+        """Exporta el inventario a un archivo Excel"""
+        try:
+            # Obtener todos los componentes, también los que aún no se mostraron en la tabla
+            data = self.filas_tabla(self.tree_inventario)
+            
+            if not data:
+                messagebox.showwarning("Advertencia", "No hay datos para exportar")
+                return
+                
+            # Crear DataFrame
+            df = pd.DataFrame(data, columns=["ID", "Componente", "Tipo", "Cantidad", "Mínimo", "Proveedor", "Ubicación", "Últ. Actualización"])
+            
+            # Preguntar dónde guardar
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".xlsx",
+                filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+                title="Guardar inventario como"
+            )
+            
+            if not filepath:
+                return
+                
+            # Guardar en Excel
+            df.to_excel(filepath, index=False)
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Exportó inventario a {filepath}")
+            
+            messagebox.showinfo("Éxito", f"Inventario exportado a:\n{filepath}")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {e}")
+    
+    def crear_graficos_inventario(self, frame):
+        """Crea gráficos estadísticos del inventario"""
+        try:
+            # Obtener datos para gráficos (de la caché en disco si el inventario no cambió)
+            consultar = lambda sql: self.cache_consultas.consultar(self.conn, sql, tablas=["inventario"])
+            top_componentes = consultar("SELECT componente, cantidad FROM inventario ORDER BY cantidad DESC LIMIT 10")
+            
+            tipos_componentes = consultar("SELECT tipo, SUM(cantidad) FROM inventario GROUP BY tipo")
+            
+            proveedores = consultar("SELECT proveedor, COUNT(*) FROM inventario WHERE proveedor IS NOT NULL AND proveedor != '' GROUP BY proveedor")
+            
+            # Crear figura con subplots
+            fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(15, 5))
+            fig.suptitle('Estadísticas de Inventario', fontsize=14)
+            
+            # Gráfico 1: Top componentes por cantidad
+            if top_componentes:
                 nombres = [comp[0] for comp in top_componentes]
                 cantidades = [comp[1] for comp in top_componentes]
                 
@@ -1156,17 +1873,20 @@ class SistemaGestionLaboratorio:
         # Frames para cada subpestaña
         self.frame_equipos = ttk.Frame(self.notebook_gestion)
         self.frame_reservas = ttk.Frame(self.notebook_gestion)
+        self.frame_disponibilidad = ttk.Frame(self.notebook_gestion)
         self.frame_mantenimiento = ttk.Frame(self.notebook_gestion)
         self.frame_configuracion = ttk.Frame(self.notebook_gestion)
         
         self.notebook_gestion.add(self.frame_equipos, text="Gestión de Equipos")
         self.notebook_gestion.add(self.frame_reservas, text="Reservas")
+        self.notebook_gestion.add(self.frame_disponibilidad, text="Disponibilidad")
         self.notebook_gestion.add(self.frame_mantenimiento, text="Mantenimiento")
         self.notebook_gestion.add(self.frame_configuracion, text="Configuración")
         
         # Inicializar subpestañas
         self.inicializar_gestion_equipos()
         self.inicializar_gestion_reservas()
+        self.inicializar_disponibilidad()
         self.inicializar_gestion_mantenimiento()
         self.inicializar_configuracion()
         
@@ -1199,6 +1919,18 @@ class SistemaGestionLaboratorio:
         btn_exportar = ttk.Button(frame_controles, text="Exportar", command=self.exportar_equipos)
         btn_exportar.pack(side='left', padx=5)
         
+        # Acciones sobre varios equipos seleccionados
+        btn_estado_lote = ttk.Button(frame_controles, text="Cambiar Estado", command=self.cambiar_estado_equipos_lote)
+        btn_estado_lote.pack(side='left', padx=5)
+        
+        btn_ubicacion_lote = ttk.Button(frame_controles, text="Cambiar Ubicación", command=self.cambiar_ubicacion_equipos_lote)
+        btn_ubicacion_lote.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("gestionar_equipos", btn_agregar, btn_editar, btn_estado_lote, btn_ubicacion_lote)
+        self.ocultar_sin_permiso("eliminar_equipos", btn_eliminar)
+        
+        btn_historial = ttk.Button(frame_controles, text="Historial", command=self.historial_equipo)
+        btn_historial.pack(side='left', padx=5)
+        
         # Frame para filtros
         frame_filtros = ttk.LabelFrame(self.frame_equipos, text="Filtros", padding=5)
         frame_filtros.pack(fill='x', padx=10, pady=5)
@@ -1229,11 +1961,12 @@ class SistemaGestionLaboratorio:
         frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
         
         # Tabla de equipos
-        columns = ("ID", "Nombre", "Tipo", "Modelo", "Serial", "Estado", "Ubicación", "Adquisición", "Últ. Mant.")
-        self.tree_equipos = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='browse')
+        columns = ("ID", "Nombre", "Tipo", "Modelo", "Serial", "Estado", "Ubicación", "Adquisición", "Últ. Mant.", "Riesgo")
+        self.tree_equipos = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='extended')
         
-        for col in columns:
-            self.tree_equipos.heading(col, text=col)
+        for posicion, col in enumerate(columns):
+            self.tree_equipos.heading(col, text=col,
+                                      command=lambda p=posicion: self.ordenar_tabla(self.tree_equipos, p))
             self.tree_equipos.column(col, width=100, anchor='center')
         
         self.tree_equipos.column("Nombre", width=150)
@@ -1245,16 +1978,90 @@ class SistemaGestionLaboratorio:
         # Scrollbar
         scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=self.tree_equipos.yview)
         scrollbar.pack(side='right', fill='y')
-        self.tree_equipos.configure(yscrollcommand=scrollbar.set)
+        self.configurar_desplazamiento(self.tree_equipos, scrollbar)
         
         # Cargar datos iniciales
         self.actualizar_equipos()
     
+    def historial_equipo(self):
+        """Muestra en una sola lista los reportes, reservas y mantenimientos del equipo seleccionado"""
+        seleccion = self.tree_equipos.selection()
+        if len(seleccion) != 1:
+            messagebox.showwarning("Advertencia", "Seleccione un equipo")
+            return
+        
+        equipo_id, nombre = self.tree_equipos.item(seleccion[0], 'values')[:2]
+        equipo_id = int(equipo_id)
+        try:
+            filas, completo = self.cargar_historial_equipo(equipo_id)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo cargar el historial: {e}")
+            return
+        
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Historial de {nombre}")
+        ventana.geometry("850x450")
+        
+        frame_tabla = ttk.Frame(ventana)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("Fecha", "Origen", "ID", "Resumen", "Estado")
+        tree = ttk.Treeview(frame_tabla, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='center')
+        tree.column("Fecha", width=140)
+        tree.column("ID", width=60)
+        tree.column("Resumen", width=350, anchor='w')
+        tree.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(pady=10)
+        
+        def mostrar(filas, completo):
+            tree.delete(*tree.get_children())
+            for origen, registro_id, fecha, resumen, estado in filas:
+                tree.insert('', 'end', values=(fecha or "", origen, registro_id, resumen, estado or ""))
+            btn_mas.config(state='disabled' if completo else 'normal')
+        
+        def cargar_mas():
+            try:
+                mostrar(*self.cargar_historial_equipo(equipo_id, mas=True))
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"No se pudo cargar el historial: {e}")
+        
+        btn_mas = ttk.Button(frame_botones, text="Cargar más", command=cargar_mas)
+        btn_mas.pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Cerrar", command=ventana.destroy).pack(side='left', padx=5)
+        
+        mostrar(filas, completo)
+    
+    def cargar_historial_equipo(self, equipo_id, mas=False):
+        """Devuelve (filas, completo) del historial de un equipo, leyendo de la base solo las páginas que faltan"""
+        # Si ninguna de las tablas cambió se reutilizan las páginas ya leídas del equipo
+        versiones = tuple(db.leer_version_datos(self.conn, tabla) for tabla in ("reportes", "reservas", "mantenimientos"))
+        guardadas, filas, completo = self.cache_historial.get(equipo_id, (None, [], False))
+        if guardadas != versiones:
+            # Los datos cambiaron: se vuelven a leer en una consulta tantas filas como había en memoria
+            cantidad = max(len(filas), db.HISTORIAL_POR_PAGINA) + (db.HISTORIAL_POR_PAGINA if mas else 0)
+            filas = db.historial_equipo(self.conn, equipo_id, 0, cantidad)
+            completo = len(filas) < cantidad
+        elif mas and not completo:
+            pagina = db.historial_equipo(self.conn, equipo_id, len(filas))
+            filas = filas + pagina
+            completo = len(pagina) < db.HISTORIAL_POR_PAGINA
+        
+        self.cache_historial[equipo_id] = (versiones, filas, completo)
+        return filas, completo
+    
     def cargar_ubicaciones_equipos(self):
         """Carga las ubicaciones disponibles para filtrar"""
         try:
-            self.c.execute("SELECT DISTINCT ubicacion FROM equipos WHERE ubicacion IS NOT NULL AND ubicacion != '' ORDER BY ubicacion")
-            ubicaciones = ["Todos"] + [u[0] for u in self.c.fetchall()]
+            ubicaciones = ["Todos"] + [u[0] for u in self.obtener_lista("ubicaciones_equipos")]
             self.combo_ubicacion_equipo['values'] = ubicaciones
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudieron cargar las ubicaciones: {e}")
@@ -1262,53 +2069,124 @@ class SistemaGestionLaboratorio:
     def actualizar_equipos(self):
         """Actualiza la tabla de equipos con los datos de la base de datos"""
         try:
-            # Limpiar tabla
-            for item in self.tree_equipos.get_children():
-                self.tree_equipos.delete(item)
-            
-            # Construir consulta con filtros
+            # Construir consulta con filtros y las mismas condiciones para filtrar en memoria
             query = """SELECT id, nombre, tipo, modelo, serial, estado, ubicacion, 
                         fecha_adquisicion, ultimo_mantenimiento 
                         FROM equipos WHERE 1=1"""
             params = []
+            condiciones = []
             
             tipo = self.combo_tipo_equipo.get()
             if tipo != "Todos":
                 query += " AND tipo = ?"
                 params.append(tipo)
+                condiciones.append(("tipo", "=", tipo))
                 
             estado = self.combo_estado_equipo.get()
             if estado != "Todos":
                 query += " AND estado = ?"
                 params.append(estado)
+                condiciones.append(("estado", "=", estado))
                 
             ubicacion = self.combo_ubicacion_equipo.get()
             if ubicacion != "Todos":
                 query += " AND ubicacion = ?"
                 params.append(ubicacion)
+                condiciones.append(("ubicacion", "=", ubicacion))
             
             query += " ORDER BY nombre"
             
-            # Obtener datos
-            self.c.execute(query, params)
-            equipos = self.c.fetchall()
+            # Obtener datos; la columna de riesgo también depende de reportes y mantenimientos, y del día
+            clave = tuple(db.leer_version_datos(self.conn, tabla) for tabla in salud.TABLAS_RIESGO) + (
+                datetime.now().strftime("%Y-%m-%d"),)
+            equipos, indices = self.filtros_equipos.obtener(clave, condiciones, lambda: self.consultar_equipos(query, params))
             
-            # Llenar tabla
-            for equipo in equipos:
-                self.tree_equipos.insert('', 'end', values=equipo)
-                
-            # Resaltar equipos con estado diferente a "Operativo"
-            for item in self.tree_equipos.get_children():
-                valores = self.tree_equipos.item(item, 'values')
-                if valores[5] != "Operativo":
-                    self.tree_equipos.tag_configure('no_operativo', background='#ffcccc')
-                    self.tree_equipos.item(item, tags=('no_operativo',))
-                    
+            # Llenar tabla resaltando equipos con estado diferente a "Operativo"
+            self.mostrar_filas_columnares(self.tree_equipos, equipos, self.etiquetas_equipo, indices=indices)
+        
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar los equipos: {e}")
     
+    def consultar_equipos(self, query, params):
+        """Ejecuta la consulta de equipos y devuelve sus filas con el puntaje de riesgo en una TablaColumnar"""
+        self.c.execute(query, params)
+        puntajes = self.cache_riesgo.obtener(self.conn)
+        
+        equipos = TablaColumnar(["id", "nombre", "tipo", "modelo", "serial", "estado", "ubicacion",
+                                 "fecha_adquisicion", "ultimo_mantenimiento", "riesgo"],
+                                categoricas=["tipo", "modelo", "estado", "ubicacion"])
+        filas = []
+        for equipo in self.c.fetchall():
+            riesgo = ""
+            if equipo[0] in puntajes.index and puntajes.at[equipo[0], "nivel"]:
+                riesgo = f"{puntajes.at[equipo[0], 'riesgo']:.0f} ({puntajes.at[equipo[0], 'nivel']})"
+            filas.append(tuple(equipo) + (riesgo,))
+        equipos.agregar(filas)
+        return equipos
+    
+    def etiquetas_equipo(self, valores):
+        """Devuelve las etiquetas de color de una fila de la tabla de equipos"""
+        if valores[5] != "Operativo":
+            self.tree_equipos.tag_configure('no_operativo', background='#ffcccc')
+            return ('no_operativo',)
+        if valores[9].endswith("(Alto)"):
+            self.tree_equipos.tag_configure('riesgo_alto', background='#ffe5b4')
+            return ('riesgo_alto',)
+        return ()
+    
+    def cambiar_estado_equipos_lote(self):
+        """Cambia el estado de todos los equipos seleccionados"""
+        if not self.verificar_permiso("gestionar_equipos"):
+            return
+        items = self.tree_equipos.selection()
+        if not items:
+            messagebox.showwarning("Advertencia", "Seleccione uno o más equipos")
+            return
+        
+        self.pedir_valor_lote("Cambiar Estado", f"Nuevo estado para {len(items)} equipo(s):",
+                              ["Operativo", "Mantenimiento", "Dañado", "Retirado"],
+                              lambda estado: self.aplicar_lote_equipos(items, 'estado', estado))
+    
+    def cambiar_ubicacion_equipos_lote(self):
+        """Cambia la ubicación de todos los equipos seleccionados"""
+        if not self.verificar_permiso("gestionar_equipos"):
+            return
+        items = self.tree_equipos.selection()
+        if not items:
+            messagebox.showwarning("Advertencia", "Seleccione uno o más equipos")
+            return
+        
+        ubicaciones = [u for u in self.combo_ubicacion_equipo['values'] if u != "Todos"]
+        self.pedir_valor_lote("Cambiar Ubicación", f"Nueva ubicación para {len(items)} equipo(s):",
+                              ubicaciones,
+                              lambda ubicacion: self.aplicar_lote_equipos(items, 'ubicacion', ubicacion),
+                              editable=True)
+    
+    def aplicar_lote_equipos(self, items, campo, valor):
+        """Actualiza un campo de varios equipos en una sola transacción"""
+        columnas = {'estado': (5, self.combo_estado_equipo), 'ubicacion': (6, self.combo_ubicacion_equipo)}
+        columna, combo_filtro = columnas[campo]
+        ids = [self.tree_equipos.item(item, 'values')[0] for item in items]
+        
+        try:
+            self.c.executemany(f"UPDATE equipos SET {campo} = ? WHERE id = ?", [(valor, i) for i in ids])
+            self.registrar_acceso(f"Cambió {campo} de {len(ids)} equipos a {valor}",
+                                  f"Equipos: {', '.join(ids)}", commit=False)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudieron actualizar los equipos: {e}")
+            return
+        
+        self.actualizar_filas(self.tree_equipos, items, columna, valor, combo_filtro.get(),
+                              self.etiquetas_equipo)
+        if campo == 'ubicacion':
+            self.cargar_ubicaciones_equipos()
+    
     def agregar_equipo(self):
         """Abre ventana para agregar nuevo equipo"""
+        if not self.verificar_permiso("gestionar_equipos"):
+            return
         ventana = tk.Toplevel(self.root)
         ventana.title("Agregar Equipo")
         ventana.geometry("600x500")
@@ -1407,6 +2285,17 @@ class SistemaGestionLaboratorio:
         if not nombre:
             messagebox.showwarning("Advertencia", "El nombre del equipo es obligatorio")
             return
+        # Las fechas son opcionales, pero si se indican deben ser válidas
+        if fecha_adq:
+            fecha_adq = normalizar_fecha(fecha_adq)
+            if fecha_adq is None:
+                messagebox.showwarning("Advertencia", "La fecha de adquisición no es válida (use AAAA-MM-DD)")
+                return
+        if ult_mant:
+            ult_mant = normalizar_fecha(ult_mant)
+            if ult_mant is None:
+                messagebox.showwarning("Advertencia", "La fecha de último mantenimiento no es válida (use AAAA-MM-DD)")
+                return
             
         try:
             self.c.execute("""INSERT INTO equipos 
@@ -1431,6 +2320,8 @@ class SistemaGestionLaboratorio:
     
     def editar_equipo(self):
         """Abre ventana para editar equipo seleccionado"""
+        if not self.verificar_permiso("gestionar_equipos"):
+            return
         seleccion = self.tree_equipos.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un equipo para editar")
@@ -1548,6 +2439,17 @@ class SistemaGestionLaboratorio:
         if not nombre:
             messagebox.showwarning("Advertencia", "El nombre del equipo es obligatorio")
             return
+        # Las fechas son opcionales, pero si se indican deben ser válidas
+        if fecha_adq:
+            fecha_adq = normalizar_fecha(fecha_adq)
+            if fecha_adq is None:
+                messagebox.showwarning("Advertencia", "La fecha de adquisición no es válida (use AAAA-MM-DD)")
+                return
+        if ult_mant:
+            ult_mant = normalizar_fecha(ult_mant)
+            if ult_mant is None:
+                messagebox.showwarning("Advertencia", "La fecha de último mantenimiento no es válida (use AAAA-MM-DD)")
+                return
             
         try:
             self.c.execute("""UPDATE equipos SET 
@@ -1571,67 +2473,83 @@ class SistemaGestionLaboratorio:
                 messagebox.showerror("Error", f"No se pudo actualizar el equipo: {e}")
     
     def eliminar_equipo(self):
-        """Elimina el equipo seleccionado"""
+        """Elimina los equipos seleccionados"""
+        if not self.verificar_permiso("eliminar_equipos"):
+            return
         seleccion = self.tree_equipos.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un equipo para eliminar")
             return
-            
-        equipo_id = self.tree_equipos.item(seleccion[0], 'values')[0]
-        equipo_nombre = self.tree_equipos.item(seleccion[0], 'values')[1]
         
-        # Verificar si hay reportes asociados
-        self.c.execute("SELECT COUNT(*) FROM reportes WHERE equipo_id = ?", (equipo_id,))
-        count_reportes = self.c.fetchone()[0]
+        ids = [self.tree_equipos.item(item, 'values')[0] for item in seleccion]
+        nombres = [self.tree_equipos.item(item, 'values')[1] for item in seleccion]
+        
+        try:
+            count_reportes, count_reservas, count_mantenimientos = self.impacto_eliminacion_equipos(ids)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo calcular el impacto de la eliminación: {e}")
+            return
         
-        # Verificar si hay reservas asociadas
-        self.c.execute("SELECT COUNT(*) FROM reservas WHERE equipo_id = ?", (equipo_id,))
-        count_reservas = self.c.fetchone()[0]
+        if len(ids) == 1:
+            mensaje = f"¿Eliminar el equipo '{nombres[0]}'?"
+        else:
+            mensaje = f"¿Eliminar los {len(ids)} equipos seleccionados?"
         
-        mensaje = f"¿Eliminar el equipo '{equipo_nombre}'?"
-        if count_reportes > 0 or count_reservas > 0:
-            mensaje += "\n\nAdvertencia: Este equipo tiene:"
+        if count_reportes > 0 or count_reservas > 0 or count_mantenimientos > 0:
+            mensaje += "\n\nAdvertencia: La selección tiene:"
             if count_reportes > 0:
                 mensaje += f"\n- {count_reportes} reportes asociados"
             if count_reservas > 0:
                 mensaje += f"\n- {count_reservas} reservas asociadas"
-            mensaje += "\n\nTodos estos registros también serán eliminados."
+            if count_mantenimientos > 0:
+                mensaje += f"\n- {count_mantenimientos} mantenimientos asociados"
+            mensaje += ("\n\nSí: eliminar también todos estos registros."
+                        "\nNo: marcar como Retirado y conservar el historial.")
+            
+            respuesta = messagebox.askyesnocancel("Confirmar", mensaje)
+            if respuesta is None:
+                return
+            if not respuesta:
+                self.aplicar_lote_equipos(seleccion, 'estado', "Retirado")
+                return
+        elif not messagebox.askyesno("Confirmar", mensaje):
+            return
         
-        if messagebox.askyesno("Confirmar", mensaje):
-            try:
-                # Eliminar registros asociados primero (por las claves foráneas)
-                if count_reportes > 0:
-                    self.c.execute("DELETE FROM reportes WHERE equipo_id = ?", (equipo_id,))
-                
-                if count_reservas > 0:
-                    self.c.execute("DELETE FROM reservas WHERE equipo_id = ?", (equipo_id,))
-                
-                # Eliminar el equipo
-                self.c.execute("DELETE FROM equipos WHERE id = ?", (equipo_id,))
-                self.conn.commit()
-                
-                # Registrar en el historial de accesos
-                self.registrar_acceso(f"Eliminó equipo: {equipo_nombre}")
-                
-                messagebox.showinfo("Éxito", "Equipo eliminado")
-                self.cargar_ubicaciones_equipos()
-                self.actualizar_equipos()
-            except sqlite3.Error as e:
-                messagebox.showerror("Error", f"No se pudo eliminar el equipo: {e}")
+        try:
+            # Los reportes, reservas y mantenimientos se eliminan en cascada
+            self.c.executemany("DELETE FROM equipos WHERE id = ?", [(i,) for i in ids])
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Eliminó {len(ids)} equipo(s): {', '.join(nombres)}", commit=False)
+            self.conn.commit()
+            
+            self.tree_equipos.delete(*seleccion)
+            self.cargar_ubicaciones_equipos()
+            messagebox.showinfo("Éxito", "Equipo(s) eliminado(s)")
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudo eliminar el equipo: {e}")
+    
+    def impacto_eliminacion_equipos(self, ids):
+        """Devuelve cuántos reportes, reservas y mantenimientos se eliminarían con los equipos"""
+        marcadores = ", ".join("?" * len(ids))
+        self.c.execute(f"""SELECT COALESCE(SUM(num_reportes), 0), COALESCE(SUM(num_reservas), 0),
+                           COALESCE(SUM(num_mantenimientos), 0)
+                           FROM equipos WHERE id IN ({marcadores})""", ids)
+        return self.c.fetchone()
     
     def exportar_equipos(self):
         """Exporta los equipos a un archivo Excel"""
         try:
-            # Obtener todos los equipos visibles
-            items = self.tree_equipos.get_children()
-            data = [self.tree_equipos.item(item, 'values') for item in items]
+            # Obtener todos los equipos del filtro, también los que aún no se mostraron en la tabla
+            data = self.filas_tabla(self.tree_equipos)
             
             if not data:
                 messagebox.showwarning("Advertencia", "No hay datos para exportar")
                 return
                 
             # Crear DataFrame
-            df = pd.DataFrame(data, columns=["ID", "Nombre", "Tipo", "Modelo", "Serial", "Estado", "Ubicación", "Adquisición", "Últ. Mant."])
+            df = pd.DataFrame(data, columns=["ID", "Nombre", "Tipo", "Modelo", "Serial", "Estado", "Ubicación", "Adquisición", "Últ. Mant.", "Riesgo"])
             
             # Preguntar dónde guardar
             filepath = filedialog.asksaveasfilename(
@@ -1663,6 +2581,9 @@ class SistemaGestionLaboratorio:
         btn_nueva = ttk.Button(frame_controles, text="Nueva Reserva", command=self.nueva_reserva)
         btn_nueva.pack(side='left', padx=5)
         
+        btn_multiple = ttk.Button(frame_controles, text="Reserva Múltiple", command=self.nueva_reserva_multiple)
+        btn_multiple.pack(side='left', padx=5)
+        
         btn_cancelar = ttk.Button(frame_controles, text="Cancelar Reserva", command=self.cancelar_reserva)
         btn_cancelar.pack(side='left', padx=5)
         
@@ -1677,18 +2598,16 @@ class SistemaGestionLaboratorio:
         frame_filtros.pack(fill='x', padx=10, pady=5)
         
         ttk.Label(frame_filtros, text="Estado:").grid(row=0, column=0, padx=5, pady=2, sticky='e')
-        self.combo_estado_reserva = ttk.Combobox(frame_filtros, values=["Todos", "Confirmada", "Cancelada", "Completada"], state='readonly')
+        self.combo_estado_reserva = ttk.Combobox(frame_filtros, values=["Todos", "Confirmada", "En curso", "Finalizada", "Cancelada"], state='readonly')
         self.combo_estado_reserva.grid(row=0, column=1, padx=5, pady=2, sticky='we')
         self.combo_estado_reserva.set("Todos")
         self.combo_estado_reserva.bind("<<ComboboxSelected>>", lambda e: self.actualizar_reservas())
         
         ttk.Label(frame_filtros, text="Fecha Desde:").grid(row=0, column=2, padx=5, pady=2, sticky='e')
-        self.entry_fecha_desde_reserva = ttk.Entry(frame_filtros)
-        self.entry_fecha_desde_reserva.grid(row=0, column=3, padx=5, pady=2, sticky='we')
+        self.entry_fecha_desde_reserva = self.crear_campo_fecha(frame_filtros, row=0, column=3, pady=2)
         
         ttk.Label(frame_filtros, text="Fecha Hasta:").grid(row=0, column=4, padx=5, pady=2, sticky='e')
-        self.entry_fecha_hasta_reserva = ttk.Entry(frame_filtros)
-        self.entry_fecha_hasta_reserva.grid(row=0, column=5, padx=5, pady=2, sticky='we')
+        self.entry_fecha_hasta_reserva = self.crear_campo_fecha(frame_filtros, row=0, column=5, pady=2)
         
         btn_buscar = ttk.Button(frame_filtros, text="Buscar", command=self.actualizar_reservas)
         btn_buscar.grid(row=0, column=6, padx=5, pady=2)
@@ -1699,7 +2618,7 @@ class SistemaGestionLaboratorio:
         
         # Tabla de reservas
         columns = ("ID", "Equipo", "Usuario", "Fecha Inicio", "Fecha Fin", "Propósito", "Estado")
-        self.tree_reservas = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='browse')
+        self.tree_reservas = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='extended')
         
         for col in columns:
             self.tree_reservas.heading(col, text=col)
@@ -1739,33 +2658,33 @@ class SistemaGestionLaboratorio:
                 query += " AND r.estado = ?"
                 params.append(estado)
                 
-            fecha_desde = self.entry_fecha_desde_reserva.get()
+            fecha_desde = self.entry_fecha_desde_reserva.get().strip()
             if fecha_desde:
-                query += " AND r.fecha_inicio >= ?"
-                params.append(fecha_desde)
+                if a_timestamp(fecha_desde) is None:
+                    messagebox.showwarning("Advertencia", "La fecha desde no es válida (use AAAA-MM-DD)")
+                    return
+                query += " AND r.fecha_inicio_ts >= ?"
+                params.append(a_timestamp(fecha_desde))
                 
-            fecha_hasta = self.entry_fecha_hasta_reserva.get()
+            fecha_hasta = self.entry_fecha_hasta_reserva.get().strip()
             if fecha_hasta:
-                query += " AND r.fecha_fin <= ?"
-                params.append(fecha_hasta)
+                if timestamp_hasta(fecha_hasta) is None:
+                    messagebox.showwarning("Advertencia", "La fecha hasta no es válida (use AAAA-MM-DD)")
+                    return
+                query += " AND r.fecha_fin_ts < ?"
+                params.append(timestamp_hasta(fecha_hasta))
             
-            query += " ORDER BY r.fecha_inicio"
+            query += " ORDER BY r.fecha_inicio_ts"
             
             # Obtener datos
             self.c.execute(query, params)
             reservas = self.c.fetchall()
             
-            # Llenar tabla
+            # Llenar tabla resaltando las reservas en curso
+            self.tree_reservas.tag_configure('activa', background='#ccffcc')
             for reserva in reservas:
-                self.tree_reservas.insert('', 'end', values=reserva)
-                
-            # Resaltar reservas activas
-            fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for item in self.tree_reservas.get_children():
-                valores = self.tree_reservas.item(item, 'values')
-                if valores[3] <= fecha_actual <= valores[4] and valores[6] == "Confirmada":
-                    self.tree_reservas.tag_configure('activa', background='#ccffcc')
-                    self.tree_reservas.item(item, tags=('activa',))
+                self.tree_reservas.insert('', 'end', values=reserva,
+                                          tags=('activa',) if reserva[6] == "En curso" else ())
                     
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar las reservas: {e}")
@@ -1790,22 +2709,18 @@ class SistemaGestionLaboratorio:
         
         # Campos del formulario
         ttk.Label(frame_principal, text="Equipo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        combo_equipo = ttk.Combobox(frame_principal, textvariable=self.var_equipo, state='readonly')
+        combo_equipo = ttk.Combobox(frame_principal, textvariable=self.var_equipo)
         combo_equipo.grid(row=0, column=1, padx=5, pady=5, sticky='we')
         
         # Cargar equipos disponibles
-        self.c.execute("SELECT id, nombre FROM equipos WHERE estado = 'Operativo' ORDER BY nombre")
-        equipos = self.c.fetchall()
-        combo_equipo['values'] = [f"{e[1]} (ID: {e[0]})" for e in equipos]
+        self.configurar_combo_ids(combo_equipo, self.obtener_lista("equipos_operativos"))
         
         ttk.Label(frame_principal, text="Usuario:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-        combo_usuario = ttk.Combobox(frame_principal, textvariable=self.var_usuario, state='readonly')
+        combo_usuario = ttk.Combobox(frame_principal, textvariable=self.var_usuario)
         combo_usuario.grid(row=1, column=1, padx=5, pady=5, sticky='we')
         
         # Cargar usuarios disponibles
-        self.c.execute("SELECT id, nombre FROM usuarios ORDER BY nombre")
-        usuarios = self.c.fetchall()
-        combo_usuario['values'] = [f"{u[1]} (ID: {u[0]})" for u in usuarios]
+        self.configurar_combo_ids(combo_usuario, self.obtener_lista("usuarios"))
         
         ttk.Label(frame_principal, text="Fecha Inicio:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
         ttk.Entry(frame_principal, textvariable=self.var_fecha_ini).grid(row=2, column=1, padx=5, pady=5, sticky='we')
@@ -1822,8 +2737,8 @@ class SistemaGestionLaboratorio:
         frame_botones.pack(fill='x', padx=10, pady=10)
         
         btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_reserva(
-            self.var_equipo.get().split("(ID: ")[1].rstrip(")") if self.var_equipo.get() else None,
-            self.var_usuario.get().split("(ID: ")[1].rstrip(")") if self.var_usuario.get() else None,
+            self.id_seleccionado(combo_equipo),
+            self.id_seleccionado(combo_usuario),
             self.var_fecha_ini.get(),
             self.var_fecha_fin.get(),
             text_proposito.get("1.0", "end").strip(),
@@ -1845,14 +2760,24 @@ class SistemaGestionLaboratorio:
         if not fecha_ini or not fecha_fin:
             messagebox.showwarning("Advertencia", "Las fechas son obligatorias")
             return
+        inicio = parsear_fecha(fecha_ini)
+        fin = parsear_fecha(fecha_fin)
+        if inicio is None or fin is None:
+            messagebox.showwarning("Advertencia", "Las fechas deben tener el formato AAAA-MM-DD HH:MM")
+            return
+        if fin <= inicio:
+            messagebox.showwarning("Advertencia", "La fecha de fin debe ser posterior a la de inicio")
+            return
+        # Las fechas se guardan siempre en el mismo formato para que ordenen y filtren bien
+        fecha_ini = inicio.strftime("%Y-%m-%d %H:%M")
+        fecha_fin = fin.strftime("%Y-%m-%d %H:%M")
             
         try:
-            # Verificar disponibilidad del equipo
+            # Verificar disponibilidad del equipo: dos reservas se solapan si cada una empieza antes de que termine la otra
             self.c.execute("""SELECT COUNT(*) FROM reservas 
-                              WHERE equipo_id = ? AND estado = 'Confirmada' 
-                              AND ((? BETWEEN fecha_inicio AND fecha_fin) 
-                              OR (? BETWEEN fecha_inicio AND fecha_fin))""",
-                          (equipo_id, fecha_ini, fecha_fin))
+                              WHERE equipo_id = ? AND estado IN ('Confirmada', 'En curso') 
+                              AND fecha_inicio_ts < ? AND fecha_fin_ts > ?""",
+                          (equipo_id, int(fin.timestamp()), int(inicio.timestamp())))
             count = self.c.fetchone()[0]
             
             if count > 0:
@@ -1874,34 +2799,203 @@ class SistemaGestionLaboratorio:
             messagebox.showinfo("Éxito", "Reserva creada correctamente")
             ventana.destroy()
             self.actualizar_reservas()
+            
+            # La nueva reserva puede empezar antes que la siguiente revisión programada
+            if not self.servidor:
+                self.actualizar_estados_reservas()
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo guardar la reserva: {e}")
     
+    def nueva_reserva_multiple(self):
+        """Abre ventana para reservar varios equipos en un horario semanal que se repite"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Reserva Múltiple")
+        ventana.geometry("650x560")
+        ventana.grab_set()
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        # Equipos: selección libre o de todos los de una ubicación (un aula completa)
+        frame_equipos = ttk.LabelFrame(frame_principal, text="Equipos", padding=5)
+        frame_equipos.grid(row=0, column=0, rowspan=8, padx=5, pady=5, sticky='nsew')
+        
+        equipos = self.obtener_lista("equipos_operativos_ubicacion")
+        lista_equipos = tk.Listbox(frame_equipos, selectmode='extended', height=18, exportselection=False)
+        for equipo_id, nombre, ubicacion in equipos:
+            lista_equipos.insert('end', f"{nombre} ({ubicacion})" if ubicacion else nombre)
+        lista_equipos.pack(side='top', fill='both', expand=True)
+        
+        def seleccionar_ubicacion(event):
+            lista_equipos.selection_clear(0, 'end')
+            for i, (equipo_id, nombre, ubicacion) in enumerate(equipos):
+                if ubicacion == combo_ubicacion.get():
+                    lista_equipos.selection_set(i)
+        
+        combo_ubicacion = ttk.Combobox(frame_equipos, state='readonly',
+                                       values=[u[0] for u in self.obtener_lista("ubicaciones_equipos")])
+        combo_ubicacion.pack(side='top', fill='x', pady=(5, 0))
+        combo_ubicacion.set("Seleccionar ubicación...")
+        combo_ubicacion.bind("<<ComboboxSelected>>", seleccionar_ubicacion)
+        
+        # Horario
+        ttk.Label(frame_principal, text="Usuario:").grid(row=0, column=1, padx=5, pady=5, sticky='e')
+        combo_usuario = ttk.Combobox(frame_principal)
+        combo_usuario.grid(row=0, column=2, padx=5, pady=5, sticky='we')
+        self.configurar_combo_ids(combo_usuario, self.obtener_lista("usuarios"))
+        
+        ttk.Label(frame_principal, text="Desde:").grid(row=1, column=1, padx=5, pady=5, sticky='e')
+        entry_desde = self.crear_campo_fecha(frame_principal, row=1, column=2)
+        entry_desde.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        
+        ttk.Label(frame_principal, text="Hasta:").grid(row=2, column=1, padx=5, pady=5, sticky='e')
+        entry_hasta = self.crear_campo_fecha(frame_principal, row=2, column=2)
+        
+        var_hora_inicio = tk.StringVar(value="08:00")
+        var_hora_fin = tk.StringVar(value="10:00")
+        ttk.Label(frame_principal, text="Hora Inicio:").grid(row=3, column=1, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_hora_inicio).grid(row=3, column=2, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Hora Fin:").grid(row=4, column=1, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_hora_fin).grid(row=4, column=2, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Días:").grid(row=5, column=1, padx=5, pady=5, sticky='ne')
+        frame_dias = ttk.Frame(frame_principal)
+        frame_dias.grid(row=5, column=2, padx=5, pady=5, sticky='w')
+        vars_dias = []
+        for i, nombre in enumerate(["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]):
+            var = tk.BooleanVar(value=False)
+            ttk.Checkbutton(frame_dias, text=nombre, variable=var).grid(row=i // 4, column=i % 4, sticky='w')
+            vars_dias.append(var)
+        
+        var_cada_semanas = tk.IntVar(value=1)
+        ttk.Label(frame_principal, text="Cada (semanas):").grid(row=6, column=1, padx=5, pady=5, sticky='e')
+        ttk.Spinbox(frame_principal, textvariable=var_cada_semanas, from_=1, to=8).grid(row=6, column=2, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Propósito:").grid(row=7, column=1, padx=5, pady=5, sticky='ne')
+        text_proposito = tk.Text(frame_principal, height=4, width=30, wrap='word')
+        text_proposito.grid(row=7, column=2, padx=5, pady=5, sticky='we')
+        
+        frame_principal.columnconfigure(0, weight=1)
+        frame_principal.rowconfigure(7, weight=1)
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        btn_guardar = ttk.Button(frame_botones, text="Reservar", command=lambda: self.guardar_reserva_multiple(
+            [equipos[i][0] for i in lista_equipos.curselection()],
+            self.id_seleccionado(combo_usuario),
+            entry_desde.get(),
+            entry_hasta.get(),
+            var_hora_inicio.get().strip(),
+            var_hora_fin.get().strip(),
+            [i for i, var in enumerate(vars_dias) if var.get()],
+            var_cada_semanas,
+            text_proposito.get("1.0", "end").strip(),
+            ventana
+        ))
+        btn_guardar.pack(side='left', padx=5)
+        
+        btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana.destroy)
+        btn_cancelar.pack(side='left', padx=5)
+    
+    def guardar_reserva_multiple(self, equipo_ids, usuario_id, fecha_desde, fecha_hasta, hora_inicio, hora_fin,
+                                 dias_semana, var_cada_semanas, proposito, ventana):
+        """Expande el horario semanal y crea todas las reservas en una sola transacción"""
+        if not equipo_ids:
+            messagebox.showwarning("Advertencia", "Seleccione al menos un equipo")
+            return
+        if not usuario_id:
+            messagebox.showwarning("Advertencia", "Seleccione un usuario")
+            return
+        if not dias_semana:
+            messagebox.showwarning("Advertencia", "Seleccione al menos un día de la semana")
+            return
+        desde = parsear_fecha(fecha_desde)
+        hasta = parsear_fecha(fecha_hasta) if fecha_hasta.strip() else desde
+        if desde is None or hasta is None:
+            messagebox.showwarning("Advertencia", "Las fechas deben tener el formato AAAA-MM-DD")
+            return
+        if hasta < desde:
+            messagebox.showwarning("Advertencia", "La fecha hasta debe ser posterior a la fecha desde")
+            return
+        
+        try:
+            ocurrencias = db.expandir_recurrencia(desde.date(), hasta.date(), hora_inicio, hora_fin,
+                                                  dias_semana, int(var_cada_semanas.get()))
+        except (ValueError, tk.TclError) as e:
+            messagebox.showwarning("Advertencia", f"Horario no válido (use HH:MM): {e}")
+            return
+        if not ocurrencias:
+            messagebox.showwarning("Advertencia", "Ningún día del rango coincide con los días elegidos")
+            return
+        
+        total = len(ocurrencias) * len(equipo_ids)
+        if not messagebox.askyesno("Confirmar", f"Se crearán {total} reservas ({len(equipo_ids)} equipo(s) x "
+                                                f"{len(ocurrencias)} sesión(es)). ¿Continuar?"):
+            return
+        
+        try:
+            creadas, conflictos = db.reservar_en_lote(self.conn, equipo_ids, usuario_id, ocurrencias, proposito,
+                                                      commit=False)
+            if conflictos:
+                # No se creó ninguna reserva: se muestran los primeros choques para corregir el horario
+                lineas = [f"- {equipo}: {inicio} a {fin} (choca con {otro_inicio} a {otro_fin})"
+                          for equipo, inicio, fin, otro_inicio, otro_fin in conflictos[:15]]
+                if len(conflictos) > 15:
+                    lineas.append(f"... y {len(conflictos) - 15} más")
+                messagebox.showerror("Conflictos", "No se creó ninguna reserva. Horarios ocupados:\n" + "\n".join(lineas))
+                return
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Creó {creadas} reservas múltiples",
+                                  f"Equipos: {', '.join(str(i) for i in equipo_ids)}; {fecha_desde} a {fecha_hasta}, "
+                                  f"{hora_inicio}-{hora_fin}", commit=False)
+            self.conn.commit()
+        except ValueError as e:
+            messagebox.showwarning("Advertencia", str(e))
+            return
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            messagebox.showerror("Error", f"No se pudieron guardar las reservas: {e}")
+            return
+        
+        messagebox.showinfo("Éxito", f"{creadas} reservas creadas correctamente")
+        ventana.destroy()
+        self.actualizar_reservas()
+        if not self.servidor:
+            self.actualizar_estados_reservas()
+    
     def cancelar_reserva(self):
-        """Cancela la reserva seleccionada"""
+        """Cancela las reservas seleccionadas"""
         seleccion = self.tree_reservas.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione una reserva para cancelar")
             return
-            
-        reserva_id = self.tree_reservas.item(seleccion[0], 'values')[0]
-        estado = self.tree_reservas.item(seleccion[0], 'values')[6]
         
-        if estado != "Confirmada":
+        # Solo se consideran las reservas confirmadas de la selección
+        items = [item for item in seleccion if self.tree_reservas.item(item, 'values')[6] == "Confirmada"]
+        if not items:
             messagebox.showwarning("Advertencia", "Solo se pueden cancelar reservas confirmadas")
             return
-            
-        if messagebox.askyesno("Confirmar", "¿Cancelar esta reserva?"):
+        
+        ids = [self.tree_reservas.item(item, 'values')[0] for item in items]
+        mensaje = "¿Cancelar esta reserva?" if len(ids) == 1 else f"¿Cancelar las {len(ids)} reservas confirmadas seleccionadas?"
+        
+        if messagebox.askyesno("Confirmar", mensaje):
             try:
-                self.c.execute("UPDATE reservas SET estado = 'Cancelada' WHERE id = ?", (reserva_id,))
-                self.conn.commit()
+                self.c.executemany("UPDATE reservas SET estado = 'Cancelada' WHERE id = ?", [(i,) for i in ids])
                 
                 # Registrar en el historial de accesos
-                self.registrar_acceso(f"Canceló reserva ID: {reserva_id}")
+                self.registrar_acceso(f"Canceló {len(ids)} reserva(s)", f"Reservas: {', '.join(ids)}", commit=False)
+                self.conn.commit()
                 
-                messagebox.showinfo("Éxito", "Reserva cancelada")
-                self.actualizar_reservas()
+                self.actualizar_filas(self.tree_reservas, items, 6, "Cancelada", self.combo_estado_reserva.get(),
+                                      lambda valores: ())
+                messagebox.showinfo("Éxito", "Reserva(s) cancelada(s)")
             except sqlite3.Error as e:
+                self.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo cancelar la reserva: {e}")
     
     def exportar_reservas(self):
@@ -1938,6 +3032,125 @@ class SistemaGestionLaboratorio:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo exportar: {e}")
     
+    def inicializar_disponibilidad(self):
+        """Configura la subpestaña con el calendario semanal de ocupación de los equipos"""
+        # Lunes de la semana visible
+        hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.semana_disponibilidad = hoy - timedelta(days=hoy.weekday())
+        
+        # Frame para controles
+        frame_controles = ttk.Frame(self.frame_disponibilidad)
+        frame_controles.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Button(frame_controles, text="◀ Semana Anterior", 
+                   command=lambda: self.mover_semana_disponibilidad(-7)).pack(side='left', padx=5)
+        ttk.Button(frame_controles, text="Hoy", 
+                   command=lambda: self.mover_semana_disponibilidad(None)).pack(side='left', padx=5)
+        ttk.Button(frame_controles, text="Semana Siguiente ▶", 
+                   command=lambda: self.mover_semana_disponibilidad(7)).pack(side='left', padx=5)
+        
+        self.lbl_semana_disponibilidad = ttk.Label(frame_controles, text="", font=('Arial', 10, 'bold'))
+        self.lbl_semana_disponibilidad.pack(side='left', padx=15)
+        
+        btn_actualizar = ttk.Button(frame_controles, text="Actualizar", command=self.actualizar_disponibilidad)
+        btn_actualizar.pack(side='right', padx=5)
+        
+        self.combo_ubicacion_disponibilidad = ttk.Combobox(frame_controles, state='readonly')
+        self.combo_ubicacion_disponibilidad.pack(side='right', padx=5)
+        self.combo_ubicacion_disponibilidad.set("Todas")
+        self.combo_ubicacion_disponibilidad.bind("<<ComboboxSelected>>", lambda e: self.actualizar_disponibilidad())
+        ttk.Label(frame_controles, text="Ubicación:").pack(side='right')
+        
+        # Frame para la tabla: una fila por equipo y una columna por día
+        frame_tabla = ttk.Frame(self.frame_disponibilidad)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ["Equipo"] + [f"dia{i}" for i in range(7)]
+        self.tree_disponibilidad = ttk.Treeview(frame_tabla, columns=columns, show='headings')
+        self.tree_disponibilidad.heading("Equipo", text="Equipo")
+        self.tree_disponibilidad.column("Equipo", width=150)
+        for col in columns[1:]:
+            self.tree_disponibilidad.column(col, width=110, anchor='center')
+        self.tree_disponibilidad.tag_configure('ocupado', background='#ffffcc')
+        self.tree_disponibilidad.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=self.tree_disponibilidad.yview)
+        scrollbar.pack(side='right', fill='y')
+        self.tree_disponibilidad.configure(yscrollcommand=scrollbar.set)
+        
+        ttk.Label(self.frame_disponibilidad, text="Las celdas muestran las horas reservadas; \"Mant.\" indica un mantenimiento programado ese día.",
+                  foreground='gray').pack(anchor='w', padx=10, pady=(0, 5))
+        
+        # Se recarga al abrir la subpestaña para reflejar las reservas hechas en otras pestañas
+        self.notebook_gestion.bind("<<NotebookTabChanged>>", self.al_cambiar_subpestana_gestion, add='+')
+    
+    def al_cambiar_subpestana_gestion(self, event):
+        """Actualiza el calendario de disponibilidad cuando se muestra su subpestaña"""
+        if self.notebook_gestion.select() == str(self.frame_disponibilidad):
+            self.actualizar_disponibilidad()
+    
+    def mover_semana_disponibilidad(self, dias):
+        """Avanza o retrocede la semana visible; con None vuelve a la semana actual"""
+        if dias is None:
+            hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            self.semana_disponibilidad = hoy - timedelta(days=hoy.weekday())
+        else:
+            self.semana_disponibilidad += timedelta(days=dias)
+        self.actualizar_disponibilidad()
+    
+    def actualizar_disponibilidad(self):
+        """Carga la ocupación de la semana visible desde el índice de ocupación"""
+        dias = [self.semana_disponibilidad + timedelta(days=i) for i in range(7)]
+        nombres_dias = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+        for i, dia in enumerate(dias):
+            self.tree_disponibilidad.heading(f"dia{i}", text=f"{nombres_dias[i]} {dia.strftime('%d/%m')}")
+        self.lbl_semana_disponibilidad.config(
+            text=f"Semana del {dias[0].strftime('%d/%m/%Y')} al {dias[-1].strftime('%d/%m/%Y')}")
+        
+        try:
+            equipos = self.obtener_lista("equipos_calendario")
+            self.combo_ubicacion_disponibilidad['values'] = ["Todas"] + [u[0] for u in self.obtener_lista("ubicaciones_equipos")]
+            # Solo se leen los siete días visibles, no todas las reservas
+            ocupacion = db.leer_ocupacion(self.conn, dias[0].strftime("%Y-%m-%d"), dias[-1].strftime("%Y-%m-%d"))
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo cargar la disponibilidad: {e}")
+            return
+        
+        for item in self.tree_disponibilidad.get_children():
+            self.tree_disponibilidad.delete(item)
+        
+        ubicacion = self.combo_ubicacion_disponibilidad.get()
+        for equipo_id, nombre, ubicacion_equipo in equipos:
+            if ubicacion != "Todas" and ubicacion_equipo != ubicacion:
+                continue
+            celdas = []
+            for dia in dias:
+                ocupaciones = ocupacion.get((equipo_id, dia.strftime("%Y-%m-%d")), [])
+                celdas.append(self.texto_ocupacion(dia, ocupaciones))
+            ocupado = any(celda != "Libre" for celda in celdas)
+            self.tree_disponibilidad.insert('', 'end', values=[nombre] + celdas, tags=('ocupado',) if ocupado else ())
+    
+    def texto_ocupacion(self, dia, ocupaciones):
+        """Resume en una celda las reservas y mantenimientos de un equipo en un día"""
+        if not ocupaciones:
+            return "Libre"
+        inicio_dia = int(dia.timestamp())
+        fin_dia = int((dia + timedelta(days=1)).timestamp())
+        partes = []
+        for origen, origen_id, inicio_ts, fin_ts in ocupaciones:
+            if origen == "mantenimiento":
+                partes.append("Mant.")
+                continue
+            # Cada reserva se recorta al día mostrado
+            inicio = max(inicio_ts, inicio_dia)
+            fin = min(fin_ts, fin_dia)
+            if inicio == inicio_dia and fin == fin_dia:
+                partes.append("Todo el día")
+            else:
+                partes.append(f"{datetime.fromtimestamp(inicio).strftime('%H:%M')}-"
+                              f"{'24:00' if fin == fin_dia else datetime.fromtimestamp(fin).strftime('%H:%M')}")
+        return ", ".join(partes)
+    
     def inicializar_gestion_mantenimiento(self):
         """Configura la subpestaña de gestión de mantenimiento"""
         # Frame para controles
@@ -1953,12 +3166,23 @@ class SistemaGestionLaboratorio:
                                  command=self.registrar_mantenimiento)
         btn_registrar.pack(side='left', padx=5)
         
+        btn_planes = ttk.Button(frame_controles, text="Planes Recurrentes", command=self.gestionar_planes_mantenimiento)
+        btn_planes.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("gestionar_mantenimiento", btn_programar, btn_registrar, btn_planes)
+        
+        btn_costos = ttk.Button(frame_controles, text="Costos", command=self.mostrar_costos_mantenimiento)
+        btn_costos.pack(side='left', padx=5)
+        
         btn_actualizar = ttk.Button(frame_controles, text="Actualizar", command=self.actualizar_mantenimientos)
         btn_actualizar.pack(side='left', padx=5)
         
         btn_exportar = ttk.Button(frame_controles, text="Exportar", command=self.exportar_mantenimientos)
         btn_exportar.pack(side='left', padx=5)
         
+        # Resumen de vencimientos
+        self.lbl_vencimientos = ttk.Label(frame_controles, text="")
+        self.lbl_vencimientos.pack(side='right', padx=5)
+        
         # Frame para filtros
         frame_filtros = ttk.LabelFrame(self.frame_mantenimiento, text="Filtros", padding=5)
         frame_filtros.pack(fill='x', padx=10, pady=5)
@@ -1975,6 +3199,12 @@ class SistemaGestionLaboratorio:
         self.combo_estado_mantenimiento.set("Todos")
         self.combo_estado_mantenimiento.bind("<<ComboboxSelected>>", lambda e: self.actualizar_mantenimientos())
         
+        ttk.Label(frame_filtros, text="Vencimiento:").grid(row=0, column=4, padx=5, pady=2, sticky='e')
+        self.combo_vencimiento_mantenimiento = ttk.Combobox(frame_filtros, values=["Todos", "Vencidos", "Esta semana"], state='readonly')
+        self.combo_vencimiento_mantenimiento.grid(row=0, column=5, padx=5, pady=2, sticky='we')
+        self.combo_vencimiento_mantenimiento.set("Todos")
+        self.combo_vencimiento_mantenimiento.bind("<<ComboboxSelected>>", lambda e: self.actualizar_mantenimientos())
+        
         # Frame para la tabla de mantenimientos
         frame_tabla = ttk.Frame(self.frame_mantenimiento)
         frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
@@ -2002,13 +3232,16 @@ class SistemaGestionLaboratorio:
     def actualizar_mantenimientos(self):
         """Actualiza la tabla de mantenimientos con los datos de la base de datos"""
         try:
+            # Generar las ocurrencias de los planes recurrentes que entran en el horizonte
+            db.generar_mantenimientos_planificados(self.conn)
+            
             # Limpiar tabla
             for item in self.tree_mantenimientos.get_children():
                 self.tree_mantenimientos.delete(item)
             
             # Construir consulta con filtros
             query = """SELECT m.id, e.nombre, m.tipo, m.fecha_programada, 
-                        m.fecha_realizado, m.tecnico, m.estado 
+                        m.fecha_realizado, m.tecnico, m.estado, m.fecha_programada_ts 
                         FROM mantenimientos m 
                         JOIN equipos e ON m.equipo_id = e.id 
                         WHERE 1=1"""
@@ -2024,36 +3257,45 @@ class SistemaGestionLaboratorio:
                 query += " AND m.estado = ?"
                 params.append(estado)
             
-            query += " ORDER BY m.fecha_programada"
+            # Vencidos y de esta semana salen del índice parcial de pendientes, sin recorrer la tabla
+            vencimiento = self.combo_vencimiento_mantenimiento.get()
+            if vencimiento != "Todos":
+                desde, hasta = db.rango_vencimiento(vencimiento)
+                query += " AND m.estado = 'Pendiente' AND m.fecha_programada_ts >= ? AND m.fecha_programada_ts < ?"
+                params.extend([desde or 0, hasta])
+            
+            query += " ORDER BY m.fecha_programada_ts"
             
             # Obtener datos
             self.c.execute(query, params)
             mantenimientos = self.c.fetchall()
             
-            # Llenar tabla
+            # Llenar tabla resaltando los atrasados, pendientes y completados
+            self.tree_mantenimientos.tag_configure('atrasado', background='#ff9999')
+            self.tree_mantenimientos.tag_configure('pendiente', background='#ffff99')
+            self.tree_mantenimientos.tag_configure('completado', background='#ccffcc')
+            inicio_hoy = db.rango_vencimiento("Vencidos")[1]
             for mant in mantenimientos:
-                self.tree_mantenimientos.insert('', 'end', values=mant)
-                
-            # Resaltar mantenimientos
-            fecha_actual = datetime.now().strftime("%Y-%m-%d")
-            for item in self.tree_mantenimientos.get_children():
-                valores = self.tree_mantenimientos.item(item, 'values')
+                etiquetas = ()
+                if mant[6] == "Pendiente" and mant[7] is not None and mant[7] < inicio_hoy:
+                    etiquetas = ('atrasado',)
+                elif mant[6] == "Pendiente":
+                    etiquetas = ('pendiente',)
+                elif mant[6] == "Completado":
+                    etiquetas = ('completado',)
+                self.tree_mantenimientos.insert('', 'end', values=mant[:7], tags=etiquetas)
                 
-                if valores[6] == "Pendiente" and valores[3] < fecha_actual:
-                    self.tree_mantenimientos.tag_configure('atrasado', background='#ff9999')
-                    self.tree_mantenimientos.item(item, tags=('atrasado',))
-                elif valores[6] == "Pendiente":
-                    self.tree_mantenimientos.tag_configure('pendiente', background='#ffff99')
-                    self.tree_mantenimientos.item(item, tags=('pendiente',))
-                elif valores[6] == "Completado":
-                    self.tree_mantenimientos.tag_configure('completado', background='#ccffcc')
-                    self.tree_mantenimientos.item(item, tags=('completado',))
+            resumen = db.resumen_vencimientos(self.conn)
+            self.lbl_vencimientos.config(text=f"Vencidos: {resumen['Vencidos']}   Esta semana: {resumen['Esta semana']}",
+                                         foreground='red' if resumen['Vencidos'] else '')
                     
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar los mantenimientos: {e}")
     
     def programar_mantenimiento(self):
         """Abre ventana para programar mantenimiento"""
+        if not self.verificar_permiso("gestionar_mantenimiento"):
+            return
         ventana = tk.Toplevel(self.root)
         ventana.title("Programar Mantenimiento")
         ventana.geometry("500x400")
@@ -2072,57 +3314,361 @@ class SistemaGestionLaboratorio:
         frame_principal.pack(fill='both', expand=True)
         
         # Campos del formulario
-        ttk.Label(frame_principal, text="Equipo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        combo_equipo = ttk.Combobox(frame_principal, textvariable=self.var_equipo, state='readonly')
-        combo_equipo.grid(row=0, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Equipo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        combo_equipo = ttk.Combobox(frame_principal, textvariable=self.var_equipo)
+        combo_equipo.grid(row=0, column=1, padx=5, pady=5, sticky='we')
+        
+        # Cargar equipos
+        self.configurar_combo_ids(combo_equipo, self.obtener_lista("equipos"))
+        
+        ttk.Label(frame_principal, text="Tipo:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        combo_tipo = ttk.Combobox(frame_principal, textvariable=self.var_tipo, 
+                                 values=["Preventivo", "Correctivo", "Actualización", "Limpieza"], 
+                                 state='readonly')
+        combo_tipo.grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Fecha Programada:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=self.var_fecha_prog).grid(row=2, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Técnico:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=self.var_tecnico).grid(row=3, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Costo Estimado:").grid(row=4, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=self.var_costo).grid(row=4, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Descripción:").grid(row=5, column=0, padx=5, pady=5, sticky='ne')
+        text_desc = tk.Text(frame_principal, height=5, width=40, wrap='word')
+        text_desc.grid(row=5, column=1, padx=5, pady=5, sticky='we')
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_mantenimiento(
+            self.id_seleccionado(combo_equipo),
+            self.var_tipo.get(),
+            self.var_fecha_prog.get(),
+            None,  # fecha_realizado
+            text_desc.get("1.0", "end").strip(),
+            self.var_tecnico.get(),
+            "Pendiente",
+            self.var_costo.get(),
+            "",
+            ventana
+        ))
+        btn_guardar.pack(side='left', padx=5)
+        
+        btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana.destroy)
+        btn_cancelar.pack(side='left', padx=5)
+    
+    def mostrar_costos_mantenimiento(self):
+        """Muestra los costos de los mantenimientos realizados por equipo, tipo, mes, técnico y antigüedad"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Costos de Mantenimiento")
+        ventana.geometry("900x650")
+        
+        lbl_resumen = ttk.Label(ventana, text="", font=('Arial', 11, 'bold'))
+        lbl_resumen.pack(anchor='w', padx=10, pady=5)
+        
+        # Una pestaña por dimensión de los agregados
+        notebook = ttk.Notebook(ventana)
+        notebook.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        tablas = {}
+        for dimension, titulo in [("equipo", "Por Equipo"), ("tipo", "Por Tipo"), ("mes", "Por Mes"),
+                                  ("tecnico", "Por Técnico"), ("antiguedad", "Por Antigüedad (años)")]:
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=titulo)
+            columns = ("Valor", "Mantenimientos", "Costo Total", "Costo Promedio")
+            tree = ttk.Treeview(frame, columns=columns, show='headings', height=8)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=150, anchor='center')
+            tree.pack(side='left', fill='both', expand=True)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            scrollbar.pack(side='right', fill='y')
+            tree.configure(yscrollcommand=scrollbar.set)
+            tablas[dimension] = tree
+        
+        frame_grafico = ttk.Frame(ventana)
+        frame_grafico.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        def cargar():
+            try:
+                resumen = {dimension: db.resumen_costos(self.conn, dimension) for dimension in ["total"] + list(tablas)}
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"No se pudieron cargar los costos: {e}")
+                return
+            
+            if resumen["total"]:
+                _, cantidad, total, promedio = resumen["total"][0]
+                lbl_resumen.config(text=f"Mantenimientos realizados con costo: {cantidad}   Total: {total:.2f}   "
+                                        f"Promedio: {promedio:.2f}")
+            else:
+                lbl_resumen.config(text="Aún no hay mantenimientos completados con costo")
+            
+            for dimension, tree in tablas.items():
+                for item in tree.get_children():
+                    tree.delete(item)
+                for valor, cantidad, total, promedio in resumen[dimension]:
+                    tree.insert('', 'end', values=(valor or "(sin valor)", cantidad, f"{total:.2f}", f"{promedio:.2f}"))
+            
+            # Gráfico del costo de los últimos 12 meses con datos
+            for widget in frame_grafico.winfo_children():
+                widget.destroy()
+            meses = [(valor, total) for valor, _, total, _ in resumen["mes"] if valor][-12:]
+            fig, ax = plt.subplots(figsize=(8, 2.5))
+            ax.bar([mes for mes, _ in meses], [total for _, total in meses], color='#2196F3')
+            ax.set_ylabel('Costo')
+            ax.set_title('Costo de mantenimiento por mes')
+            ax.tick_params(axis='x', labelrotation=45)
+            fig.tight_layout()
+            canvas = FigureCanvasTkAgg(fig, master=frame_grafico)
+            canvas.draw()
+            canvas.get_tk_widget().pack(fill='both', expand=True)
+            plt.close(fig)
+        
+        def recalcular():
+            try:
+                db.recalcular_costos_mantenimiento(self.conn)
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"No se pudieron recalcular los costos: {e}")
+                return
+            cargar()
+        
+        # Los agregados se mantienen solos; recalcular solo hace falta si cambió la fecha de adquisición de un equipo
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(pady=5)
+        ttk.Button(frame_botones, text="Recalcular", command=recalcular).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Cerrar", command=ventana.destroy).pack(side='left', padx=5)
+        
+        cargar()
+    
+    def gestionar_planes_mantenimiento(self):
+        """Abre la ventana de planes de mantenimiento recurrentes"""
+        if not self.verificar_permiso("gestionar_mantenimiento"):
+            return
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Planes de Mantenimiento Recurrentes")
+        ventana.geometry("900x450")
+        ventana.grab_set()
+        
+        # Tabla de planes
+        frame_tabla = ttk.Frame(ventana)
+        frame_tabla.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        columns = ("ID", "Nombre", "Aplica a", "Tipo", "Cada (días)", "Desde", "Técnico", "Activo")
+        tree_planes = ttk.Treeview(frame_tabla, columns=columns, show='headings', selectmode='browse')
+        
+        for col in columns:
+            tree_planes.heading(col, text=col)
+            tree_planes.column(col, width=90, anchor='center')
+        
+        tree_planes.column("Nombre", width=180)
+        tree_planes.column("Aplica a", width=160)
+        tree_planes.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree_planes.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree_planes.configure(yscrollcommand=scrollbar.set)
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        ttk.Button(frame_botones, text="Nuevo Plan", 
+                   command=lambda: self.nuevo_plan_mantenimiento(tree_planes)).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Activar/Desactivar", 
+                   command=lambda: self.cambiar_estado_plan(tree_planes)).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Eliminar", 
+                   command=lambda: self.eliminar_plan(tree_planes)).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Cerrar", command=ventana.destroy).pack(side='right', padx=5)
+        
+        self.actualizar_planes(tree_planes)
+    
+    def actualizar_planes(self, tree_planes):
+        """Carga los planes de mantenimiento en la tabla"""
+        try:
+            for item in tree_planes.get_children():
+                tree_planes.delete(item)
+            
+            self.c.execute("""SELECT p.id, p.nombre, 
+                              COALESCE(e.nombre, 'Tipo: ' || p.tipo_equipo), 
+                              p.tipo, p.intervalo_dias, p.fecha_inicio, p.tecnico, 
+                              CASE WHEN p.activo THEN 'Sí' ELSE 'No' END 
+                              FROM planes_mantenimiento p 
+                              LEFT JOIN equipos e ON p.equipo_id = e.id 
+                              ORDER BY p.nombre""")
+            for plan in self.c.fetchall():
+                tree_planes.insert('', 'end', values=plan)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron cargar los planes: {e}")
+    
+    def nuevo_plan_mantenimiento(self, tree_planes):
+        """Abre ventana para crear un plan de mantenimiento recurrente"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Nuevo Plan de Mantenimiento")
+        ventana.geometry("500x450")
+        ventana.grab_set()
+        
+        # Variables
+        var_nombre = tk.StringVar()
+        var_tipo_equipo = tk.StringVar()
+        var_equipo = tk.StringVar()
+        var_tipo = tk.StringVar(value="Preventivo")
+        var_intervalo = tk.IntVar(value=90)
+        var_tecnico = tk.StringVar()
+        var_costo = tk.DoubleVar(value=0.0)
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        # Campos del formulario
+        ttk.Label(frame_principal, text="Nombre:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_nombre).grid(row=0, column=1, padx=5, pady=5, sticky='we')
         
-        # Cargar equipos
-        self.c.execute("SELECT id, nombre FROM equipos ORDER BY nombre")
-        equipos = self.c.fetchall()
-        combo_equipo['values'] = [f"{e[1]} (ID: {e[0]})" for e in equipos]
+        # El plan se aplica a todos los equipos de un tipo o a un equipo concreto
+        ttk.Label(frame_principal, text="Tipo de Equipo:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        ttk.Combobox(frame_principal, textvariable=var_tipo_equipo, 
+                     values=["", "Computadora", "Servidor", "Switch", "Router", "Impresora", "Otros"], 
+                     state='readonly').grid(row=1, column=1, padx=5, pady=5, sticky='we')
         
-        ttk.Label(frame_principal, text="Tipo:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-        combo_tipo = ttk.Combobox(frame_principal, textvariable=self.var_tipo, 
-                                 values=["Preventivo", "Correctivo", "Actualización", "Limpieza"], 
-                                 state='readonly')
-        combo_tipo.grid(row=1, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="o Equipo:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        combo_equipo = ttk.Combobox(frame_principal, textvariable=var_equipo)
+        combo_equipo.grid(row=2, column=1, padx=5, pady=5, sticky='we')
+        self.configurar_combo_ids(combo_equipo, self.obtener_lista("equipos"))
         
-        ttk.Label(frame_principal, text="Fecha Programada:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
-        ttk.Entry(frame_principal, textvariable=self.var_fecha_prog).grid(row=2, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Tipo:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+        ttk.Combobox(frame_principal, textvariable=var_tipo, 
+                     values=["Preventivo", "Correctivo", "Actualización", "Limpieza"], 
+                     state='readonly').grid(row=3, column=1, padx=5, pady=5, sticky='we')
         
-        ttk.Label(frame_principal, text="Técnico:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
-        ttk.Entry(frame_principal, textvariable=self.var_tecnico).grid(row=3, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Cada (días):").grid(row=4, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_intervalo).grid(row=4, column=1, padx=5, pady=5, sticky='we')
         
-        ttk.Label(frame_principal, text="Costo Estimado:").grid(row=4, column=0, padx=5, pady=5, sticky='e')
-        ttk.Entry(frame_principal, textvariable=self.var_costo).grid(row=4, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Primera Fecha:").grid(row=5, column=0, padx=5, pady=5, sticky='e')
+        entry_inicio = self.crear_campo_fecha(frame_principal, row=5, column=1)
+        entry_inicio.insert(0, datetime.now().strftime("%Y-%m-%d"))
         
-        ttk.Label(frame_principal, text="Descripción:").grid(row=5, column=0, padx=5, pady=5, sticky='ne')
-        text_desc = tk.Text(frame_principal, height=5, width=40, wrap='word')
-        text_desc.grid(row=5, column=1, padx=5, pady=5, sticky='we')
+        ttk.Label(frame_principal, text="Técnico:").grid(row=6, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_tecnico).grid(row=6, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Costo Estimado:").grid(row=7, column=0, padx=5, pady=5, sticky='e')
+        ttk.Entry(frame_principal, textvariable=var_costo).grid(row=7, column=1, padx=5, pady=5, sticky='we')
+        
+        ttk.Label(frame_principal, text="Descripción:").grid(row=8, column=0, padx=5, pady=5, sticky='ne')
+        text_desc = tk.Text(frame_principal, height=4, width=40, wrap='word')
+        text_desc.grid(row=8, column=1, padx=5, pady=5, sticky='we')
         
         # Botones
         frame_botones = ttk.Frame(ventana)
         frame_botones.pack(fill='x', padx=10, pady=10)
         
-        btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_mantenimiento(
-            self.var_equipo.get().split("(ID: ")[1].rstrip(")") if self.var_equipo.get() else None,
-            self.var_tipo.get(),
-            self.var_fecha_prog.get(),
-            None,  # fecha_realizado
+        btn_guardar = ttk.Button(frame_botones, text="Guardar", command=lambda: self.guardar_plan(
+            var_nombre.get().strip(),
+            var_tipo_equipo.get() or None,
+            self.id_seleccionado(combo_equipo),
+            var_tipo.get(),
+            var_intervalo,
+            entry_inicio.get(),
+            var_tecnico.get(),
+            var_costo,
             text_desc.get("1.0", "end").strip(),
-            self.var_tecnico.get(),
-            "Pendiente",
-            self.var_costo.get(),
-            "",
-            ventana
+            ventana,
+            tree_planes
         ))
         btn_guardar.pack(side='left', padx=5)
         
         btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana.destroy)
         btn_cancelar.pack(side='left', padx=5)
     
+    def guardar_plan(self, nombre, tipo_equipo, equipo_id, tipo, var_intervalo, fecha_inicio, tecnico, var_costo, descripcion, ventana, tree_planes):
+        """Guarda un plan de mantenimiento recurrente y genera sus primeras ocurrencias"""
+        if not nombre:
+            messagebox.showwarning("Advertencia", "El nombre del plan es obligatorio")
+            return
+        if not tipo_equipo and not equipo_id:
+            messagebox.showwarning("Advertencia", "Seleccione un tipo de equipo o un equipo")
+            return
+        try:
+            intervalo = int(var_intervalo.get())
+            costo = float(var_costo.get())
+        except (ValueError, tk.TclError):
+            messagebox.showwarning("Advertencia", "El intervalo y el costo deben ser numéricos")
+            return
+        if intervalo < 1:
+            messagebox.showwarning("Advertencia", "El intervalo debe ser de al menos un día")
+            return
+        fecha_inicio = normalizar_fecha(fecha_inicio)
+        if fecha_inicio is None:
+            messagebox.showwarning("Advertencia", "La primera fecha no es válida (use AAAA-MM-DD)")
+            return
+        
+        try:
+            self.c.execute("""INSERT INTO planes_mantenimiento 
+                              (nombre, equipo_id, tipo_equipo, tipo, intervalo_dias, fecha_inicio, tecnico, costo, descripcion) 
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                          (nombre, equipo_id, None if equipo_id else tipo_equipo, tipo, intervalo, 
+                           fecha_inicio, tecnico, costo, descripcion))
+            self.conn.commit()
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Creó plan de mantenimiento: {nombre}")
+            
+            messagebox.showinfo("Éxito", "Plan de mantenimiento creado")
+            ventana.destroy()
+            self.actualizar_planes(tree_planes)
+            self.actualizar_mantenimientos()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo guardar el plan: {e}")
+    
+    def cambiar_estado_plan(self, tree_planes):
+        """Activa o desactiva el plan seleccionado"""
+        seleccion = tree_planes.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Seleccione un plan")
+            return
+        
+        plan_id, nombre = tree_planes.item(seleccion[0], 'values')[:2]
+        try:
+            self.c.execute("UPDATE planes_mantenimiento SET activo = NOT activo WHERE id = ?", (plan_id,))
+            self.conn.commit()
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Cambió estado del plan de mantenimiento: {nombre}")
+            
+            self.actualizar_planes(tree_planes)
+            self.actualizar_mantenimientos()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo actualizar el plan: {e}")
+    
+    def eliminar_plan(self, tree_planes):
+        """Elimina el plan seleccionado; los mantenimientos ya generados se conservan"""
+        seleccion = tree_planes.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Seleccione un plan")
+            return
+        
+        plan_id, nombre = tree_planes.item(seleccion[0], 'values')[:2]
+        if not messagebox.askyesno("Confirmar", f"¿Eliminar el plan '{nombre}'?\nLos mantenimientos ya generados se conservarán."):
+            return
+        
+        try:
+            self.c.execute("DELETE FROM planes_mantenimiento WHERE id = ?", (plan_id,))
+            self.conn.commit()
+            
+            # Registrar en el historial de accesos
+            self.registrar_acceso(f"Eliminó plan de mantenimiento: {nombre}")
+            
+            self.actualizar_planes(tree_planes)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo eliminar el plan: {e}")
+    
     def registrar_mantenimiento(self):
         """Abre ventana para registrar mantenimiento realizado"""
+        if not self.verificar_permiso("gestionar_mantenimiento"):
+            return
         seleccion = self.tree_mantenimientos.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un mantenimiento para registrar")
@@ -2184,6 +3730,15 @@ class SistemaGestionLaboratorio:
         if not fecha_prog:
             messagebox.showwarning("Advertencia", "La fecha programada es obligatoria")
             return
+        fecha_prog = normalizar_fecha(fecha_prog)
+        if fecha_prog is None:
+            messagebox.showwarning("Advertencia", "La fecha programada no es válida (use AAAA-MM-DD)")
+            return
+        if fecha_real:
+            fecha_real = normalizar_fecha(fecha_real)
+            if fecha_real is None:
+                messagebox.showwarning("Advertencia", "La fecha de realización no es válida (use AAAA-MM-DD)")
+                return
             
         try:
             # Insertar mantenimiento
@@ -2215,6 +3770,10 @@ class SistemaGestionLaboratorio:
         if not fecha_real:
             messagebox.showwarning("Advertencia", "La fecha de realización es obligatoria")
             return
+        fecha_real = normalizar_fecha(fecha_real)
+        if fecha_real is None:
+            messagebox.showwarning("Advertencia", "La fecha de realización no es válida (use AAAA-MM-DD)")
+            return
             
         try:
             # Obtener equipo_id para actualizar la fecha de último mantenimiento
@@ -2327,12 +3886,25 @@ class SistemaGestionLaboratorio:
         self.entry_responsable = ttk.Entry(frame_general)
         self.entry_responsable.grid(row=2, column=1, padx=5, pady=5, sticky='we')
         
+        # Archivo de registros antiguos
+        frame_archivo = ttk.LabelFrame(frame_principal, text="Archivo de Datos", padding=10)
+        frame_archivo.pack(fill='x', pady=5)
+        
+        ttk.Label(frame_archivo, text="Archivar registros cerrados con más de (días):").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        self.var_dias_archivo = tk.IntVar(value=365)
+        ttk.Spinbox(frame_archivo, textvariable=self.var_dias_archivo, from_=30, to=3650).grid(row=0, column=1, padx=5, pady=5, sticky='we')
+        
+        btn_archivar = ttk.Button(frame_archivo, text="Archivar Ahora", command=self.archivar_ahora)
+        btn_archivar.grid(row=0, column=2, padx=5, pady=5)
+        self.ocultar_sin_permiso("administrar_sistema", btn_archivar)
+        
         # Botones
         frame_botones = ttk.Frame(frame_principal)
         frame_botones.pack(fill='x', pady=10)
         
         btn_guardar = ttk.Button(frame_botones, text="Guardar Configuración", command=self.guardar_configuracion)
         btn_guardar.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("administrar_sistema", btn_guardar)
         
         btn_cargar = ttk.Button(frame_botones, text="Cargar Configuración", command=self.cargar_configuracion)
         btn_cargar.pack(side='left', padx=5)
@@ -2369,11 +3941,16 @@ class SistemaGestionLaboratorio:
             self.entry_responsable.delete(0, 'end')
             self.entry_responsable.insert(0, "Ing. Juan Pérez")
             
+            # Horizonte de archivo (guardado en la tabla de configuración)
+            self.var_dias_archivo.set(int(self.leer_configuracion('dias_archivo', 365)))
+        
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo cargar la configuración: {e}")
     
     def guardar_configuracion(self):
         """Guarda la configuración del laboratorio"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
         try:
             # En una implementación real, esto guardaría en una tabla de configuración
             ip = self.entry_ip.get()
@@ -2389,7 +3966,12 @@ class SistemaGestionLaboratorio:
             if not nombre or not responsable:
                 messagebox.showwarning("Advertencia", "Nombre del laboratorio y responsable son obligatorios")
                 return
-                
+            
+            dias_archivo = self.leer_dias_archivo()
+            if dias_archivo is None:
+                return
+            self.guardar_valor_configuracion('dias_archivo', dias_archivo)
+            
             # Registrar en el historial de accesos
             self.registrar_acceso("Actualizó configuración del laboratorio")
             
@@ -2400,18 +3982,21 @@ class SistemaGestionLaboratorio:
     def crear_estadisticas_laboratorio(self, frame):
         """Crea gráficos estadísticos del laboratorio"""
         try:
-            # Obtener datos para gráficos
-            self.c.execute("SELECT estado, COUNT(*) FROM equipos GROUP BY estado")
-            estados_equipos = self.c.fetchall()
+            # Obtener datos para gráficos (de la caché en disco si sus tablas no cambiaron)
+            consultar = self.cache_consultas.consultar
+            estados_equipos = consultar(self.conn, "SELECT estado, COUNT(*) FROM equipos GROUP BY estado", tablas=["equipos"])
             
-            self.c.execute("SELECT tipo, COUNT(*) FROM reportes GROUP BY tipo")
-            tipos_reportes = self.c.fetchall()
+            tipos_reportes = consultar(self.conn, "SELECT tipo, COUNT(*) FROM reportes GROUP BY tipo", tablas=["reportes"])
             
-            self.c.execute("SELECT strftime('%Y-%m', fecha) as mes, COUNT(*) FROM reportes GROUP BY mes ORDER BY mes")
-            reportes_por_mes = self.c.fetchall()
+            # Desde el inicio del día, para que la consulta se repita igual durante todo el día
+            hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            desde = int((hoy - timedelta(days=365)).timestamp())
+            reportes_por_mes = consultar(self.conn, """SELECT strftime('%Y-%m', fecha_ts, 'unixepoch', 'localtime') as mes, COUNT(*) 
+                                                      FROM reportes WHERE fecha_ts >= ? GROUP BY mes ORDER BY mes""",
+                                         (desde,), tablas=["reportes"])
             
-            self.c.execute("SELECT estado, COUNT(*) FROM mantenimientos GROUP BY estado")
-            estados_mantenimientos = self.c.fetchall()
+            estados_mantenimientos = consultar(self.conn, "SELECT estado, COUNT(*) FROM mantenimientos GROUP BY estado",
+                                               tablas=["mantenimientos"])
             
             # Crear figura con subplots
             fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 8))
@@ -2495,6 +4080,7 @@ class SistemaGestionLaboratorio:
         
         btn_eliminar = ttk.Button(frame_controles, text="Eliminar", command=self.eliminar_usuario)
         btn_eliminar.pack(side='left', padx=5)
+        self.ocultar_sin_permiso("gestionar_usuarios", btn_agregar, btn_editar, btn_eliminar)
         
         btn_actualizar = ttk.Button(frame_controles, text="Actualizar", command=self.actualizar_usuarios)
         btn_actualizar.pack(side='left', padx=5)
@@ -2525,12 +4111,17 @@ class SistemaGestionLaboratorio:
         frame_historial = ttk.LabelFrame(self.frame_usuarios, text="Historial de Accesos", padding=10)
         frame_historial.pack(fill='both', expand=True, padx=10, pady=5)
         
+        self.var_archivados_historial = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_historial, text="Incluir archivados", variable=self.var_archivados_historial,
+                        command=self.actualizar_historial_accesos).pack(anchor='w')
+        
         # Tabla de historial
         columns_historial = ("ID", "Usuario", "Fecha/Hora", "Acción", "Detalles")
         self.tree_historial = ttk.Treeview(frame_historial, columns=columns_historial, show='headings', selectmode='browse')
         
-        for col in columns_historial:
-            self.tree_historial.heading(col, text=col)
+        for posicion, col in enumerate(columns_historial):
+            self.tree_historial.heading(col, text=col,
+                                        command=lambda p=posicion: self.ordenar_tabla(self.tree_historial, p))
             self.tree_historial.column(col, width=100, anchor='center')
         
         self.tree_historial.column("Usuario", width=120)
@@ -2542,7 +4133,7 @@ class SistemaGestionLaboratorio:
         # Scrollbar
         scrollbar_hist = ttk.Scrollbar(frame_historial, orient="vertical", command=self.tree_historial.yview)
         scrollbar_hist.pack(side='right', fill='y')
-        self.tree_historial.configure(yscrollcommand=scrollbar_hist.set)
+        self.configurar_desplazamiento(self.tree_historial, scrollbar_hist)
         
         # Cargar datos iniciales
         self.actualizar_usuarios()
@@ -2575,6 +4166,8 @@ class SistemaGestionLaboratorio:
     
     def agregar_usuario(self):
         """Abre ventana para agregar nuevo usuario"""
+        if not self.verificar_permiso("gestionar_usuarios"):
+            return
         ventana = tk.Toplevel(self.root)
         ventana.title("Agregar Usuario")
         ventana.geometry("400x400")
@@ -2640,17 +4233,32 @@ class SistemaGestionLaboratorio:
     
     def guardar_usuario(self, nombre, apellido, email, rol, usuario, contrasena, estado, ventana):
         """Guarda un nuevo usuario en la base de datos"""
+        if not self.verificar_permiso("gestionar_usuarios"):
+            return
         if not nombre or not usuario or not contrasena:
             messagebox.showwarning("Advertencia", "Nombre, usuario y contraseña son obligatorios")
             return
-            
+        
+        # El hash se calcula en un hilo de fondo y el usuario se guarda al terminar, en el hilo de la interfaz
+        def al_terminar(correcto, valor):
+            ventana.config(cursor="")
+            if not correcto:
+                messagebox.showerror("Error", f"No se pudo guardar el usuario: {valor}")
+            elif ventana.winfo_exists():
+                self.insertar_usuario(nombre, apellido, email, rol, usuario, valor, estado, ventana)
+        
+        ventana.config(cursor="watch")
+        self.ejecutar_en_hilo(lambda: auth.generar_hash(contrasena), al_terminar)
+    
+    def insertar_usuario(self, nombre, apellido, email, rol, usuario, hash_contrasena, estado, ventana):
+        """Inserta un nuevo usuario con la contraseña ya convertida en hash"""
         try:
             fecha_registro = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
             self.c.execute("""INSERT INTO usuarios 
                               (nombre, apellido, email, rol, usuario, contrasena, estado, fecha_registro) 
                               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                          (nombre, apellido, email, rol, usuario, contrasena, estado, fecha_registro))
+                          (nombre, apellido, email, rol, usuario, hash_contrasena, estado, fecha_registro))
             self.conn.commit()
             
             # Registrar en el historial de accesos
@@ -2670,6 +4278,8 @@ class SistemaGestionLaboratorio:
     
     def editar_usuario(self):
         """Abre ventana para editar usuario seleccionado"""
+        if not self.verificar_permiso("gestionar_usuarios"):
+            return
         seleccion = self.tree_usuarios.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un usuario para editar")
@@ -2750,18 +4360,36 @@ class SistemaGestionLaboratorio:
     
     def actualizar_usuario(self, usuario_id, nombre, apellido, email, rol, contrasena, estado, ventana):
         """Actualiza un usuario en la base de datos"""
+        if not self.verificar_permiso("gestionar_usuarios"):
+            return
         if not nombre:
             messagebox.showwarning("Advertencia", "El nombre es obligatorio")
             return
-            
+        
+        if contrasena:
+            # La nueva contraseña se convierte en hash en un hilo de fondo antes de guardar
+            def al_terminar(correcto, valor):
+                ventana.config(cursor="")
+                if not correcto:
+                    messagebox.showerror("Error", f"No se pudo actualizar el usuario: {valor}")
+                elif ventana.winfo_exists():
+                    self.guardar_cambios_usuario(usuario_id, nombre, apellido, email, rol, valor, estado, ventana)
+            
+            ventana.config(cursor="watch")
+            self.ejecutar_en_hilo(lambda: auth.generar_hash(contrasena), al_terminar)
+        else:
+            self.guardar_cambios_usuario(usuario_id, nombre, apellido, email, rol, None, estado, ventana)
+    
+    def guardar_cambios_usuario(self, usuario_id, nombre, apellido, email, rol, hash_contrasena, estado, ventana):
+        """Guarda los datos editados de un usuario; la contraseña solo cambia si se indica su hash"""
         try:
-            if contrasena:
+            if hash_contrasena:
                 # Actualizar con nueva contraseña
                 self.c.execute("""UPDATE usuarios SET 
                                   nombre = ?, apellido = ?, email = ?, rol = ?, 
                                   contrasena = ?, estado = ? 
                                   WHERE id = ?""",
-                              (nombre, apellido, email, rol, contrasena, estado, usuario_id))
+                              (nombre, apellido, email, rol, hash_contrasena, estado, usuario_id))
             else:
                 # Actualizar sin cambiar contraseña
                 self.c.execute("""UPDATE usuarios SET 
@@ -2786,6 +4414,8 @@ class SistemaGestionLaboratorio:
     
     def eliminar_usuario(self):
         """Elimina el usuario seleccionado"""
+        if not self.verificar_permiso("gestionar_usuarios"):
+            return
         seleccion = self.tree_usuarios.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione un usuario para eliminar")
@@ -2794,8 +4424,8 @@ class SistemaGestionLaboratorio:
         usuario_id = self.tree_usuarios.item(seleccion[0], 'values')[0]
         usuario_nombre = self.tree_usuarios.item(seleccion[0], 'values')[1]
         
-        # Verificar si es el usuario actual
-        if usuario_id == 1:  # Suponiendo que el admin tiene ID 1
+        # El administrador principal no se puede eliminar
+        if str(usuario_id) == str(db.id_administrador(self.conn)):
             messagebox.showerror("Error", "No se puede eliminar al usuario administrador principal")
             return
             
@@ -2809,55 +4439,585 @@ class SistemaGestionLaboratorio:
                 
                 messagebox.showinfo("Éxito", "Usuario eliminado")
                 self.actualizar_usuarios()
+            except sqlite3.IntegrityError:
+                self.conn.rollback()
+                messagebox.showerror("Error", "El usuario tiene reservas asociadas.\nMárquelo como Inactivo en lugar de eliminarlo.")
             except sqlite3.Error as e:
                 messagebox.showerror("Error", f"No se pudo eliminar el usuario: {e}")
     
     def actualizar_historial_accesos(self):
         """Actualiza la tabla de historial de accesos"""
         try:
-            # Limpiar tabla
-            for item in self.tree_historial.get_children():
-                self.tree_historial.delete(item)
-            
-            # Obtener datos
-            self.c.execute("""SELECT a.id, u.nombre, a.fecha_hora, a.accion, a.detalles 
-                              FROM accesos a 
-                              JOIN usuarios u ON a.usuario_id = u.id 
-                              ORDER BY a.fecha_hora DESC 
-                              LIMIT 100""")
-            accesos = self.c.fetchall()
+            # Obtener datos (la vista accesos_todos incluye los archivados) sin límite al incluir
+            # los archivados: se guardan por columnas y la tabla los muestra a medida que se desplaza
+            if self.var_archivados_historial.get():
+                tabla, limite = "accesos_todos", -1
+            else:
+                tabla, limite = "accesos", 100
+            accesos = self.consultar_tabla_columnar(f"""SELECT a.id, u.nombre, a.fecha_hora, a.accion, a.detalles 
+                              FROM {tabla} a 
+                              LEFT JOIN usuarios u ON a.usuario_id = u.id 
+                              ORDER BY a.fecha_hora_ts DESC 
+                              LIMIT ?""", (limite,), ["id", "usuario", "fecha_hora", "accion", "detalles"],
+                                                    ["usuario", "accion"])
             
             # Llenar tabla
-            for acceso in accesos:
-                self.tree_historial.insert('', 'end', values=acceso)
+            self.mostrar_filas_columnares(self.tree_historial, accesos)
                 
         except sqlite3.Error as e:
             messagebox.showerror("Error", f"No se pudo cargar el historial: {e}")
     
-    def registrar_acceso(self, accion, detalles=None):
+    def registrar_acceso(self, accion, detalles=None, commit=True):
         """Registra una acción en el historial de accesos"""
+        usuario_id = self.sesion.usuario_id if self.sesion else None
+        if commit:
+            try:
+                db.registrar_acceso(self.conn, accion, detalles, usuario_id)
+            except sqlite3.Error:
+                # La acción ya se confirmó; no se interrumpe al usuario por el historial
+                self.conn.rollback()
+                return
+        else:
+            # La entrada queda en la transacción en curso (operaciones en lote): si falla, el error llega al
+            # llamador, que deshace la operación completa en lugar de confirmarla sin su registro
+            db.registrar_acceso(self.conn, accion, detalles, usuario_id, commit=False)
+        
+        # Actualizar el historial si estamos en la pestaña de usuarios
+        if self.notebook.index(self.notebook.select()) == 3:  # Índice de pestaña de usuarios
+            self.actualizar_historial_accesos()
+    
+    # ------------------------- Funciones generales -------------------------
+    def crear_campo_fecha(self, parent, row, column, padx=5, pady=5):
+        """Crea un campo de fecha con un botón que abre el calendario y devuelve el Entry"""
+        frame = ttk.Frame(parent)
+        frame.grid(row=row, column=column, padx=padx, pady=pady, sticky='we')
+        
+        entry = ttk.Entry(frame, width=12)
+        entry.pack(side='left', fill='x', expand=True)
+        ttk.Button(frame, text="📅", width=3, command=lambda: self.abrir_calendario(entry)).pack(side='left', padx=(2, 0))
+        return entry
+    
+    def abrir_calendario(self, entry):
+        """Muestra un calendario mensual y escribe la fecha elegida en el campo"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Seleccionar fecha")
+        ventana.resizable(False, False)
+        ventana.transient(self.root)
+        ventana.grab_set()
+        
+        # Se parte del mes de la fecha ya escrita, o del mes actual
+        actual = parsear_fecha(entry.get()) or datetime.now()
+        mes = {'anio': actual.year, 'mes': actual.month}
+        
+        frame_cabecera = ttk.Frame(ventana)
+        frame_cabecera.pack(fill='x', padx=5, pady=5)
+        frame_dias = ttk.Frame(ventana)
+        frame_dias.pack(padx=5, pady=5)
+        lbl_mes = ttk.Label(frame_cabecera, anchor='center', font=('Arial', 10, 'bold'))
+        
+        def elegir(dia):
+            entry.delete(0, 'end')
+            entry.insert(0, f"{mes['anio']:04d}-{mes['mes']:02d}-{dia:02d}")
+            ventana.destroy()
+        
+        def dibujar():
+            for widget in frame_dias.winfo_children():
+                widget.destroy()
+            lbl_mes.config(text=f"{mes['mes']:02d}/{mes['anio']}")
+            for col, nombre in enumerate(["Lu", "Ma", "Mi", "Ju", "Vi", "Sá", "Do"]):
+                ttk.Label(frame_dias, text=nombre, width=4, anchor='center').grid(row=0, column=col)
+            for fila, semana in enumerate(calendar.monthcalendar(mes['anio'], mes['mes']), start=1):
+                for col, dia in enumerate(semana):
+                    if dia:
+                        ttk.Button(frame_dias, text=str(dia), width=4,
+                                   command=lambda d=dia: elegir(d)).grid(row=fila, column=col)
+        
+        def mover(delta):
+            indice = mes['anio'] * 12 + mes['mes'] - 1 + delta
+            mes['anio'], mes['mes'] = divmod(indice, 12)
+            mes['mes'] += 1
+            dibujar()
+        
+        ttk.Button(frame_cabecera, text="<", width=3, command=lambda: mover(-1)).pack(side='left')
+        ttk.Button(frame_cabecera, text=">", width=3, command=lambda: mover(1)).pack(side='right')
+        lbl_mes.pack(side='left', fill='x', expand=True)
+        dibujar()
+    
+    def obtener_lista(self, clave):
+        """Devuelve las filas de una lista de LISTAS_CACHE, consultando la base solo si cambiaron los datos"""
+        tabla, consulta = LISTAS_CACHE[clave]
+        # La versión la incrementan los triggers de la tabla en cada escritura, venga de donde venga
+        version = db.leer_version_datos(self.conn, tabla)
+        
+        guardada = self.cache_listas.get(clave)
+        if guardada is not None and guardada[0] == version:
+            return guardada[1]
+        
+        self.c.execute(consulta)
+        filas = self.c.fetchall()
+        self.cache_listas[clave] = (version, filas)
+        return filas
+    
+    def configurar_combo_ids(self, combo, filas):
+        """Carga un combobox con filas (id, nombre) y filtra las opciones mientras se escribe"""
+        # Los nombres repetidos se distinguen con el ID para que cada texto corresponda a un solo registro
+        conteo = {}
+        for _, nombre in filas:
+            conteo[nombre] = conteo.get(nombre, 0) + 1
+        combo.ids = {}
+        for id_fila, nombre in filas:
+            texto = nombre if conteo[nombre] == 1 else f"{nombre} (ID: {id_fila})"
+            combo.ids[texto] = id_fila
+        combo.textos = list(combo.ids)
+        combo['values'] = combo.textos
+        combo.bind('<KeyRelease>', lambda e: self.filtrar_combo_ids(combo, e))
+    
+    def filtrar_combo_ids(self, combo, event):
+        """Deja en el combobox solo las opciones que contienen el texto escrito"""
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        texto = combo.get().strip().lower()
+        combo['values'] = [t for t in combo.textos if texto in t.lower()] if texto else combo.textos
+    
+    def id_seleccionado(self, combo):
+        """Devuelve el ID de la opción elegida en un combobox de configurar_combo_ids, o None"""
+        return combo.ids.get(combo.get().strip())
+    
+    def leer_configuracion(self, clave, defecto=None):
+        """Devuelve un valor guardado en la tabla de configuración"""
+        return db.leer_configuracion(self.conn, clave, defecto)
+    
+    def guardar_valor_configuracion(self, clave, valor):
+        """Guarda un valor en la tabla de configuración"""
+        db.guardar_valor_configuracion(self.conn, clave, valor)
+    
+    def archivar_registros(self):
+        """Mueve a las tablas de archivo los registros cerrados más antiguos que el horizonte configurado"""
+        return db.archivar_registros(self.conn)
+    
+    def leer_dias_archivo(self):
+        """Valida y devuelve el horizonte de archivo indicado en la configuración"""
         try:
-            usuario_id = 1  # En una aplicación real, obtendríamos el ID del usuario actual
-            fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            if detalles is None:
-                detalles = accion
-            
-            self.c.execute("""INSERT INTO accesos 
-                              (usuario_id, fecha_hora, accion, detalles) 
-                              VALUES (?, ?, ?, ?)""",
-                          (usuario_id, fecha_hora, accion, detalles))
+            dias_archivo = int(self.var_dias_archivo.get())
+        except (ValueError, tk.TclError):
+            dias_archivo = 0
+        if dias_archivo < 1:
+            messagebox.showwarning("Advertencia", "Los días de archivo deben ser un número entero positivo")
+            return None
+        return dias_archivo
+    
+    def archivar_ahora(self):
+        """Guarda el horizonte indicado y archiva inmediatamente los registros antiguos"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
+        dias_archivo = self.leer_dias_archivo()
+        if dias_archivo is None:
+            return
+        
+        try:
+            self.guardar_valor_configuracion('dias_archivo', dias_archivo)
+            movidos = self.archivar_registros()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron archivar los registros: {e}")
+            return
+        
+        self.registrar_acceso("Archivó registros antiguos",
+                              ", ".join(f"{tabla}: {cantidad}" for tabla, cantidad in movidos.items()))
+        self.recargar_tras_archivado(movidos)
+        messagebox.showinfo("Éxito", "Registros archivados:\n" +
+                            "\n".join(f"- {tabla}: {cantidad}" for tabla, cantidad in movidos.items()))
+    
+    def ejecutar_en_hilo(self, funcion, al_terminar):
+        """Ejecuta una función sin base de datos en un hilo de fondo y llama a al_terminar(correcto, valor) al acabar"""
+        resultado = queue.Queue()
+        
+        def ejecutar():
+            try:
+                resultado.put((True, funcion()))
+            except Exception as e:
+                resultado.put((False, e))
+        
+        threading.Thread(target=ejecutar, daemon=True).start()
+        self.esperar_hilo(resultado, al_terminar)
+    
+    def esperar_hilo(self, resultado, al_terminar):
+        """Revisa si terminó una tarea de fondo; al_terminar se ejecuta en el hilo de la interfaz"""
+        try:
+            correcto, valor = resultado.get_nowait()
+        except queue.Empty:
+            self.root.after(INTERVALO_HILO_MS, self.esperar_hilo, resultado, al_terminar)
+            return
+        al_terminar(correcto, valor)
+    
+    def archivar_periodicamente(self):
+        """Archiva los registros antiguos en segundo plano y vuelve a programarse"""
+        try:
+            movidos = self.archivar_registros()
+            self.recargar_tras_archivado(movidos)
+        except sqlite3.Error as e:
+            print(f"Error al archivar registros: {e}")  # Se reintentará en el próximo ciclo
+        
+        self.root.after(INTERVALO_ARCHIVO_MS, self.archivar_periodicamente)
+    
+    def generar_informes_periodicamente(self):
+        """Escribe en segundo plano los informes programados pendientes y vuelve a programarse"""
+        # Las consultas se hacen aquí, en el hilo dueño de la conexión; solo la escritura de archivos va al hilo
+        try:
+            trabajos = informes.preparar_programados(self.conn, self.cache_informes)
+        except sqlite3.Error as e:
+            print(f"Error al generar informes programados: {e}")  # Se reintentará en el próximo ciclo
+            trabajos = []
+        
+        def al_terminar(correcto, resultados):
+            if not correcto:
+                print(f"Error al generar informes programados: {resultados}")
+                return
+            for programa_id, error in resultados.items():
+                if error:
+                    print(f"Error al generar el informe programado {programa_id}: {error}")
+            try:
+                informes.marcar_ejecutados(self.conn, resultados)
+            except sqlite3.Error as e:
+                print(f"Error al marcar informes programados: {e}")
+        
+        if trabajos:
+            self.ejecutar_en_hilo(lambda: informes.escribir_programados(trabajos), al_terminar)
+        self.root.after(INTERVALO_INFORMES_MS, self.generar_informes_periodicamente)
+    
+    def actualizar_estados_reservas(self):
+        """Aplica los cambios de estado de reservas pendientes y se programa para el próximo inicio o fin"""
+        if self.tarea_estados_reservas is not None:
+            self.root.after_cancel(self.tarea_estados_reservas)
+        
+        espera = db.MAXIMA_ESPERA_ESTADOS_S
+        try:
+            cambios = db.actualizar_estados_reservas(self.conn)
+            if any(cambios.values()) and hasattr(self, 'tree_reservas'):
+                self.actualizar_reservas()
+            espera = db.segundos_hasta_cambio_reservas(self.conn)
+        except sqlite3.Error as e:
+            print(f"Error al actualizar estados de reservas: {e}")  # Se reintentará en el próximo ciclo
+        
+        self.tarea_estados_reservas = self.root.after(espera * 1000, self.actualizar_estados_reservas)
+    
+    def recargar_tras_archivado(self, movidos):
+        """Recarga solo las tablas visibles que perdieron filas al archivar"""
+        if movidos.get("reportes"):
+            self.buscar_reportes()
+        if movidos.get("reservas"):
+            self.actualizar_reservas()
+        if movidos.get("accesos"):
+            self.actualizar_historial_accesos()
+    
+    def pedir_valor_lote(self, titulo, etiqueta, valores, accion, editable=False):
+        """Abre un diálogo para elegir el valor que se aplicará a varias filas seleccionadas"""
+        ventana = tk.Toplevel(self.root)
+        ventana.title(titulo)
+        ventana.geometry("450x150")
+        ventana.grab_set()
+        
+        # Frame principal
+        frame_principal = ttk.Frame(ventana, padding=10)
+        frame_principal.pack(fill='both', expand=True)
+        
+        var_valor = tk.StringVar(value=valores[0] if valores else "")
+        
+        ttk.Label(frame_principal, text=etiqueta).grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        combo_valor = ttk.Combobox(frame_principal, textvariable=var_valor, values=valores,
+                                   state='normal' if editable else 'readonly')
+        combo_valor.grid(row=0, column=1, padx=5, pady=5, sticky='we')
+        
+        # Botones
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(fill='x', padx=10, pady=10)
+        
+        btn_aplicar = ttk.Button(frame_botones, text="Aplicar",
+                                 command=lambda: self.aplicar_valor_lote(var_valor.get().strip(), accion, ventana))
+        btn_aplicar.pack(side='left', padx=5)
+        
+        btn_cancelar = ttk.Button(frame_botones, text="Cancelar", command=ventana.destroy)
+        btn_cancelar.pack(side='left', padx=5)
+    
+    def aplicar_valor_lote(self, valor, accion, ventana):
+        """Cierra el diálogo de lote y ejecuta la acción con el valor elegido"""
+        if not valor:
+            messagebox.showwarning("Advertencia", "Seleccione un valor")
+            return
+        
+        ventana.destroy()
+        accion(valor)
+    
+    def actualizar_filas(self, tree, items, columna, valor, filtro, etiquetar=None):
+        """Actualiza en sitio las filas modificadas en lote sin recargar toda la tabla"""
+        # En las tablas por columnas el iid de cada fila es su índice en el almacén
+        vista = self.vistas_columnares.get(tree)
+        quitadas = set()
+        for item in items:
+            # Las filas que dejan de cumplir el filtro activo de esa columna se quitan
+            if filtro not in ("Todos", valor):
+                tree.delete(item)
+                quitadas.add(item)
+                continue
+            
+            if vista:
+                vista["tabla"].asignar(int(item), columna, valor)
+            valores = list(tree.item(item, 'values'))
+            valores[columna] = valor
+            tree.item(item, values=valores)
+            if etiquetar:
+                tree.item(item, tags=etiquetar(valores))
+        
+        if vista and quitadas:
+            indices = {int(item) for item in quitadas}
+            vista["orden"] = [i for i in vista["orden"] if i not in indices]
+            vista["mostradas"] -= len(indices)
+    
+    def consultar_tabla_columnar(self, query, params, columnas, categoricas=()):
+        """Ejecuta una consulta y guarda sus filas en una TablaColumnar, leyendo el cursor por bloques"""
+        self.c.execute(query, params)
+        tabla = TablaColumnar(columnas, categoricas)
+        while True:
+            bloque = self.c.fetchmany(FILAS_POR_PAGINA_TABLA * 10)
+            if not bloque:
+                break
+            tabla.agregar(bloque)
+        return tabla
+    
+    def mostrar_filas_columnares(self, tree, tabla, etiquetar=None, visibles=None, indices=None):
+        """Muestra en un Treeview las filas de una TablaColumnar; el resto se agrega al desplazarse hacia el final"""
+        # ttk.Treeview no tiene modo virtual: cada fila insertada es un objeto de Tk, así que
+        # solo se crean las que el usuario llega a ver
+        for item in tree.get_children():
+            tree.delete(item)
+        orden = list(range(len(tabla))) if indices is None else list(indices)
+        self.vistas_columnares[tree] = {"tabla": tabla, "orden": orden, "mostradas": 0,
+                                        "etiquetar": etiquetar, "visibles": visibles,
+                                        "columna": None, "descendente": False, "pendiente": False}
+        self.mostrar_mas_filas(tree)
+    
+    def mostrar_mas_filas(self, tree):
+        """Agrega a la tabla la siguiente página de filas de su almacén por columnas"""
+        vista = self.vistas_columnares.get(tree)
+        if not vista:
+            return
+        vista["pendiente"] = False
+        inicio = vista["mostradas"]
+        for indice in vista["orden"][inicio:inicio + FILAS_POR_PAGINA_TABLA]:
+            fila = vista["tabla"].fila(indice)
+            etiquetas = vista["etiquetar"](fila) if vista["etiquetar"] else ()
+            tree.insert('', 'end', iid=str(indice), values=fila[:vista["visibles"]], tags=etiquetas)
+            vista["mostradas"] += 1
+    
+    def configurar_desplazamiento(self, tree, scrollbar):
+        """Conecta la barra de desplazamiento de una tabla y carga más filas al acercarse al final"""
+        def desplazar(primero, ultimo):
+            scrollbar.set(primero, ultimo)
+            vista = self.vistas_columnares.get(tree)
+            if (vista and not vista["pendiente"] and float(ultimo) >= 0.95
+                    and vista["mostradas"] < len(vista["orden"])):
+                vista["pendiente"] = True
+                self.root.after_idle(self.mostrar_mas_filas, tree)
+        
+        tree.configure(yscrollcommand=desplazar)
+    
+    def ordenar_tabla(self, tree, columna):
+        """Ordena una tabla por columnas al hacer clic en su encabezado; un segundo clic invierte el orden"""
+        vista = self.vistas_columnares.get(tree)
+        if not vista:
+            return
+        vista["descendente"] = vista["columna"] == columna and not vista["descendente"]
+        vista["columna"] = columna
+        # Se ordenan los índices del almacén, sin volver a consultar la base de datos
+        vista["orden"] = vista["tabla"].ordenar(columna, vista["descendente"], vista["orden"])
+        
+        for item in tree.get_children():
+            tree.delete(item)
+        vista["mostradas"] = 0
+        self.mostrar_mas_filas(tree)
+    
+    def filas_tabla(self, tree):
+        """Devuelve todas las filas de una tabla en el orden actual, incluidas las que aún no se muestran"""
+        vista = self.vistas_columnares.get(tree)
+        if not vista:
+            return [tree.item(item, 'values') for item in tree.get_children()]
+        return [vista["tabla"].fila(indice)[:vista["visibles"]] for indice in vista["orden"]]
+    
+    def gestionar_informes(self):
+        """Genera informes de gestión a pedido y administra los informes programados"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Informes de Gestión")
+        ventana.geometry("900x500")
+        
+        titulos = {titulo: nombre for nombre, (titulo, _, _) in informes.PLANTILLAS_INFORME.items()}
+        
+        # Generación inmediata de un informe
+        frame_generar = ttk.LabelFrame(ventana, text="Generar Informe", padding=5)
+        frame_generar.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Label(frame_generar, text="Plantilla:").grid(row=0, column=0, padx=5, pady=2, sticky='e')
+        combo_plantilla = ttk.Combobox(frame_generar, values=list(titulos), state='readonly', width=35)
+        combo_plantilla.grid(row=0, column=1, padx=5, pady=2, sticky='we')
+        combo_plantilla.current(0)
+        
+        ttk.Label(frame_generar, text="Formato:").grid(row=0, column=2, padx=5, pady=2, sticky='e')
+        combo_formato = ttk.Combobox(frame_generar, values=informes.FORMATOS_INFORME, state='readonly', width=8)
+        combo_formato.grid(row=0, column=3, padx=5, pady=2)
+        combo_formato.set("xlsx")
+        
+        ttk.Button(frame_generar, text="Generar...",
+                   command=lambda: self.generar_informe(titulos[combo_plantilla.get()], combo_formato.get())
+                   ).grid(row=0, column=4, padx=10, pady=2)
+        
+        # Informes programados
+        frame_programados = ttk.LabelFrame(ventana, text="Informes Programados", padding=5)
+        frame_programados.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        frame_tabla = ttk.Frame(frame_programados)
+        frame_tabla.pack(fill='both', expand=True)
+        
+        columns = ("ID", "Plantilla", "Formato", "Frecuencia", "Carpeta", "Última Ejecución", "Activo")
+        tree = ttk.Treeview(frame_tabla, columns=columns, show='headings', height=8)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90, anchor='center')
+        tree.column("ID", width=40)
+        tree.column("Plantilla", width=200)
+        tree.column("Carpeta", width=220)
+        tree.column("Última Ejecución", width=130)
+        tree.pack(side='left', fill='both', expand=True)
+        
+        scrollbar = ttk.Scrollbar(frame_tabla, orient="vertical", command=tree.yview)
+        scrollbar.pack(side='right', fill='y')
+        tree.configure(yscrollcommand=scrollbar.set)
+        
+        frame_nuevo = ttk.Frame(frame_programados)
+        frame_nuevo.pack(fill='x', pady=5)
+        
+        combo_nueva_plantilla = ttk.Combobox(frame_nuevo, values=list(titulos), state='readonly', width=30)
+        combo_nueva_plantilla.pack(side='left', padx=5)
+        combo_nueva_plantilla.current(0)
+        combo_nuevo_formato = ttk.Combobox(frame_nuevo, values=informes.FORMATOS_INFORME, state='readonly', width=6)
+        combo_nuevo_formato.pack(side='left', padx=5)
+        combo_nuevo_formato.set("xlsx")
+        combo_frecuencia = ttk.Combobox(frame_nuevo, values=list(informes.FRECUENCIAS_INFORME), state='readonly', width=10)
+        combo_frecuencia.pack(side='left', padx=5)
+        combo_frecuencia.set("Semanal")
+        var_carpeta = tk.StringVar()
+        ttk.Entry(frame_nuevo, textvariable=var_carpeta, width=30).pack(side='left', padx=5)
+        ttk.Button(frame_nuevo, text="...", width=3,
+                   command=lambda: var_carpeta.set(filedialog.askdirectory(parent=ventana) or var_carpeta.get())).pack(side='left')
+        ttk.Button(frame_nuevo, text="Programar",
+                   command=lambda: self.guardar_informe_programado(titulos[combo_nueva_plantilla.get()], combo_nuevo_formato.get(),
+                                                                   combo_frecuencia.get(), var_carpeta.get(), tree)).pack(side='left', padx=5)
+        
+        frame_botones = ttk.Frame(ventana)
+        frame_botones.pack(pady=5)
+        ttk.Button(frame_botones, text="Activar/Desactivar", command=lambda: self.cambiar_estado_informe(tree)).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Eliminar", command=lambda: self.eliminar_informe_programado(tree)).pack(side='left', padx=5)
+        ttk.Button(frame_botones, text="Cerrar", command=ventana.destroy).pack(side='left', padx=5)
+        
+        self.actualizar_informes_programados(tree)
+    
+    def actualizar_informes_programados(self, tree):
+        """Carga la lista de informes programados"""
+        for item in tree.get_children():
+            tree.delete(item)
+        try:
+            self.c.execute("""SELECT id, plantilla, formato, frecuencia, carpeta, 
+                              datetime(ultima_ejecucion_ts, 'unixepoch', 'localtime'), activo 
+                              FROM informes_programados ORDER BY id""")
+            for programa_id, plantilla, formato, frecuencia, carpeta, ultima, activo in self.c.fetchall():
+                titulo = informes.PLANTILLAS_INFORME[plantilla][0] if plantilla in informes.PLANTILLAS_INFORME else plantilla
+                tree.insert('', 'end', values=(programa_id, titulo, formato, frecuencia, carpeta, ultima or "Nunca",
+                                               "Sí" if activo else "No"))
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudieron cargar los informes programados: {e}")
+    
+    def generar_informe(self, plantilla, formato):
+        """Genera un informe a pedido y lo guarda donde indique el usuario"""
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=f".{formato}",
+            initialfile=f"{plantilla}_{datetime.now().strftime('%Y-%m-%d')}.{formato}",
+            filetypes=[(formato.upper(), f"*.{formato}"), ("All files", "*.*")],
+            title="Guardar informe como"
+        )
+        if not filepath:
+            return
+        
+        try:
+            columnas, filas = informes.ejecutar_informe(self.conn, plantilla, self.cache_informes)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo generar el informe: {e}")
+            return
+        
+        def al_terminar(correcto, valor):
+            if not correcto:
+                messagebox.showerror("Error", f"No se pudo guardar el informe: {valor}")
+                return
+            self.registrar_acceso("Generó informe", f"{plantilla} en {filepath}")
+            messagebox.showinfo("Éxito", f"Informe guardado en {filepath} ({len(filas)} filas)")
+        
+        # La escritura del archivo no usa la base de datos y se hace en segundo plano
+        self.ejecutar_en_hilo(lambda: informes.escribir_informe(plantilla, columnas, filas, filepath, formato), al_terminar)
+    
+    def guardar_informe_programado(self, plantilla, formato, frecuencia, carpeta, tree):
+        """Programa un informe para que se escriba periódicamente en una carpeta"""
+        if not carpeta.strip():
+            messagebox.showwarning("Advertencia", "Indique la carpeta donde se guardarán los informes")
+            return
+        
+        try:
+            self.c.execute("""INSERT INTO informes_programados (plantilla, formato, carpeta, frecuencia) 
+                              VALUES (?, ?, ?, ?)""", (plantilla, formato, carpeta.strip(), frecuencia))
             self.conn.commit()
-            
-            # Actualizar el historial si estamos en la pestaña de usuarios
-            if self.notebook.index(self.notebook.select()) == 3:  # Índice de pestaña de usuarios
-                self.actualizar_historial_accesos()
+            self.registrar_acceso("Programó informe", f"{plantilla} ({frecuencia}, {formato}) en {carpeta.strip()}")
         except sqlite3.Error as e:
-            print(f"Error al registrar acceso: {e}")  # No mostramos mensaje para no molestar al usuario
+            messagebox.showerror("Error", f"No se pudo programar el informe: {e}")
+            return
+        self.actualizar_informes_programados(tree)
+    
+    def cambiar_estado_informe(self, tree):
+        """Activa o desactiva el informe programado seleccionado"""
+        seleccion = tree.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Seleccione un informe programado")
+            return
+        
+        programa_id = tree.item(seleccion[0], 'values')[0]
+        try:
+            self.c.execute("UPDATE informes_programados SET activo = 1 - activo WHERE id = ?", (programa_id,))
+            self.conn.commit()
+            self.registrar_acceso("Cambió estado de informe programado", f"ID: {programa_id}")
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo cambiar el estado del informe: {e}")
+            return
+        self.actualizar_informes_programados(tree)
+    
+    def eliminar_informe_programado(self, tree):
+        """Elimina el informe programado seleccionado"""
+        seleccion = tree.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Seleccione un informe programado")
+            return
+        
+        programa_id = tree.item(seleccion[0], 'values')[0]
+        if not messagebox.askyesno("Confirmar", "¿Está seguro de eliminar el informe programado?"):
+            return
+        try:
+            self.c.execute("DELETE FROM informes_programados WHERE id = ?", (programa_id,))
+            self.conn.commit()
+            self.registrar_acceso("Eliminó informe programado", f"ID: {programa_id}")
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"No se pudo eliminar el informe: {e}")
+            return
+        self.actualizar_informes_programados(tree)
     
-    # ------------------------- Funciones generales -------------------------
     def crear_respaldo(self):
         """Crea una copia de seguridad de la base de datos"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
         try:
             # Preguntar dónde guardar el respaldo
             filepath = filedialog.asksaveasfilename(
@@ -2869,16 +5029,8 @@ class SistemaGestionLaboratorio:
             if not filepath:
                 return
                 
-            # Cerrar la conexión actual para poder copiar el archivo
-            if hasattr(self, 'conn'):
-                self.conn.close()
-            
-            # Copiar el archivo de la base de datos
-            import shutil
-            shutil.copy2('laboratorio.db', filepath)
-            
-            # Reconectar a la base de datos
-            self.conexion_db()
+            # Copia en línea con la API de respaldo de SQLite, sin cerrar la conexión
+            db.respaldar(self.conn, filepath)
             
             # Registrar en el historial de accesos
             self.registrar_acceso(f"Creó copia de seguridad en {filepath}")
@@ -2886,11 +5038,14 @@ class SistemaGestionLaboratorio:
             messagebox.showinfo("Éxito", f"Copia de seguridad creada en:\n{filepath}")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo crear la copia de seguridad: {e}")
-            # Intentar reconectar si falló
-            self.conexion_db()
     
     def restaurar_respaldo(self):
         """Restaura la base de datos desde una copia de seguridad"""
+        if not self.verificar_permiso("administrar_sistema"):
+            return
+        if self.servidor:
+            messagebox.showwarning("Advertencia", "En modo cliente la base de datos se restaura en el equipo del servicio")
+            return
         try:
             # Preguntar por el archivo de respaldo
             filepath = filedialog.askopenfilename(
@@ -2910,11 +5065,13 @@ class SistemaGestionLaboratorio:
                 self.conn.close()
             
             # Copiar el archivo de respaldo
-            import shutil
-            shutil.copy2(filepath, 'laboratorio.db')
+            db.restaurar(filepath)
             
-            # Reconectar a la base de datos
+            # Reconectar a la base de datos; los resultados guardados eran de los datos anteriores
             self.conexion_db()
+            self.cache_consultas.vaciar()
+            for filtros in (self.filtros_reportes, self.filtros_equipos, self.filtros_inventario):
+                filtros.descartar()
             
             # Registrar en el historial de accesos
             self.registrar_acceso(f"Restauró base de datos desde {filepath}")
@@ -2994,6 +5151,9 @@ class SistemaGestionLaboratorio:
             - Crear copias de seguridad de la base de datos
             - Restaurar desde una copia de seguridad
             - Exportar datos a formatos externos
+            - Archivar automáticamente reportes, reservas y accesos antiguos
+            - Ejecutar exportaciones, respaldos y estadísticas sin interfaz: python gestionlab.py --help
+            - Trabajar desde varias estaciones con un servicio central: GestionLAB2.0.py --servidor host:puerto --clave-archivo clave.txt
             """)
         ]
         
@@ -3025,8 +5185,11 @@ class SistemaGestionLaboratorio:
     def cerrar_aplicacion(self):
         """Cierra la aplicación de manera segura"""
         if messagebox.askokcancel("Salir", "¿Está seguro que desea salir de la aplicación?"):
+            self.registrar_acceso("Cerró sesión")
             if hasattr(self, 'conn'):
                 self.conn.close()
+            if hasattr(self, 'cache_consultas'):
+                self.cache_consultas.cerrar()
             self.root.destroy()
     
     def __del__(self):
@@ -3036,6 +5199,11 @@ class SistemaGestionLaboratorio:
 
 # Función principal
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sistema de Gestión de Laboratorio")
+    parser.add_argument("--servidor", help="host:puerto del servicio central (python gestionlab.py servicio)")
+    parser.add_argument("--clave-archivo", help="archivo con la clave compartida del servicio central")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = SistemaGestionLaboratorio(root)
+    app = SistemaGestionLaboratorio(root, args.servidor, args.clave_archivo)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""Almacenamiento compacto por columnas de resultados grandes que la interfaz mantiene en memoria.
+
+Una lista de tuplas guarda un objeto Python por celda. TablaColumnar guarda cada columna por
+separado: los números en arrays de C, los textos repetidos (estado, tipo, prioridad, ubicación)
+como códigos de un diccionario de valores únicos y el resto de textos en una lista. Así se pueden
+tener cientos de miles de filas en el cliente y ordenarlas sin volver a consultar la base.
+"""
+import sys
+from array import array
+
+# Tipos de columna: se deducen de los valores y pasan a "objeto" si aparece uno que no encaja
+ENTERO, REAL, CATEGORIA, TEXTO, OBJETO = "entero", "real", "categoria", "texto", "objeto"
+
+class Columna:
+    """Valores de una columna con su representación compacta y una marca de nulos"""
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self.nulos = bytearray()
+        if tipo == ENTERO:
+            self.valores = array('q')
+        elif tipo == REAL:
+            self.valores = array('d')
+        elif tipo == CATEGORIA:
+            # Códigos de 32 bits que apuntan a la lista de valores únicos
+            self.valores = array('I')
+            self.categorias = []
+            self.codigos = {}
+        else:
+            self.valores = []
+    
+    def admite(self, valor):
+        """Indica si un valor se puede guardar en la representación actual"""
+        if valor is None or self.tipo == OBJETO:
+            return True
+        if self.tipo == ENTERO:
+            return type(valor) is int and -2**63 <= valor < 2**63
+        if self.tipo == REAL:
+            return type(valor) in (int, float)
+        return type(valor) is str
+    
+    def agregar(self, valor):
+        """Agrega un valor al final de la columna"""
+        self.nulos.append(valor is None)
+        if self.tipo == CATEGORIA:
+            if valor is None:
+                self.valores.append(0)
+                return
+            codigo = self.codigos.get(valor)
+            if codigo is None:
+                codigo = self.codigos[valor] = len(self.categorias)
+                self.categorias.append(valor)
+            self.valores.append(codigo)
+        elif self.tipo in (ENTERO, REAL):
+            self.valores.append(0 if valor is None else valor)
+        else:
+            self.valores.append(valor)
+    
+    def valor(self, indice):
+        """Devuelve el valor de una fila"""
+        if self.nulos[indice]:
+            return None
+        if self.tipo == CATEGORIA:
+            return self.categorias[self.valores[indice]]
+        return self.valores[indice]
+    
+    def asignar(self, indice, valor):
+        """Cambia el valor de una fila; devuelve False si no encaja en la representación actual"""
+        if not self.admite(valor):
+            return False
+        self.nulos[indice] = valor is None
+        if self.tipo == CATEGORIA:
+            if valor is not None:
+                codigo = self.codigos.get(valor)
+                if codigo is None:
+                    codigo = self.codigos[valor] = len(self.categorias)
+                    self.categorias.append(valor)
+                self.valores[indice] = codigo
+        elif self.tipo in (ENTERO, REAL):
+            self.valores[indice] = 0 if valor is None else valor
+        else:
+            self.valores[indice] = valor
+        return True
+    
+    def a_objetos(self):
+        """Convierte la columna a una lista de objetos, que admite cualquier valor"""
+        valores = [self.valor(i) for i in range(len(self.nulos))]
+        self.tipo = OBJETO
+        self.valores = valores
+    
+    def memoria(self):
+        """Bytes aproximados que ocupa la columna"""
+        total = sys.getsizeof(self.nulos) + sys.getsizeof(self.valores)
+        if self.tipo == CATEGORIA:
+            total += sys.getsizeof(self.categorias) + sys.getsizeof(self.codigos)
+            total += sum(sys.getsizeof(v) for v in self.categorias)
+        elif self.tipo in (TEXTO, OBJETO):
+            total += sum(sys.getsizeof(v) for v in self.valores if v is not None)
+        return total
+
+class TablaColumnar:
+    """Filas de un resultado guardadas por columnas; las columnas categóricas se guardan como códigos"""
+    def __init__(self, columnas, categoricas=()):
+        self.columnas = list(columnas)
+        self.posiciones = {nombre: i for i, nombre in enumerate(self.columnas)}
+        self.categoricas = set(categoricas)
+        self.datos = None
+        self.cantidad = 0
+    
+    def __len__(self):
+        return self.cantidad
+    
+    def deducir_tipos(self, filas):
+        """Crea las columnas según el primer valor no nulo de cada una en las filas dadas"""
+        self.datos = []
+        for posicion, nombre in enumerate(self.columnas):
+            valor = next((fila[posicion] for fila in filas if fila[posicion] is not None), None)
+            if nombre in self.categoricas:
+                tipo = CATEGORIA
+            elif type(valor) is int:
+                tipo = ENTERO
+            elif type(valor) is float:
+                tipo = REAL
+            elif type(valor) is str or valor is None:
+                tipo = TEXTO
+            else:
+                tipo = OBJETO
+            self.datos.append(Columna(tipo))
+    
+    def agregar(self, filas):
+        """Agrega filas (secuencias con un valor por columna) al final de la tabla"""
+        if self.datos is None:
+            filas = list(filas)
+            if not filas:
+                return
+            self.deducir_tipos(filas)
+        for fila in filas:
+            for columna, valor in zip(self.datos, fila):
+                if not columna.admite(valor):
+                    columna.a_objetos()
+                columna.agregar(valor)
+            self.cantidad += 1
+    
+    def fila(self, indice):
+        """Devuelve una fila como tupla"""
+        return tuple(columna.valor(indice) for columna in self.datos)
+    
+    def valor(self, indice, columna):
+        """Devuelve el valor de una celda; la columna puede indicarse por nombre o posición"""
+        return self.datos[self.posiciones.get(columna, columna)].valor(indice)
+    
+    def asignar(self, indice, columna, valor):
+        """Cambia el valor de una celda"""
+        datos = self.datos[self.posiciones.get(columna, columna)]
+        if not datos.asignar(indice, valor):
+            datos.a_objetos()
+            datos.asignar(indice, valor)
+    
+    def ordenar(self, columna, descendente=False, indices=None):
+        """Devuelve los índices de las filas ordenados por una columna, con los nulos al final"""
+        datos = self.datos[self.posiciones.get(columna, columna)] if self.datos else None
+        indices = list(range(self.cantidad)) if indices is None else list(indices)
+        if datos is None:
+            return indices
+        if datos.tipo == CATEGORIA:
+            # Se ordenan solo los valores únicos y cada fila usa la posición de su código
+            rango = {codigo: posicion for posicion, codigo in
+                     enumerate(sorted(range(len(datos.categorias)), key=lambda c: datos.categorias[c]))}
+            clave = lambda i: rango[datos.valores[i]]
+        elif datos.tipo in (ENTERO, REAL):
+            clave = datos.valores.__getitem__
+        else:
+            clave = lambda i: str(datos.valores[i])
+        nulos = [i for i in indices if datos.nulos[i]]
+        valores = sorted((i for i in indices if not datos.nulos[i]), key=clave, reverse=descendente)
+        return valores + nulos
+    
+    def memoria(self):
+        """Bytes aproximados que ocupan los datos de la tabla"""
+        return sum(columna.memoria() for columna in self.datos or [])
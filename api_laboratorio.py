@@ -0,0 +1,179 @@
+"""API REST de solo lectura con los datos del laboratorio, para consultarlos sin copiar laboratorio.db.
+
+Se inicia con: python gestionlab.py serve --puerto 8080
+
+Rutas:
+    GET /api                          recursos disponibles y su versión de datos
+    GET /api/<recurso>                lista paginada (?limite=, ?despues_de=, ?estado=, ?equipo_id=)
+    GET /api/<recurso>/<id>           un registro
+"""
+import hashlib
+import json
+import queue
+import sqlite3
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+import laboratorio_db as db
+
+# Recursos publicados: tabla y columnas visibles (los usuarios no se publican por sus contraseñas)
+RECURSOS = {
+    "equipos": ["id", "nombre", "tipo", "modelo", "serial", "estado", "ubicacion",
+                "fecha_adquisicion", "ultimo_mantenimiento", "observaciones"],
+    "inventario": ["id", "componente", "tipo", "cantidad", "minimo", "proveedor", "ubicacion",
+                   "fecha_actualizacion", "observaciones"],
+    "reportes": ["id", "equipo_id", "tipo", "descripcion", "fecha", "estado", "solucion", "usuario", "prioridad"],
+    "reservas": ["id", "equipo_id", "usuario_id", "fecha_inicio", "fecha_fin", "proposito", "estado",
+                 "fecha_solicitud"],
+    "mantenimientos": ["id", "equipo_id", "tipo", "fecha_programada", "fecha_realizado", "descripcion",
+                       "tecnico", "estado", "costo", "observaciones"],
+}
+
+# Parámetros de filtro admitidos en las listas, con el mismo nombre que la columna
+FILTROS = ["estado", "equipo_id"]
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+CONEXIONES_POR_DEFECTO = 4
+
+class PoolLectura:
+    """Conjunto fijo de conexiones de solo lectura compartidas por los hilos del servidor"""
+    def __init__(self, ruta, tamano=CONEXIONES_POR_DEFECTO):
+        self.libres = queue.Queue()
+        for _ in range(tamano):
+            self.libres.put(db.conectar_lectura(ruta))
+    
+    @contextmanager
+    def conexion(self):
+        """Presta una conexión y la devuelve al terminar, aunque haya errores"""
+        conn = self.libres.get()
+        try:
+            yield conn
+        finally:
+            self.libres.put(conn)
+    
+    def cerrar(self):
+        """Cierra todas las conexiones del pool"""
+        while not self.libres.empty():
+            self.libres.get_nowait().close()
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    """Atiende las peticiones GET de la API"""
+    server_version = "GestionLAB-API/1.0"
+    
+    def do_GET(self):
+        """Resuelve la ruta pedida y responde en JSON"""
+        url = urlsplit(self.path)
+        partes = [p for p in url.path.split("/") if p]
+        parametros = {clave: valores[-1] for clave, valores in parse_qs(url.query).items()}
+        
+        try:
+            if partes == ["api"]:
+                self.responder_indice()
+            elif len(partes) == 2 and partes[0] == "api" and partes[1] in RECURSOS:
+                self.responder_lista(partes[1], parametros)
+            elif len(partes) == 3 and partes[0] == "api" and partes[1] in RECURSOS and partes[2].isdigit():
+                self.responder_registro(partes[1], int(partes[2]))
+            else:
+                self.enviar_json(404, {"error": "Ruta no encontrada"})
+        except ValueError as e:
+            self.enviar_json(400, {"error": str(e)})
+        except sqlite3.Error as e:
+            self.enviar_json(503, {"error": f"Base de datos no disponible: {e}"})
+    
+    def responder_indice(self):
+        """Lista los recursos con su versión actual de datos"""
+        with self.server.pool.conexion() as conn:
+            recursos = {nombre: {"url": f"/api/{nombre}", "version": db.leer_version_datos(conn, nombre)}
+                        for nombre in RECURSOS}
+        self.enviar_json(200, {"recursos": recursos})
+    
+    def responder_lista(self, recurso, parametros):
+        """Devuelve una página de registros ordenados por id"""
+        limite = self.leer_entero(parametros, "limite", LIMITE_POR_DEFECTO)
+        if not 1 <= limite <= LIMITE_MAXIMO:
+            raise ValueError(f"limite debe estar entre 1 y {LIMITE_MAXIMO}")
+        despues_de = self.leer_entero(parametros, "despues_de", 0)
+        
+        # Paginación por clave: cada página continúa desde el último id, usando la clave primaria
+        condiciones = ["id > ?"]
+        params = [despues_de]
+        for filtro in FILTROS:
+            if filtro in parametros and filtro in RECURSOS[recurso]:
+                condiciones.append(f"{filtro} = ?")
+                params.append(parametros[filtro])
+        
+        with self.server.pool.conexion() as conn:
+            # Si los datos no cambiaron desde la copia del cliente no hace falta ejecutar la consulta
+            etag = self.calcular_etag(recurso, db.leer_version_datos(conn, recurso), parametros)
+            if self.no_modificado(etag):
+                return
+            
+            filas = conn.execute(f"""SELECT {", ".join(RECURSOS[recurso])} FROM {recurso}
+                                     WHERE {" AND ".join(condiciones)} ORDER BY id LIMIT ?""",
+                                 params + [limite + 1]).fetchall()
+        
+        # Se pide una fila de más para saber si hay otra página sin hacer un COUNT
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = f"/api/{recurso}?" + urlencode(dict(parametros, despues_de=filas[-1][0]))
+        
+        datos = [dict(zip(RECURSOS[recurso], fila)) for fila in filas]
+        self.enviar_json(200, {"datos": datos, "siguiente": siguiente}, etag)
+    
+    def responder_registro(self, recurso, registro_id):
+        """Devuelve un registro por su id"""
+        with self.server.pool.conexion() as conn:
+            etag = self.calcular_etag(recurso, db.leer_version_datos(conn, recurso), {"id": registro_id})
+            if self.no_modificado(etag):
+                return
+            fila = conn.execute(f"SELECT {', '.join(RECURSOS[recurso])} FROM {recurso} WHERE id = ?",
+                                (registro_id,)).fetchone()
+        
+        if fila is None:
+            self.enviar_json(404, {"error": f"No existe {recurso} con id {registro_id}"})
+        else:
+            self.enviar_json(200, dict(zip(RECURSOS[recurso], fila)), etag)
+    
+    def leer_entero(self, parametros, nombre, defecto):
+        """Lee un parámetro entero de la consulta"""
+        try:
+            return int(parametros.get(nombre, defecto))
+        except ValueError:
+            raise ValueError(f"{nombre} debe ser un número entero")
+    
+    def calcular_etag(self, recurso, version, parametros):
+        """Calcula la ETag de una respuesta a partir de la versión de datos y los parámetros"""
+        clave = f"{recurso}:{version}:{sorted(parametros.items())}"
+        return '"' + hashlib.sha1(clave.encode("utf-8")).hexdigest() + '"'
+    
+    def no_modificado(self, etag):
+        """Responde 304 si el cliente ya tiene la versión actual"""
+        if_none_match = self.headers.get("If-None-Match", "")
+        if etag in [e.strip() for e in if_none_match.split(",")] or if_none_match.strip() == "*":
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return True
+        return False
+    
+    def enviar_json(self, codigo, contenido, etag=None):
+        """Envía una respuesta JSON"""
+        cuerpo = json.dumps(contenido, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        if etag:
+            self.send_header("ETag", etag)
+            # El cliente debe revalidar siempre; la ETag hace que la revalidación sea barata
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+def crear_servidor(ruta=db.RUTA_DB, host="127.0.0.1", puerto=8080, conexiones=CONEXIONES_POR_DEFECTO):
+    """Crea el servidor HTTP de la API con su pool de conexiones de solo lectura"""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorAPI)
+    servidor.daemon_threads = True
+    servidor.pool = PoolLectura(ruta, conexiones)
+    return servidor
@@ -0,0 +1,87 @@
+"""Contraseñas con hash lento (PBKDF2-SHA256), sesión del usuario y permisos de su rol.
+
+Las contraseñas se guardan como "pbkdf2_sha256$iteraciones$sal$hash", en hexadecimal. Calcular un
+hash tarda del orden de décimas de segundo a propósito, así que la interfaz nunca lo hace en el
+hilo de tkinter: usa ejecutar_en_hilo (hashlib libera el GIL mientras calcula). Las contraseñas
+anteriores que siguen en texto plano se aceptan una vez y se reemplazan por su hash en ese mismo
+inicio de sesión (necesita_hash_nuevo).
+
+Los permisos de cada rol están en la tabla permisos_rol, que se llena con PERMISOS_POR_ROL. Se leen
+una sola vez al iniciar sesión y quedan en la Sesion, así que comprobar un permiso antes de una
+acción no consulta la base de datos. Este módulo no usa la base de datos ni tkinter.
+"""
+import hashlib
+import hmac
+import os
+import time
+
+ALGORITMO_HASH = "pbkdf2_sha256"
+
+# Iteraciones de PBKDF2 para los hashes nuevos; los guardados conservan las suyas
+ITERACIONES_HASH = 600000
+
+BYTES_SAL = 16
+
+# Acciones que requieren permiso y cómo se nombran en los avisos; consultar y exportar datos,
+# crear reportes y hacer reservas está permitido a todos los usuarios
+PERMISOS = {
+    "gestionar_reportes": "cambiar el estado de los reportes ni resolverlos",
+    "gestionar_equipos": "agregar ni modificar equipos",
+    "eliminar_equipos": "eliminar equipos",
+    "gestionar_inventario": "agregar, modificar ni mover componentes del inventario",
+    "eliminar_inventario": "eliminar componentes del inventario",
+    "gestionar_mantenimiento": "programar ni registrar mantenimientos",
+    "gestionar_usuarios": "administrar usuarios",
+    "administrar_sistema": "hacer respaldos, restaurar, archivar, cambiar la configuración ni programar informes",
+}
+
+# Permisos iniciales de cada rol (migración 17); un rol que no aparece no tiene ninguno
+PERMISOS_POR_ROL = {
+    "Administrador": list(PERMISOS),
+    "Técnico": ["gestionar_reportes", "gestionar_equipos", "gestionar_inventario", "gestionar_mantenimiento"],
+    "Usuario": [],
+}
+
+def generar_hash(contrasena, iteraciones=ITERACIONES_HASH):
+    """Devuelve el hash de una contraseña con una sal aleatoria, listo para guardar"""
+    sal = os.urandom(BYTES_SAL)
+    clave = hashlib.pbkdf2_hmac("sha256", contrasena.encode("utf-8"), sal, iteraciones)
+    return f"{ALGORITMO_HASH}${iteraciones}${sal.hex()}${clave.hex()}"
+
+def es_hash(valor):
+    """Indica si un valor guardado en usuarios.contrasena ya es un hash"""
+    return isinstance(valor, str) and valor.startswith(ALGORITMO_HASH + "$") and valor.count("$") == 3
+
+def necesita_hash_nuevo(guardado):
+    """Indica si una contraseña guardada sigue en texto plano y debe reemplazarse por su hash"""
+    return isinstance(guardado, str) and guardado != "" and not es_hash(guardado)
+
+def verificar_contrasena(contrasena, guardado):
+    """Indica si una contraseña corresponde al hash guardado (o a la contraseña en texto plano anterior)"""
+    if not es_hash(guardado):
+        # Sin hash válido (usuario inexistente o contraseña en texto plano) se calcula uno igual,
+        # para que el tiempo de respuesta no revele qué usuarios existen
+        generar_hash(contrasena)
+        if necesita_hash_nuevo(guardado):
+            return hmac.compare_digest(contrasena.encode("utf-8"), guardado.encode("utf-8"))
+        return False
+    _, iteraciones, sal, esperado = guardado.split("$")
+    try:
+        clave = hashlib.pbkdf2_hmac("sha256", contrasena.encode("utf-8"), bytes.fromhex(sal), int(iteraciones))
+    except ValueError:
+        return False
+    return hmac.compare_digest(clave.hex(), esperado)
+
+class Sesion:
+    """Usuario que inició sesión, guardado en memoria mientras la aplicación está abierta"""
+    def __init__(self, usuario_id, usuario, nombre, rol, permisos=()):
+        self.usuario_id = usuario_id
+        self.usuario = usuario
+        self.nombre = nombre
+        self.rol = rol
+        self.permisos = frozenset(permisos)
+        self.inicio = time.time()
+    
+    def puede(self, permiso):
+        """Indica si el rol del usuario tiene un permiso"""
+        return permiso in self.permisos
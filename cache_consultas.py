@@ -0,0 +1,111 @@
+"""Caché en disco de resultados de consultas, que se conserva entre sesiones de la aplicación.
+
+Cada resultado se guarda con la versión de datos (tabla versiones_datos) de las tablas que lee
+y se reutiliza mientras ninguna cambie. Las versiones vuelven a valores anteriores si la base de
+datos se reemplaza (un respaldo restaurado, aquí o en el equipo del servicio), así que también se
+guarda la época de los datos (configuracion.epoca_datos), que cambia en cada restauración.
+PRAGMA data_version no sirve para esto porque solo es válido dentro de una misma conexión. Se guarda en un archivo aparte para no mezclar sus
+escrituras con las transacciones ni con los respaldos de laboratorio.db. Cuando el archivo
+supera su tamaño máximo se descartan los resultados usados hace más tiempo.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+import laboratorio_db as db
+
+RUTA_CACHE = 'laboratorio_cache.db'
+
+# Tamaño máximo del contenido guardado y de un solo resultado, en bytes
+MAXIMO_BYTES_CACHE = 20 * 1024 * 1024
+MAXIMO_BYTES_RESULTADO = 2 * 1024 * 1024
+
+class CacheConsultas:
+    """Resultados de consultas guardados en disco y válidos mientras no cambien sus tablas"""
+    def __init__(self, identidad, ruta=RUTA_CACHE, maximo_bytes=MAXIMO_BYTES_CACHE):
+        # La identidad (ruta de la base o servidor) separa los resultados de distintas bases de datos
+        self.identidad = identidad
+        self.maximo_bytes = maximo_bytes
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(ruta)
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS resultados (
+                clave TEXT PRIMARY KEY,
+                versiones TEXT NOT NULL,
+                filas TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                ultimo_uso_ts REAL NOT NULL
+            )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_uso ON resultados (ultimo_uso_ts)")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            # Sin archivo de caché la aplicación sigue funcionando, consultando siempre
+            print(f"No se pudo abrir la caché de consultas: {e}")
+            self.conn = None
+    
+    def consultar(self, conn, sql, params=(), tablas=()):
+        """Devuelve las filas de una consulta, desde la caché si las tablas que lee no cambiaron"""
+        versiones = json.dumps([db.leer_epoca_datos(conn)] + [db.leer_version_datos(conn, tabla) for tabla in tablas])
+        clave = hashlib.sha1(json.dumps([self.identidad, sql, list(params)]).encode("utf-8")).hexdigest()
+        
+        guardado = self.leer(clave, versiones)
+        if guardado is not None:
+            return guardado
+        
+        filas = conn.execute(sql, params).fetchall()
+        self.guardar(clave, versiones, filas)
+        return filas
+    
+    def leer(self, clave, versiones):
+        """Devuelve las filas guardadas para una clave si corresponden a las versiones actuales"""
+        if self.conn is None:
+            return None
+        try:
+            fila = self.conn.execute("SELECT versiones, filas FROM resultados WHERE clave = ?", (clave,)).fetchone()
+            if fila is None or fila[0] != versiones:
+                return None
+            self.conn.execute("UPDATE resultados SET ultimo_uso_ts = ? WHERE clave = ?", (time.time(), clave))
+            self.conn.commit()
+            return [tuple(f) for f in json.loads(fila[1])]
+        except sqlite3.Error:
+            return None
+    
+    def guardar(self, clave, versiones, filas):
+        """Guarda un resultado y descarta los menos usados si se supera el tamaño máximo"""
+        if self.conn is None:
+            return
+        try:
+            contenido = json.dumps([list(f) for f in filas], ensure_ascii=False)
+        except TypeError:
+            return  # Valores que no se pueden guardar en JSON (por ejemplo, binarios)
+        if len(contenido) > MAXIMO_BYTES_RESULTADO:
+            return
+        
+        try:
+            self.conn.execute("""INSERT OR REPLACE INTO resultados (clave, versiones, filas, tamano, ultimo_uso_ts)
+                                 VALUES (?, ?, ?, ?, ?)""", (clave, versiones, contenido, len(contenido), time.time()))
+            # Se conservan los más recientes mientras su tamaño acumulado quepa en el máximo
+            self.conn.execute("""DELETE FROM resultados WHERE clave IN (
+                                     SELECT clave FROM (
+                                         SELECT clave, SUM(tamano) OVER (ORDER BY ultimo_uso_ts DESC) AS acumulado
+                                         FROM resultados)
+                                     WHERE acumulado > ?)""", (self.maximo_bytes,))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+    
+    def vaciar(self):
+        """Elimina todos los resultados guardados"""
+        if self.conn is None:
+            return
+        try:
+            self.conn.execute("DELETE FROM resultados")
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+    
+    def cerrar(self):
+        """Cierra el archivo de la caché"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,114 @@
+"""Filtros de las tablas evaluados en memoria sobre el último resultado consultado.
+
+Un filtro es una lista de condiciones (columna, operador, valor) que se cumplen todas a la vez:
+    "="         la columna es igual al valor
+    ">=", "<"   la columna es mayor o igual / menor que el valor
+    "<columna"  la columna es menor que otra columna de la misma fila (el valor es su nombre)
+
+Si un filtro nuevo es más restrictivo que el que produjo el resultado guardado (por ejemplo, se
+agrega prioridad = Alta a una búsqueda de estado = Abierto), sus filas son un subconjunto de ese
+resultado y se obtienen con máscaras de numpy sobre las columnas de la TablaColumnar, sin volver
+a consultar la base de datos. Solo un filtro más amplio o un cambio en los datos vuelve a SQL.
+"""
+import numpy as np
+from almacen_filas import CATEGORIA, ENTERO, REAL
+
+def condicion_implicada(condicion, condiciones):
+    """Indica si toda fila que cumple las condiciones cumple también la condición dada"""
+    columna, operador, valor = condicion
+    for otra_columna, otro_operador, otro_valor in condiciones:
+        if otra_columna != columna:
+            continue
+        if (otro_operador, otro_valor) == (operador, valor):
+            return True
+        if operador == ">=" and otro_operador in (">=", "=") and otro_valor >= valor:
+            return True
+        if operador == "<" and ((otro_operador == "<" and otro_valor <= valor)
+                                or (otro_operador == "=" and otro_valor < valor)):
+            return True
+    return False
+
+def es_mas_restrictivo(condiciones, anteriores):
+    """Indica si las filas de un filtro están incluidas en las del filtro anterior"""
+    return all(condicion_implicada(condicion, condiciones) for condicion in anteriores)
+
+def arreglo(columna):
+    """Devuelve una copia de los valores de una columna numérica o categórica como arreglo de numpy"""
+    # Se copia para no dejar exportado el buffer del array, que impediría seguir agregándole filas
+    return np.frombuffer(columna.valores, dtype=columna.valores.typecode).copy()
+
+def mascara(tabla, condicion):
+    """Devuelve un arreglo booleano con las filas de la tabla que cumplen una condición"""
+    nombre, operador, valor = condicion
+    columna = tabla.datos[tabla.posiciones[nombre]]
+    # Como en SQL, un valor nulo no cumple ninguna condición
+    validos = np.frombuffer(columna.nulos, dtype=np.bool_) == 0
+    
+    if operador == "=" and columna.tipo == CATEGORIA:
+        codigo = columna.codigos.get(valor)
+        if codigo is None:
+            return np.zeros(len(tabla), dtype=np.bool_)
+        return validos & (arreglo(columna) == codigo)
+    
+    if columna.tipo in (ENTERO, REAL) and isinstance(valor, (int, float)):
+        valores = arreglo(columna)
+        if operador == "=":
+            return validos & (valores == valor)
+        if operador == ">=":
+            return validos & (valores >= valor)
+        if operador == "<":
+            return validos & (valores < valor)
+    
+    if operador == "<columna":
+        otra = tabla.datos[tabla.posiciones[valor]]
+        if columna.tipo in (ENTERO, REAL) and otra.tipo in (ENTERO, REAL):
+            return validos & (np.frombuffer(otra.nulos, dtype=np.bool_) == 0) & (arreglo(columna) < arreglo(otra))
+    
+    # Columnas de texto u objetos: se compara fila por fila
+    comparar = {"=": lambda a, b: a == b, ">=": lambda a, b: a >= b, "<": lambda a, b: a < b}
+    resultado = np.zeros(len(tabla), dtype=np.bool_)
+    for indice in range(len(tabla)):
+        actual = tabla.valor(indice, nombre)
+        otro = tabla.valor(indice, valor) if operador == "<columna" else valor
+        if actual is not None and otro is not None:
+            try:
+                resultado[indice] = comparar[operador.replace("columna", "")](actual, otro)
+            except TypeError:
+                pass
+    return resultado
+
+def filtrar(tabla, condiciones, indices=None):
+    """Devuelve los índices (en el orden dado) de las filas de la tabla que cumplen todas las condiciones"""
+    indices = np.arange(len(tabla)) if indices is None else np.asarray(indices, dtype=np.int64)
+    if not condiciones or not len(tabla):
+        return indices.tolist()
+    total = np.ones(len(tabla), dtype=np.bool_)
+    for condicion in condiciones:
+        total &= mascara(tabla, condicion)
+    return indices[total[indices]].tolist()
+
+class ResultadoFiltrable:
+    """Último resultado consultado de una tabla, con las condiciones y la versión de los datos que lo produjeron"""
+    def __init__(self):
+        self.clave = None
+        self.condiciones = None
+        self.tabla = None
+    
+    def obtener(self, clave, condiciones, consultar):
+        """Devuelve (tabla, índices) de las filas que cumplen las condiciones; consultar() solo se llama si hace falta"""
+        # La clave resume las versiones de datos: si cambió, el resultado guardado ya no sirve
+        if self.tabla is not None and clave == self.clave and es_mas_restrictivo(condiciones, self.condiciones):
+            # Las condiciones que ya cumplía el resultado guardado no hace falta evaluarlas
+            nuevas = [condicion for condicion in condiciones if condicion not in self.condiciones]
+            return self.tabla, filtrar(self.tabla, nuevas)
+        
+        self.tabla = consultar()
+        self.clave = clave
+        self.condiciones = list(condiciones)
+        return self.tabla, list(range(len(self.tabla)))
+    
+    def descartar(self):
+        """Olvida el resultado guardado para que la próxima búsqueda consulte la base de datos"""
+        self.clave = None
+        self.condiciones = None
+        self.tabla = None
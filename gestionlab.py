@@ -0,0 +1,355 @@
+"""Línea de comandos del sistema de gestión de laboratorio para tareas programadas (cron).
+
+Ejemplos:
+    python gestionlab.py export equipos --salida equipos.csv
+    python gestionlab.py export mantenimientos --vencidos
+    python gestionlab.py backup respaldo.db
+    python gestionlab.py stats
+    python gestionlab.py import inventario componentes.csv
+    python gestionlab.py consumo --dias 30
+    python gestionlab.py informe stock_bajo --formato xlsx --salida stock.xlsx
+    python gestionlab.py informe --programados
+    python gestionlab.py vacuum --archivar
+    python gestionlab.py serve --puerto 8080
+    python gestionlab.py servicio --host 192.168.1.10 --puerto 5050 --clave-archivo clave.txt
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+import laboratorio_db as db
+import autenticacion
+import informes
+
+# Consultas de exportación por tabla; las mismas columnas que muestran las pestañas de la aplicación
+CONSULTAS_EXPORTACION = {
+    "equipos": ("""SELECT id, nombre, tipo, modelo, serial, estado, ubicacion, fecha_adquisicion, ultimo_mantenimiento
+                   FROM equipos""", None, "id"),
+    "inventario": ("""SELECT id, componente, tipo, cantidad, minimo, proveedor, ubicacion, fecha_actualizacion
+                      FROM inventario""", None, "componente"),
+    "reportes": ("""SELECT r.id, e.nombre AS equipo, r.tipo, r.descripcion, r.fecha, r.estado, r.prioridad, r.solucion
+                    FROM reportes r LEFT JOIN equipos e ON r.equipo_id = e.id""", "r.fecha_ts", "r.fecha_ts"),
+    "reservas": ("""SELECT r.id, e.nombre AS equipo, u.nombre AS usuario, r.fecha_inicio, r.fecha_fin, r.proposito, r.estado
+                    FROM reservas r
+                    LEFT JOIN equipos e ON r.equipo_id = e.id
+                    LEFT JOIN usuarios u ON r.usuario_id = u.id""", "r.fecha_inicio_ts", "r.fecha_inicio_ts"),
+    "mantenimientos": ("""SELECT m.id, e.nombre AS equipo, m.tipo, m.fecha_programada, m.fecha_realizado, m.tecnico, m.estado, m.costo
+                          FROM mantenimientos m LEFT JOIN equipos e ON m.equipo_id = e.id""",
+                       "m.fecha_programada_ts", "m.fecha_programada_ts"),
+    "accesos": ("""SELECT a.id, u.nombre AS usuario, a.fecha_hora, a.accion, a.detalles
+                   FROM accesos a LEFT JOIN usuarios u ON a.usuario_id = u.id""", "a.fecha_hora_ts", "a.fecha_hora_ts"),
+    "movimientos": ("""SELECT m.id, i.componente, m.fecha, m.tipo, m.cantidad, m.saldo, m.reporte_id, m.mantenimiento_id,
+                              m.observaciones
+                       FROM movimientos_inventario m LEFT JOIN inventario i ON m.componente_id = i.id""",
+                    "m.fecha_ts", "m.fecha_ts"),
+}
+
+# Tablas que admiten importación desde CSV
+TABLAS_IMPORTACION = ["equipos", "inventario", "usuarios"]
+
+# Filas por lote al importar, para no cargar el archivo completo en memoria
+TAMANO_LOTE_IMPORTACION = 500
+
+def error(mensaje):
+    """Escribe un mensaje de error y termina con código distinto de cero"""
+    print(f"Error: {mensaje}", file=sys.stderr)
+    sys.exit(1)
+
+def abrir_salida(ruta):
+    """Devuelve el archivo de salida indicado o la salida estándar"""
+    if ruta:
+        return open(ruta, 'w', newline='', encoding='utf-8')
+    return sys.stdout
+
+def comando_export(conn, args):
+    """Exporta una tabla a CSV o JSON Lines fila por fila"""
+    consulta, columna_fecha, orden = CONSULTAS_EXPORTACION[args.tabla]
+    condiciones = []
+    params = []
+    
+    if args.desde or args.hasta:
+        if columna_fecha is None:
+            error(f"La tabla {args.tabla} no admite filtro por fecha")
+        if args.desde:
+            if db.a_timestamp(args.desde) is None:
+                error("La fecha desde no es válida (use AAAA-MM-DD)")
+            condiciones.append(f"{columna_fecha} >= ?")
+            params.append(db.a_timestamp(args.desde))
+        if args.hasta:
+            if db.timestamp_hasta(args.hasta) is None:
+                error("La fecha hasta no es válida (use AAAA-MM-DD)")
+            condiciones.append(f"{columna_fecha} < ?")
+            params.append(db.timestamp_hasta(args.hasta))
+    
+    if args.vencidos:
+        if args.tabla != "mantenimientos":
+            error("--vencidos solo aplica a mantenimientos")
+        condiciones.append("m.estado = 'Pendiente' AND m.fecha_programada_ts < ?")
+        params.append(int(time.time()))
+    
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += f" ORDER BY {orden}"
+    
+    cursor = conn.execute(consulta, params)
+    columnas = [d[0] for d in cursor.description]
+    salida = abrir_salida(args.salida)
+    try:
+        # Se escribe a medida que se leen las filas, sin cargar la tabla completa
+        if args.formato == "json":
+            for fila in cursor:
+                salida.write(json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + "\n")
+        else:
+            escritor = csv.writer(salida)
+            escritor.writerow(columnas)
+            escritor.writerows(cursor)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+
+def comando_backup(conn, args):
+    """Crea una copia de seguridad en línea de la base de datos"""
+    db.respaldar(conn, args.destino)
+    db.registrar_acceso(conn, f"Creó copia de seguridad en {args.destino} (línea de comandos)")
+    print(f"Copia de seguridad creada en {args.destino}")
+
+def comando_stats(conn, args):
+    """Muestra un resumen del estado del laboratorio"""
+    consultas = [
+        ("Equipos por estado", "SELECT estado, COUNT(*) FROM equipos GROUP BY estado ORDER BY estado"),
+        ("Reportes por estado", "SELECT estado, COUNT(*) FROM reportes GROUP BY estado ORDER BY estado"),
+        ("Reservas por estado", "SELECT estado, COUNT(*) FROM reservas GROUP BY estado ORDER BY estado"),
+        ("Mantenimientos por estado", "SELECT estado, COUNT(*) FROM mantenimientos GROUP BY estado ORDER BY estado"),
+    ]
+    for titulo, consulta in consultas:
+        print(f"{titulo}:")
+        for estado, cantidad in conn.execute(consulta):
+            print(f"  {estado or '(sin estado)'}: {cantidad}")
+    
+    bajo_minimo = conn.execute("SELECT COUNT(*) FROM inventario WHERE cantidad < minimo").fetchone()[0]
+    vencidos = conn.execute("""SELECT COUNT(*) FROM mantenimientos
+                               WHERE estado = 'Pendiente' AND fecha_programada_ts < ?""",
+                            (int(time.time()),)).fetchone()[0]
+    print(f"Componentes bajo el mínimo: {bajo_minimo}")
+    print(f"Mantenimientos vencidos: {vencidos}")
+
+def comando_import(conn, args):
+    """Importa filas desde un CSV cuyas cabeceras coinciden con las columnas de la tabla"""
+    # Las columnas calculadas (id, contadores y fechas normalizadas) no se importan
+    permitidas = [col[1] for col in conn.execute(f"PRAGMA table_info({args.tabla})")
+                  if col[1] != "id" and not col[1].endswith("_ts") and not col[1].startswith("num_")]
+    fechas = db.COLUMNAS_FECHA.get(args.tabla, [])
+    
+    try:
+        archivo = open(args.archivo, newline='', encoding='utf-8-sig')
+    except OSError as e:
+        error(f"No se pudo abrir {args.archivo}: {e}")
+    
+    with archivo:
+        lector = csv.DictReader(archivo)
+        columnas = [col for col in (lector.fieldnames or []) if col in permitidas]
+        if not columnas:
+            error(f"El archivo no tiene columnas de la tabla {args.tabla}: {', '.join(permitidas)}")
+        
+        sentencia = f"INSERT INTO {args.tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' for _ in columnas)})"
+        total = 0
+        sin_contrasena = 0
+        lote = []
+        try:
+            # Todo el archivo se importa en una sola transacción: o entra completo o no entra nada
+            for numero, fila in enumerate(lector, start=2):
+                valores = []
+                for col in columnas:
+                    valor = (fila.get(col) or "").strip() or None
+                    if valor and col in fechas:
+                        normalizada = db.normalizar_fecha(valor, "%Y-%m-%d %H:%M:%S" if col == "fecha_hora" else "%Y-%m-%d")
+                        if normalizada is None:
+                            raise ValueError(f"línea {numero}: fecha no válida en {col}: {valor}")
+                        valor = normalizada
+                    if valor and col == "contrasena" and not autenticacion.es_hash(valor):
+                        # Las contraseñas nunca se guardan en texto plano
+                        valor = autenticacion.generar_hash(valor)
+                    valores.append(valor)
+                if args.tabla == "usuarios" and not dict(zip(columnas, valores)).get("contrasena"):
+                    sin_contrasena += 1
+                lote.append(valores)
+                if len(lote) >= TAMANO_LOTE_IMPORTACION:
+                    conn.executemany(sentencia, lote)
+                    total += len(lote)
+                    lote = []
+            conn.executemany(sentencia, lote)
+            total += len(lote)
+            if args.tabla == "inventario":
+                # Los componentes importados abren el libro de movimientos con su cantidad
+                conn.execute("""INSERT INTO movimientos_inventario (componente_id, fecha, fecha_ts, tipo, cantidad, saldo, observaciones)
+                                SELECT id, datetime('now', 'localtime'), CAST(strftime('%s', 'now') AS INTEGER),
+                                       'Entrada', cantidad, cantidad, 'Saldo inicial'
+                                FROM inventario i WHERE cantidad > 0 AND NOT EXISTS
+                                    (SELECT 1 FROM movimientos_inventario m WHERE m.componente_id = i.id)""")
+            db.registrar_acceso(conn, f"Importó {total} registros en {args.tabla} (línea de comandos)",
+                                f"Archivo: {args.archivo}", commit=False)
+            conn.commit()
+        except (sqlite3.Error, ValueError) as e:
+            conn.rollback()
+            error(f"No se pudo importar: {e}")
+    
+    print(f"{total} registros importados en {args.tabla}")
+    if sin_contrasena:
+        print(f"Aviso: {sin_contrasena} usuarios sin contraseña no podrán iniciar sesión hasta que "
+              "un administrador les asigne una", file=sys.stderr)
+
+def comando_consumo(conn, args):
+    """Muestra el consumo diario y los días que faltan para llegar al mínimo de cada componente"""
+    if args.dias < 1:
+        error("--dias debe ser un número positivo")
+    escritor = csv.writer(sys.stdout)
+    escritor.writerow(["id", "componente", "cantidad", "minimo", "proveedor", "consumo_diario",
+                       "dias_hasta_minimo", "dias_hasta_agotar"])
+    escritor.writerows(db.pronostico_consumo(conn, args.dias))
+
+def comando_informe(conn, args):
+    """Genera un informe de una plantilla o todos los informes programados pendientes"""
+    if args.programados:
+        resultados = informes.generar_programados(conn)
+        for programa_id, mensaje in resultados.items():
+            print(f"Informe programado {programa_id}: {mensaje or 'generado'}")
+        if any(resultados.values()):
+            error("Algunos informes no se pudieron generar")
+        return
+    
+    if not args.plantilla:
+        error("Indique una plantilla o --programados")
+    columnas, filas = informes.ejecutar_informe(conn, args.plantilla)
+    if args.salida:
+        try:
+            informes.escribir_informe(args.plantilla, columnas, filas, args.salida, args.formato)
+        except (OSError, ValueError, ImportError) as e:
+            error(f"No se pudo escribir el informe: {e}")
+    elif args.formato == "csv":
+        escritor = csv.writer(sys.stdout)
+        escritor.writerow(columnas)
+        escritor.writerows(filas)
+    else:
+        error(f"El formato {args.formato} necesita --salida")
+
+def comando_vacuum(conn, args):
+    """Archiva registros antiguos si se pide y compacta la base de datos"""
+    if args.archivar:
+        movidos = db.archivar_registros(conn)
+        db.registrar_acceso(conn, "Archivó registros antiguos (línea de comandos)",
+                            ", ".join(f"{tabla}: {cantidad}" for tabla, cantidad in movidos.items()))
+        for tabla, cantidad in movidos.items():
+            print(f"{tabla}: {cantidad} registros archivados")
+    
+    conn.execute("PRAGMA optimize")
+    conn.execute("VACUUM")
+    print("Base de datos compactada")
+
+def comando_serve(conn, args):
+    """Publica los datos en una API REST de solo lectura hasta que se interrumpa"""
+    # Se importa aquí para no cargar el servidor HTTP en el resto de comandos
+    import api_laboratorio
+    
+    servidor = api_laboratorio.crear_servidor(args.db, args.host, args.puerto, args.conexiones)
+    print(f"API disponible en http://{args.host}:{args.puerto}/api (Ctrl+C para detener)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.pool.cerrar()
+
+def comando_servicio(conn, args):
+    """Atiende a las estaciones en modo cliente/servidor hasta que se interrumpa"""
+    import servicio_laboratorio
+    
+    # El servicio abre sus propias conexiones; esta solo sirvió para migrar el esquema
+    conn.close()
+    try:
+        clave = servicio_laboratorio.leer_clave(args.clave_archivo)
+    except OSError as e:
+        error(f"No se pudo leer la clave del servicio: {e}")
+    if not clave:
+        error(f"Indique la clave compartida con --clave-archivo o la variable {servicio_laboratorio.VARIABLE_CLAVE}")
+    print(f"Servicio escuchando en {args.host}:{args.puerto} (Ctrl+C para detener)")
+    servicio_laboratorio.iniciar_servicio(args.db, args.host, args.puerto, clave)
+
+def crear_parser():
+    """Define los subcomandos y sus argumentos"""
+    parser = argparse.ArgumentParser(prog="gestionlab", description="Tareas del laboratorio sin interfaz gráfica")
+    parser.add_argument("--db", default=db.RUTA_DB, help="ruta de la base de datos (por defecto %(default)s)")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    
+    p = subparsers.add_parser("export", help="exporta una tabla a CSV o JSON Lines")
+    p.add_argument("tabla", choices=list(CONSULTAS_EXPORTACION))
+    p.add_argument("--formato", choices=["csv", "json"], default="csv")
+    p.add_argument("--salida", help="archivo de salida (por defecto la salida estándar)")
+    p.add_argument("--desde", help="fecha inicial AAAA-MM-DD")
+    p.add_argument("--hasta", help="fecha final AAAA-MM-DD (incluida)")
+    p.add_argument("--vencidos", action="store_true", help="solo mantenimientos pendientes con fecha vencida")
+    p.set_defaults(funcion=comando_export)
+    
+    p = subparsers.add_parser("backup", help="crea una copia de seguridad en línea")
+    p.add_argument("destino")
+    p.set_defaults(funcion=comando_backup)
+    
+    p = subparsers.add_parser("stats", help="muestra un resumen del laboratorio")
+    p.set_defaults(funcion=comando_stats)
+    
+    p = subparsers.add_parser("import", help="importa registros desde un CSV")
+    p.add_argument("tabla", choices=TABLAS_IMPORTACION)
+    p.add_argument("archivo")
+    p.set_defaults(funcion=comando_import)
+    
+    p = subparsers.add_parser("consumo", help="pronostica el consumo de inventario a partir de los movimientos")
+    p.add_argument("--dias", type=int, default=db.DIAS_CONSUMO, help="días de historial (por defecto %(default)s)")
+    p.set_defaults(funcion=comando_consumo)
+    
+    p = subparsers.add_parser("informe", help="genera un informe de gestión o los informes programados")
+    p.add_argument("plantilla", nargs="?", choices=list(informes.PLANTILLAS_INFORME))
+    p.add_argument("--formato", choices=informes.FORMATOS_INFORME, default="csv")
+    p.add_argument("--salida", help="archivo de salida (por defecto la salida estándar, solo CSV)")
+    p.add_argument("--programados", action="store_true", help="genera los informes programados pendientes")
+    p.set_defaults(funcion=comando_informe)
+    
+    p = subparsers.add_parser("vacuum", help="compacta la base de datos")
+    p.add_argument("--archivar", action="store_true", help="archiva antes los registros antiguos")
+    p.set_defaults(funcion=comando_vacuum)
+    
+    p = subparsers.add_parser("serve", help="publica los datos en una API REST de solo lectura")
+    p.add_argument("--host", default="127.0.0.1", help="dirección en la que escuchar (por defecto %(default)s)")
+    p.add_argument("--puerto", type=int, default=8080)
+    p.add_argument("--conexiones", type=int, default=4, help="conexiones de solo lectura en el pool")
+    p.set_defaults(funcion=comando_serve)
+    
+    p = subparsers.add_parser("servicio", help="atiende a las estaciones de la aplicación en modo cliente/servidor")
+    p.add_argument("--host", default="127.0.0.1", help="dirección en la que escuchar (por defecto %(default)s)")
+    p.add_argument("--puerto", type=int, default=5050)
+    p.add_argument("--clave-archivo", help="archivo con la clave compartida que deben presentar las estaciones")
+    p.set_defaults(funcion=comando_servicio)
+    
+    return parser
+
+def main(argv=None):
+    """Punto de entrada de la línea de comandos"""
+    args = crear_parser().parse_args(argv)
+    try:
+        conn = db.conectar(args.db)
+    except sqlite3.Error as e:
+        error(f"No se pudo abrir la base de datos {args.db}: {e}")
+    
+    try:
+        args.funcion(conn, args)
+    except BrokenPipeError:
+        # La salida se cortó (por ejemplo, con head); no es un error
+        sys.stderr.close()
+    except sqlite3.Error as e:
+        error(str(e))
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
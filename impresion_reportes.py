@@ -0,0 +1,132 @@
+"""Impresión de reportes en lote: muchos reportes en un solo documento HTML o PDF.
+
+Las plantillas se compilan una vez al importar el módulo y cada impresión escribe en un archivo
+temporal propio, de modo que dos impresiones seguidas no se pisan. El renderizado no usa tkinter
+y puede ejecutarse en un hilo de fondo.
+"""
+import html
+import json
+import os
+import tempfile
+import textwrap
+from string import Template
+
+# Columnas que necesitan las plantillas, en este orden
+CONSULTA_REPORTES = """SELECT r.id, e.nombre, r.tipo, r.descripcion, r.fecha, r.estado,
+                              r.solucion, r.usuario, r.prioridad
+                       FROM reportes_todos r LEFT JOIN equipos e ON r.equipo_id = e.id
+                       WHERE r.id IN (SELECT value FROM json_each(?))
+                       ORDER BY r.fecha_ts, r.id"""
+
+PLANTILLA_DOCUMENTO = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>$titulo</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        h1 { color: #333; border-bottom: 1px solid #333; }
+        .reporte { page-break-after: always; }
+        .reporte:last-child { page-break-after: auto; }
+        .info { margin-bottom: 15px; }
+        .label { font-weight: bold; }
+        .desc, .sol { border: 1px solid #ddd; padding: 10px; margin: 10px 0; white-space: pre-wrap; }
+    </style>
+</head>
+<body>
+$reportes
+</body>
+</html>
+""")
+
+PLANTILLA_REPORTE = Template("""<div class="reporte">
+    <h1>Reporte #$id</h1>
+    <div class="info">
+        <span class="label">Equipo:</span> $equipo<br>
+        <span class="label">Tipo:</span> $tipo<br>
+        <span class="label">Prioridad:</span> $prioridad<br>
+        <span class="label">Fecha:</span> $fecha<br>
+        <span class="label">Estado:</span> $estado<br>
+        <span class="label">Reportado por:</span> $usuario<br>
+    </div>
+    <div class="info">
+        <span class="label">Descripción:</span>
+        <div class="desc">$descripcion</div>
+    </div>
+$solucion</div>""")
+
+PLANTILLA_SOLUCION = Template("""    <div class="info">
+        <span class="label">Solución:</span>
+        <div class="sol">$solucion</div>
+    </div>
+""")
+
+# Tamaño A4 en pulgadas y líneas de texto por página del PDF
+TAMANO_PAGINA_PDF = (8.27, 11.69)
+LINEAS_POR_PAGINA_PDF = 55
+ANCHO_LINEA_PDF = 90
+
+def leer_reportes(conn, ids):
+    """Lee los reportes indicados, incluidos los archivados, en una sola consulta"""
+    return conn.execute(CONSULTA_REPORTES, (json.dumps([int(i) for i in ids]),)).fetchall()
+
+def campos_reporte(reporte):
+    """Devuelve los valores de un reporte como textos ya escapados para HTML"""
+    nombres = ["id", "equipo", "tipo", "descripcion", "fecha", "estado", "solucion", "usuario", "prioridad"]
+    return {nombre: html.escape(str(valor)) if valor is not None else "" for nombre, valor in zip(nombres, reporte)}
+
+def renderizar_html(reportes, titulo="Reportes"):
+    """Genera un documento HTML con todos los reportes, uno por página al imprimir"""
+    partes = []
+    for reporte in reportes:
+        campos = campos_reporte(reporte)
+        campos["solucion"] = PLANTILLA_SOLUCION.substitute(solucion=campos["solucion"]) if reporte[6] else ""
+        partes.append(PLANTILLA_REPORTE.substitute(campos))
+    return PLANTILLA_DOCUMENTO.substitute(titulo=html.escape(titulo), reportes="\n".join(partes))
+
+def ruta_temporal(sufijo):
+    """Crea un archivo temporal con nombre único y devuelve su ruta"""
+    descriptor, ruta = tempfile.mkstemp(prefix="reportes_", suffix=sufijo)
+    os.close(descriptor)
+    return ruta
+
+def escribir_html(reportes, ruta=None, titulo="Reportes"):
+    """Escribe el documento HTML de los reportes y devuelve su ruta"""
+    ruta = ruta or ruta_temporal(".html")
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.write(renderizar_html(reportes, titulo))
+    return ruta
+
+def lineas_reporte(reporte):
+    """Devuelve las líneas de texto de un reporte ajustadas al ancho de la página PDF"""
+    lineas = [f"Reporte #{reporte[0]}", ""]
+    for etiqueta, valor in [("Equipo", reporte[1]), ("Tipo", reporte[2]), ("Prioridad", reporte[8]),
+                            ("Fecha", reporte[4]), ("Estado", reporte[5]), ("Reportado por", reporte[7])]:
+        lineas.append(f"{etiqueta}: {valor if valor is not None else ''}")
+    for etiqueta, valor in [("Descripción", reporte[3]), ("Solución", reporte[6])]:
+        if valor:
+            lineas += ["", f"{etiqueta}:"]
+            for parrafo in str(valor).splitlines() or [""]:
+                lineas += textwrap.wrap(parrafo, ANCHO_LINEA_PDF) or [""]
+    return lineas
+
+def escribir_pdf(reportes, ruta=None):
+    """Escribe los reportes en un PDF, uno o más páginas por reporte, y devuelve su ruta"""
+    # Se usa matplotlib, que la aplicación ya requiere, para no depender de un navegador o programa externo
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_pdf import PdfPages
+    
+    ruta = ruta or ruta_temporal(".pdf")
+    with PdfPages(ruta) as pdf:
+        for reporte in reportes:
+            lineas = lineas_reporte(reporte)
+            for inicio in range(0, len(lineas), LINEAS_POR_PAGINA_PDF):
+                # Figure sin pyplot: se puede crear fuera del hilo de la interfaz
+                figura = Figure(figsize=TAMANO_PAGINA_PDF)
+                for numero, linea in enumerate(lineas[inicio:inicio + LINEAS_POR_PAGINA_PDF]):
+                    negrita = numero == 0 and inicio == 0
+                    figura.text(0.08, 0.94 - numero * 0.0165, linea, family="DejaVu Sans",
+                                fontsize=14 if negrita else 9, weight="bold" if negrita else "normal",
+                                va="top")
+                pdf.savefig(figura)
+    return ruta
@@ -0,0 +1,165 @@
+"""Informes de gestión: plantillas SQL reutilizables que se generan a pedido o de forma programada.
+
+Cada plantilla es una consulta que se ejecuta directamente en la base de datos. El resultado se
+guarda en memoria junto con la versión de datos de sus tablas y solo se vuelve a consultar si
+alguna cambió. Los informes programados se escriben en una carpeta en CSV, Excel o HTML:
+    python gestionlab.py informe --programados
+"""
+import csv
+import html
+import os
+import time
+from datetime import datetime
+from string import Template
+import laboratorio_db as db
+
+# Plantillas: nombre -> (título, tablas de las que depende, consulta). Las consultas pueden usar :hoy,
+# el inicio del día actual en segundos desde epoch; su resultado cambia al cambiar de día.
+PLANTILLAS_INFORME = {
+    "reportes_abiertos": (
+        "Reportes abiertos por mes y tipo", ["reportes"],
+        """SELECT strftime('%Y-%m', fecha_ts, 'unixepoch', 'localtime') AS mes, COALESCE(tipo, '') AS tipo,
+                  COUNT(*) AS abiertos, SUM(prioridad = 'Alta') AS prioridad_alta
+           FROM reportes WHERE estado != 'Resuelto'
+           GROUP BY 1, 2 ORDER BY 1 DESC, 2"""),
+    "mantenimientos_vencidos": (
+        "Mantenimientos vencidos", ["mantenimientos", "equipos"],
+        """SELECT m.id, e.nombre AS equipo, m.tipo, m.fecha_programada, m.tecnico,
+                  (:hoy - m.fecha_programada_ts) / 86400 + 1 AS dias_vencido
+           FROM mantenimientos m LEFT JOIN equipos e ON m.equipo_id = e.id
+           WHERE m.estado = 'Pendiente' AND m.fecha_programada_ts < :hoy
+           ORDER BY m.fecha_programada_ts"""),
+    "stock_bajo": (
+        "Componentes bajo el mínimo", ["inventario"],
+        f"""SELECT id, componente, tipo, cantidad, minimo, proveedor, ubicacion,
+                   minimo * {db.FACTOR_REPOSICION} - cantidad AS cantidad_sugerida
+            FROM inventario WHERE cantidad < minimo
+            ORDER BY proveedor, componente"""),
+    "costos_mensuales": (
+        "Costos de mantenimiento por mes", ["mantenimientos"],
+        """SELECT valor AS mes, cantidad AS mantenimientos, ROUND(total, 2) AS costo_total
+           FROM costos_mantenimiento WHERE dimension = 'mes' AND cantidad > 0
+           ORDER BY valor DESC"""),
+}
+
+FORMATOS_INFORME = ["csv", "xlsx", "html"]
+
+# Días entre dos ejecuciones de un informe programado
+FRECUENCIAS_INFORME = {"Diario": 1, "Semanal": 7, "Mensual": 30}
+
+# Plantilla HTML compilada una sola vez
+PLANTILLA_HTML = Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>$titulo</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        h1 { color: #333; border-bottom: 1px solid #333; }
+        table { border-collapse: collapse; }
+        th, td { border: 1px solid #ddd; padding: 4px 8px; }
+        th { background: #f0f0f0; }
+    </style>
+</head>
+<body>
+    <h1>$titulo</h1>
+    <p>Generado el $fecha - $cantidad filas</p>
+    <table>
+        <tr>$cabecera</tr>
+$filas
+    </table>
+</body>
+</html>
+""")
+
+def inicio_del_dia(ahora=None):
+    """Devuelve el inicio del día local de un instante, en segundos desde epoch"""
+    fecha = datetime.fromtimestamp(ahora or time.time())
+    return int(fecha.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+def ejecutar_informe(conn, nombre, cache=None, ahora=None):
+    """Devuelve (columnas, filas) de una plantilla, reutilizando el resultado guardado en cache si los datos no cambiaron"""
+    _, tablas, consulta = PLANTILLAS_INFORME[nombre]
+    hoy = inicio_del_dia(ahora)
+    clave = tuple(db.leer_version_datos(conn, tabla) for tabla in tablas) + (hoy if ":hoy" in consulta else None,)
+    
+    guardado = cache.get(nombre) if cache is not None else None
+    if guardado is not None and guardado[0] == clave:
+        return guardado[1], guardado[2]
+    
+    cursor = conn.execute(consulta, {"hoy": hoy} if ":hoy" in consulta else {})
+    filas = cursor.fetchall()
+    columnas = [d[0] for d in cursor.description]
+    if cache is not None:
+        cache[nombre] = (clave, columnas, filas)
+    return columnas, filas
+
+def escribir_informe(nombre, columnas, filas, ruta, formato):
+    """Escribe el resultado de una plantilla en CSV, Excel o HTML"""
+    if formato == "csv":
+        with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(columnas)
+            escritor.writerows(filas)
+    elif formato == "xlsx":
+        # pandas solo se carga para Excel, que es el único formato que lo necesita
+        import pandas as pd
+        pd.DataFrame([tuple(fila) for fila in filas], columns=columnas).to_excel(ruta, index=False)
+    elif formato == "html":
+        celdas = lambda valores, etiqueta: "".join(
+            f"<{etiqueta}>{html.escape(str(v)) if v is not None else ''}</{etiqueta}>" for v in valores)
+        contenido = PLANTILLA_HTML.substitute(
+            titulo=html.escape(PLANTILLAS_INFORME[nombre][0]),
+            fecha=datetime.now().strftime("%Y-%m-%d %H:%M"),
+            cantidad=len(filas),
+            cabecera=celdas(columnas, "th"),
+            filas="\n".join(f"        <tr>{celdas(fila, 'td')}</tr>" for fila in filas))
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            archivo.write(contenido)
+    else:
+        raise ValueError(f"Formato de informe no válido: {formato}")
+
+def informes_pendientes(conn, ahora=None):
+    """Devuelve los informes programados activos que ya deben generarse: [(id, plantilla, formato, carpeta)]"""
+    ahora = ahora or time.time()
+    casos = " ".join(f"WHEN '{frecuencia}' THEN {dias}" for frecuencia, dias in FRECUENCIAS_INFORME.items())
+    return conn.execute(f"""SELECT id, plantilla, formato, carpeta FROM informes_programados
+                            WHERE activo = 1 AND (ultima_ejecucion_ts IS NULL
+                                  OR ultima_ejecucion_ts + (CASE frecuencia {casos} END) * 86400 <= ?)
+                            ORDER BY id""", (int(ahora),)).fetchall()
+
+def preparar_programados(conn, cache=None, ahora=None):
+    """Ejecuta las plantillas de los informes pendientes: [(id, plantilla, columnas, filas, ruta, formato)]"""
+    trabajos = []
+    fecha = datetime.fromtimestamp(ahora or time.time()).strftime("%Y-%m-%d")
+    for programa_id, plantilla, formato, carpeta in informes_pendientes(conn, ahora):
+        columnas, filas = ejecutar_informe(conn, plantilla, cache, ahora)
+        ruta = os.path.join(carpeta, f"{plantilla}_{fecha}.{formato}")
+        trabajos.append((programa_id, plantilla, columnas, filas, ruta, formato))
+    return trabajos
+
+def escribir_programados(trabajos):
+    """Escribe los archivos de los informes preparados; devuelve {id: error o None}"""
+    # No usa la base de datos: puede ejecutarse en un hilo de fondo
+    resultados = {}
+    for programa_id, plantilla, columnas, filas, ruta, formato in trabajos:
+        try:
+            os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+            escribir_informe(plantilla, columnas, filas, ruta, formato)
+            resultados[programa_id] = None
+        except (OSError, ValueError, ImportError) as e:
+            resultados[programa_id] = str(e)
+    return resultados
+
+def marcar_ejecutados(conn, resultados, ahora=None):
+    """Guarda la fecha de ejecución de los informes escritos sin error"""
+    ahora = int(ahora or time.time())
+    conn.executemany("UPDATE informes_programados SET ultima_ejecucion_ts = ? WHERE id = ?",
+                     [(ahora, programa_id) for programa_id, error in resultados.items() if error is None])
+    conn.commit()
+
+def generar_programados(conn, cache=None, ahora=None):
+    """Genera en el momento todos los informes programados pendientes; devuelve {id: error o None}"""
+    resultados = escribir_programados(preparar_programados(conn, cache, ahora))
+    marcar_ejecutados(conn, resultados, ahora)
+    return resultados
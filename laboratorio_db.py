@@ -0,0 +1,1451 @@
+import json
+import sqlite3
+import shutil
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import autenticacion
+
+# Capa de datos compartida por la interfaz gráfica y la línea de comandos; no debe importar tkinter ni matplotlib
+RUTA_DB = 'laboratorio.db'
+
+# Días hacia adelante en los que se generan las ocurrencias de los planes de mantenimiento
+HORIZONTE_PLANES_DIAS = 30
+
+# Al reponer un componente bajo el mínimo se sugiere pedir hasta este múltiplo del mínimo
+FACTOR_REPOSICION = 2
+
+# Días de historial de salidas con los que se calcula el consumo diario de cada componente
+DIAS_CONSUMO = 90
+
+# Tipos de movimiento de inventario; en los ajustes la cantidad indicada es el recuento final
+TIPOS_MOVIMIENTO = ["Entrada", "Salida", "Ajuste"]
+
+# Días que como máximo indexa el calendario de ocupación por cada reserva o mantenimiento
+MAXIMO_DIAS_OCUPACION = 366
+
+# Espera máxima entre dos revisiones de estados de reservas, para recoger las creadas por otras estaciones
+MAXIMA_ESPERA_ESTADOS_S = 15 * 60
+
+# Límite de reservas que puede crear una sola reserva múltiple
+MAXIMO_RESERVAS_LOTE = 5000
+
+# Objetivos de resolución de reportes por prioridad, en horas (se guardan en configuracion como sla_horas_<prioridad>)
+SLA_HORAS_POR_DEFECTO = {"Alta": 24, "Media": 72, "Baja": 168}
+
+# Dimensiones de los agregados de tiempos de resolución y la expresión de la fila que da su valor
+DIMENSIONES_SLA = {
+    "total": "''",
+    "tipo": "COALESCE({fila}.tipo, '')",
+    "prioridad": "COALESCE({fila}.prioridad, '')",
+    "equipo": "COALESCE(CAST({fila}.equipo_id AS TEXT), '')",
+}
+
+# Años completos que tenía el equipo al hacerse el mantenimiento, según la fecha de adquisición dada
+EXPRESION_ANTIGUEDAD = ("COALESCE(CAST((COALESCE({fila}.fecha_realizado_ts, {fila}.fecha_programada_ts) "
+                        "- {adquisicion}) / 31557600 AS TEXT), '')")
+
+# Dimensiones de los agregados de costos de mantenimiento y la expresión de la fila que da su valor
+DIMENSIONES_COSTO = {
+    "total": "''",
+    "equipo": "COALESCE(CAST({fila}.equipo_id AS TEXT), '')",
+    "tipo": "COALESCE({fila}.tipo, '')",
+    "mes": ("COALESCE(strftime('%Y-%m', COALESCE({fila}.fecha_realizado_ts, {fila}.fecha_programada_ts), "
+            "'unixepoch', 'localtime'), '')"),
+    "tecnico": "COALESCE({fila}.tecnico, '')",
+    # Depende de la fila del equipo: sentencias_antiguedad_costos mueve sus mantenimientos si esta cambia
+    "antiguedad": EXPRESION_ANTIGUEDAD.format(
+        fila="{fila}", adquisicion="(SELECT fecha_adquisicion_ts FROM equipos WHERE id = {fila}.equipo_id)"),
+}
+
+# Solo suman a los costos los mantenimientos realizados con un costo cargado
+CONDICION_COSTO = "{fila}.estado = 'Completado' AND {fila}.costo > 0"
+
+# Crea el usuario administrador "admin" con un id nuevo si no existe ninguno con ese nombre
+SEMBRAR_ADMINISTRADOR = """INSERT INTO usuarios (nombre, rol, usuario, fecha_registro, estado)
+    SELECT 'Administrador', 'Administrador', 'admin', datetime('now', 'localtime'), 'Activo'
+    WHERE NOT EXISTS (SELECT 1 FROM usuarios WHERE usuario = 'admin')"""
+
+# Filas que se leen por página en el historial de un equipo
+HISTORIAL_POR_PAGINA = 50
+
+# Ramas del historial de un equipo: (origen, tablas, columna _ts, columna de fecha, expresión del resumen)
+RAMAS_HISTORIAL = [
+    ("Reporte", ["reportes", "reportes_archivo"], "fecha_ts", "fecha",
+     "COALESCE(tipo, '') || ': ' || COALESCE(descripcion, '')"),
+    ("Reserva", ["reservas", "reservas_archivo"], "fecha_inicio_ts", "fecha_inicio", "COALESCE(proposito, '')"),
+    ("Mantenimiento", ["mantenimientos"], "fecha_programada_ts", "fecha_programada",
+     "COALESCE(tipo, '') || ': ' || COALESCE(descripcion, '')"),
+]
+
+# Formatos aceptados al interpretar fechas escritas por el usuario o guardadas por versiones anteriores
+FORMATOS_FECHA = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S",
+                  "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%d-%m-%Y %H:%M", "%d-%m-%Y"]
+
+# Columnas de fecha en texto que tienen una copia normalizada <columna>_ts (segundos desde epoch)
+COLUMNAS_FECHA = {
+    "equipos": ["fecha_adquisicion", "ultimo_mantenimiento"],
+    "reportes": ["fecha"],
+    "reservas": ["fecha_inicio", "fecha_fin"],
+    "mantenimientos": ["fecha_programada", "fecha_realizado"],
+    "accesos": ["fecha_hora"],
+}
+
+
+def parsear_fecha(texto):
+    """Convierte un texto de fecha en datetime o devuelve None si no tiene un formato válido"""
+    if not texto:
+        return None
+    texto = str(texto).strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return None
+
+def a_timestamp(texto):
+    """Convierte un texto de fecha (hora local) en segundos desde epoch, o None si no es válido"""
+    fecha = parsear_fecha(texto)
+    return int(fecha.timestamp()) if fecha else None
+
+def normalizar_fecha(texto, formato="%Y-%m-%d"):
+    """Reescribe una fecha válida en el formato estándar; devuelve None si no se puede interpretar"""
+    fecha = parsear_fecha(texto)
+    return fecha.strftime(formato) if fecha else None
+
+def timestamp_hasta(texto):
+    """Límite superior exclusivo de un filtro "hasta"; una fecha sin hora incluye todo ese día"""
+    fecha = parsear_fecha(texto)
+    if fecha is None:
+        return None
+    if len(str(texto).strip()) <= 10:
+        fecha += timedelta(days=1)
+    else:
+        fecha += timedelta(seconds=1)
+    return int(fecha.timestamp())
+
+def sentencias_contador(tabla, contador):
+    """Devuelve los triggers que mantienen en equipos el contador de registros de una tabla"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_contador_insert AFTER INSERT ON {tabla}
+            BEGIN
+                UPDATE equipos SET {contador} = {contador} + 1 WHERE id = NEW.equipo_id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_contador_delete AFTER DELETE ON {tabla}
+            BEGIN
+                UPDATE equipos SET {contador} = {contador} - 1 WHERE id = OLD.equipo_id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_contador_update AFTER UPDATE OF equipo_id ON {tabla}
+            WHEN OLD.equipo_id IS NOT NEW.equipo_id
+            BEGIN
+                UPDATE equipos SET {contador} = {contador} - 1 WHERE id = OLD.equipo_id;
+                UPDATE equipos SET {contador} = {contador} + 1 WHERE id = NEW.equipo_id;
+            END""",
+    ]
+
+def sentencias_vista_archivo(tabla, columnas):
+    """Devuelve las sentencias que (re)crean la vista que une una tabla con su archivo"""
+    lista = ", ".join(columnas)
+    return [
+        f"DROP VIEW IF EXISTS {tabla}_todos",
+        f"""CREATE VIEW {tabla}_todos AS
+            SELECT {lista}, 0 AS archivado FROM {tabla}
+            UNION ALL
+            SELECT {lista}, 1 AS archivado FROM {tabla}_archivo""",
+    ]
+
+def sentencias_fechas_normalizadas(tabla, columnas):
+    """Devuelve los triggers que mantienen las columnas <columna>_ts al insertar o modificar fechas"""
+    asignaciones = ", ".join(f"{col}_ts = CAST(strftime('%s', NEW.{col}, 'utc') AS INTEGER)" for col in columnas)
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fechas_insert AFTER INSERT ON {tabla}
+            BEGIN
+                UPDATE {tabla} SET {asignaciones} WHERE id = NEW.id;
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_fechas_update AFTER UPDATE OF {", ".join(columnas)} ON {tabla}
+            BEGIN
+                UPDATE {tabla} SET {asignaciones} WHERE id = NEW.id;
+            END""",
+    ]
+
+def migrar_fechas_normalizadas(c):
+    """Agrega las columnas <columna>_ts y las calcula a partir de las fechas en texto existentes"""
+    tablas = dict(COLUMNAS_FECHA)
+    tablas.update({
+        "reportes_archivo": COLUMNAS_FECHA["reportes"],
+        "reservas_archivo": COLUMNAS_FECHA["reservas"],
+        "accesos_archivo": COLUMNAS_FECHA["accesos"],
+    })
+    
+    for tabla, columnas in tablas.items():
+        for col in columnas:
+            c.execute(f"ALTER TABLE {tabla} ADD COLUMN {col}_ts INTEGER")
+        
+        # Se interpreta en Python porque los datos antiguos tienen formatos libres
+        filas = c.execute(f"SELECT id, {', '.join(columnas)} FROM {tabla}").fetchall()
+        c.executemany(f"UPDATE {tabla} SET {', '.join(col + '_ts = ?' for col in columnas)} WHERE id = ?",
+                      [[a_timestamp(valor) for valor in fila[1:]] + [fila[0]] for fila in filas])
+        
+        # Las tablas de archivo reciben las columnas ya calculadas al archivar
+        if not tabla.endswith("_archivo"):
+            for sentencia in sentencias_fechas_normalizadas(tabla, columnas):
+                c.execute(sentencia)
+
+def sentencias_version_datos(tabla, columnas):
+    """Devuelve los triggers que incrementan la versión de una tabla cuando cambian sus datos"""
+    incremento = f"UPDATE versiones_datos SET version = version + 1 WHERE tabla = '{tabla}';"
+    return [
+        f"INSERT OR IGNORE INTO versiones_datos (tabla, version) VALUES ('{tabla}', 0)",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_version_insert AFTER INSERT ON {tabla}
+            BEGIN
+                {incremento}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_version_delete AFTER DELETE ON {tabla}
+            BEGIN
+                {incremento}
+            END""",
+        # Solo las columnas indicadas, para que los contadores y las fechas normalizadas no cambien la versión
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_version_update AFTER UPDATE OF {", ".join(columnas)} ON {tabla}
+            BEGIN
+                {incremento}
+            END""",
+    ]
+
+def sentencias_alerta_stock():
+    """Devuelve los triggers que registran una alerta cuando un componente queda bajo el mínimo"""
+    alerta = """INSERT INTO alertas_stock (componente_id, fecha, cantidad, minimo)
+                    VALUES (NEW.id, datetime('now', 'localtime'), NEW.cantidad, NEW.minimo);"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_inventario_alerta_insert AFTER INSERT ON inventario
+            WHEN NEW.cantidad < NEW.minimo
+            BEGIN
+                {alerta}
+            END""",
+        # Solo al cruzar el umbral: un componente que ya estaba bajo el mínimo no repite la alerta
+        f"""CREATE TRIGGER IF NOT EXISTS trg_inventario_alerta_update AFTER UPDATE OF cantidad, minimo ON inventario
+            WHEN NEW.cantidad < NEW.minimo AND NOT (OLD.cantidad < OLD.minimo)
+            BEGIN
+                {alerta}
+            END""",
+    ]
+
+def sentencias_ocupacion(tabla, origen, columna_inicio, columna_fin, condicion):
+    """Devuelve los triggers que mantienen en ocupacion una fila por día ocupado de cada registro de una tabla"""
+    # Sin columna de fin el registro ocupa el día completo de su fecha de inicio
+    inicio = f"NEW.{columna_inicio}"
+    fin = f"NEW.{columna_fin}" if columna_fin else f"NEW.{columna_inicio} + 86400"
+    columnas = ", ".join(col for col in ("equipo_id", "estado", columna_inicio, columna_fin) if col)
+    borrar = f"DELETE FROM ocupacion WHERE origen = '{origen}' AND origen_id = OLD.id;"
+    # Los triggers no admiten WITH RECURSIVE: los días se generan con la tabla secuencia
+    insertar = f"""INSERT OR IGNORE INTO ocupacion (dia, equipo_id, origen, origen_id, inicio_ts, fin_ts)
+                SELECT date({inicio}, 'unixepoch', 'localtime', '+' || s.n || ' days'), NEW.equipo_id,
+                       '{origen}', NEW.id, {inicio}, {fin}
+                FROM secuencia s
+                WHERE NEW.equipo_id IS NOT NULL AND NEW.{condicion}
+                  AND s.n <= julianday(date({fin} - 1, 'unixepoch', 'localtime'))
+                             - julianday(date({inicio}, 'unixepoch', 'localtime'));"""
+    return [
+        # Las columnas _ts las calcula otro trigger después de insertar, así que basta con vigilar su actualización
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_ocupacion_update AFTER UPDATE OF {columnas} ON {tabla}
+            BEGIN
+                {borrar}
+                {insertar}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_ocupacion_delete AFTER DELETE ON {tabla}
+            BEGIN
+                {borrar}
+            END""",
+    ]
+
+def acumular_tiempos_resolucion(fila, duracion, signo):
+    """Devuelve las sentencias que suman (signo '') o restan (signo '-') un reporte resuelto a los tiempos de resolución"""
+    # Dentro del objetivo si no hay objetivo para la prioridad o si la duración no lo supera
+    dentro = (f"COALESCE({duracion} <= (SELECT CAST(valor AS INTEGER) * 3600 FROM configuracion "
+              f"WHERE clave = 'sla_horas_' || {fila}.prioridad), 1)")
+    return "\n".join(
+        f"""INSERT INTO tiempos_resolucion (dimension, valor, resueltos, suma_s, dentro_sla)
+            VALUES ('{dimension}', {expresion.format(fila=fila)}, {signo}1, {signo}({duracion}), {signo}({dentro}))
+            ON CONFLICT (dimension, valor) DO UPDATE SET
+                resueltos = resueltos + excluded.resueltos,
+                suma_s = suma_s + excluded.suma_s,
+                dentro_sla = dentro_sla + excluded.dentro_sla;"""
+        for dimension, expresion in DIMENSIONES_SLA.items())
+
+def sentencias_sla_reportes():
+    """Devuelve los triggers que sellan los cambios de estado de los reportes y acumulan sus tiempos de resolución"""
+    ahora = "CAST(strftime('%s', 'now') AS INTEGER)"
+    acumular = acumular_tiempos_resolucion
+    
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reportes_estado_fechas AFTER UPDATE OF estado ON reportes
+            WHEN NEW.estado IS NOT OLD.estado
+            BEGIN
+                UPDATE reportes SET
+                    fecha_en_progreso_ts = CASE WHEN NEW.estado = 'En Progreso'
+                                                THEN COALESCE(fecha_en_progreso_ts, {ahora})
+                                                ELSE fecha_en_progreso_ts END,
+                    fecha_resuelto_ts = CASE WHEN NEW.estado = 'Resuelto' THEN {ahora} ELSE NULL END
+                WHERE id = NEW.id;
+            END""",
+        # Los agregados se actualizan al resolver y se descuentan al reabrir: nunca se recorre la tabla
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reportes_sla_resuelto AFTER UPDATE OF estado ON reportes
+            WHEN NEW.estado = 'Resuelto' AND OLD.estado IS NOT 'Resuelto' AND NEW.fecha_ts IS NOT NULL
+            BEGIN
+                {acumular("NEW", f"{ahora} - NEW.fecha_ts", "")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reportes_sla_reabierto AFTER UPDATE OF estado ON reportes
+            WHEN OLD.estado = 'Resuelto' AND NEW.estado IS NOT 'Resuelto'
+                 AND OLD.fecha_resuelto_ts IS NOT NULL AND OLD.fecha_ts IS NOT NULL
+            BEGIN
+                {acumular("OLD", "OLD.fecha_resuelto_ts - OLD.fecha_ts", "-")}
+            END""",
+    ]
+
+def sentencias_sla_ediciones():
+    """Devuelve los triggers que ajustan los tiempos de resolución al crear, editar, archivar o borrar reportes resueltos"""
+    resuelto = "{fila}.estado = 'Resuelto' AND {fila}.fecha_resuelto_ts IS NOT NULL AND {fila}.fecha_ts IS NOT NULL"
+    acumular = lambda fila, signo: acumular_tiempos_resolucion(
+        fila, f"{fila}.fecha_resuelto_ts - {fila}.fecha_ts", signo)
+    
+    # Cuentan los reportes resueltos de las dos tablas: archivar suma en reportes_archivo y resta en reportes
+    sentencias = []
+    for tabla in ("reportes", "reportes_archivo"):
+        sentencias += [
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_sla_insert AFTER INSERT ON {tabla}
+                WHEN {resuelto.format(fila="NEW")}
+                BEGIN
+                    {acumular("NEW", "")}
+                END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{tabla}_sla_delete AFTER DELETE ON {tabla}
+                WHEN {resuelto.format(fila="OLD")}
+                BEGIN
+                    {acumular("OLD", "-")}
+                END""",
+        ]
+    
+    # Editar un reporte resuelto lo mueve de grupo o cambia su duración; los cambios de estado ya los
+    # ajustan trg_reportes_sla_resuelto y trg_reportes_sla_reabierto
+    columnas = "tipo, prioridad, equipo_id, fecha_ts"
+    return sentencias + [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reportes_sla_editado_resta AFTER UPDATE OF {columnas} ON reportes
+            WHEN NEW.estado = 'Resuelto' AND {resuelto.format(fila="OLD")}
+            BEGIN
+                {acumular("OLD", "-")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_reportes_sla_editado_suma AFTER UPDATE OF {columnas} ON reportes
+            WHEN OLD.estado = 'Resuelto' AND {resuelto.format(fila="NEW")}
+            BEGIN
+                {acumular("NEW", "")}
+            END""",
+    ]
+
+def sentencias_llenar_tiempos_resolucion():
+    """Devuelve las sentencias que calculan los tiempos de resolución desde todos los reportes, incluidos los archivados"""
+    return [f"""INSERT INTO tiempos_resolucion (dimension, valor, resueltos, suma_s, dentro_sla)
+                SELECT '{dimension}', {expresion.format(fila="r")}, COUNT(*),
+                       SUM(r.fecha_resuelto_ts - r.fecha_ts),
+                       SUM(COALESCE(r.fecha_resuelto_ts - r.fecha_ts <= CAST(c.valor AS INTEGER) * 3600, 1))
+                FROM reportes_todos r
+                LEFT JOIN configuracion c ON c.clave = 'sla_horas_' || r.prioridad
+                WHERE r.estado = 'Resuelto' AND r.fecha_resuelto_ts IS NOT NULL AND r.fecha_ts IS NOT NULL
+                GROUP BY 2"""
+            for dimension, expresion in DIMENSIONES_SLA.items()]
+
+def sentencias_costos_mantenimiento():
+    """Devuelve los triggers que mantienen los agregados de costos al crear, editar o borrar mantenimientos"""
+    def acumular(fila, signo):
+        return "\n".join(
+            f"""INSERT INTO costos_mantenimiento (dimension, valor, cantidad, total)
+                VALUES ('{dimension}', {expresion.format(fila=fila)}, {signo}1, {signo}{fila}.costo)
+                ON CONFLICT (dimension, valor) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad,
+                    total = total + excluded.total;"""
+            for dimension, expresion in DIMENSIONES_COSTO.items())
+    
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_mantenimientos_costo_insert AFTER INSERT ON mantenimientos
+            WHEN {CONDICION_COSTO.format(fila="NEW")}
+            BEGIN
+                {acumular("NEW", "")}
+            END""",
+        # Una edición descuenta la fila anterior y suma la nueva; también cubre el cálculo posterior de las _ts
+        f"""CREATE TRIGGER IF NOT EXISTS trg_mantenimientos_costo_update_old AFTER UPDATE OF equipo_id, tipo, estado,
+                costo, tecnico, fecha_programada_ts, fecha_realizado_ts ON mantenimientos
+            WHEN {CONDICION_COSTO.format(fila="OLD")}
+            BEGIN
+                {acumular("OLD", "-")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_mantenimientos_costo_update_new AFTER UPDATE OF equipo_id, tipo, estado,
+                costo, tecnico, fecha_programada_ts, fecha_realizado_ts ON mantenimientos
+            WHEN {CONDICION_COSTO.format(fila="NEW")}
+            BEGIN
+                {acumular("NEW", "")}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_mantenimientos_costo_delete AFTER DELETE ON mantenimientos
+            WHEN {CONDICION_COSTO.format(fila="OLD")}
+            BEGIN
+                {acumular("OLD", "-")}
+            END""",
+    ]
+
+def sentencias_antiguedad_costos():
+    """Devuelve los triggers que mueven los costos de un equipo entre grupos de antigüedad al cambiar o borrar el equipo"""
+    def mover(desde, hacia):
+        # Descuenta los mantenimientos del equipo de su grupo según una fecha de adquisición y los suma según otra
+        return "\n".join(
+            f"""INSERT INTO costos_mantenimiento (dimension, valor, cantidad, total)
+                SELECT 'antiguedad', {EXPRESION_ANTIGUEDAD.format(fila="m", adquisicion=adquisicion)},
+                       {signo}COUNT(*), {signo}SUM(m.costo)
+                FROM mantenimientos m
+                WHERE m.equipo_id = OLD.id AND {CONDICION_COSTO.format(fila="m")}
+                GROUP BY 2
+                ON CONFLICT (dimension, valor) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad,
+                    total = total + excluded.total;"""
+            for adquisicion, signo in ((desde, "-"), (hacia, "")))
+    
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_equipos_costo_antiguedad AFTER UPDATE OF fecha_adquisicion_ts ON equipos
+            WHEN OLD.fecha_adquisicion_ts IS NOT NEW.fecha_adquisicion_ts
+            BEGIN
+                {mover("OLD.fecha_adquisicion_ts", "NEW.fecha_adquisicion_ts")}
+            END""",
+        # Los mantenimientos se borran en cascada después del equipo, cuando su antigüedad ya no se puede
+        # calcular: antes se pasan al grupo sin antigüedad, que es de donde los descontará su trigger de borrado
+        f"""CREATE TRIGGER IF NOT EXISTS trg_equipos_costo_antiguedad_delete BEFORE DELETE ON equipos
+            BEGIN
+                {mover("OLD.fecha_adquisicion_ts", "NULL")}
+            END""",
+    ]
+
+def sentencias_llenar_costos():
+    """Devuelve las sentencias que calculan los agregados de costos desde todos los mantenimientos"""
+    return [f"""INSERT INTO costos_mantenimiento (dimension, valor, cantidad, total)
+                SELECT '{dimension}', {expresion.format(fila="m")}, COUNT(*), SUM(m.costo)
+                FROM mantenimientos m
+                WHERE {CONDICION_COSTO.format(fila="m")}
+                GROUP BY 2"""
+            for dimension, expresion in DIMENSIONES_COSTO.items()]
+
+# Suma cada movimiento de entrada o salida al consumo de su componente en su día
+TRIGGER_CONSUMO_DIARIO = """CREATE TRIGGER IF NOT EXISTS trg_movimientos_consumo AFTER INSERT ON movimientos_inventario
+        BEGIN
+            INSERT INTO consumo_diario (componente_id, dia, entradas, salidas)
+            VALUES (NEW.componente_id, date(NEW.fecha),
+                    CASE WHEN NEW.tipo = 'Entrada' THEN NEW.cantidad ELSE 0 END,
+                    CASE WHEN NEW.tipo = 'Salida' THEN -NEW.cantidad ELSE 0 END)
+            ON CONFLICT (componente_id, dia) DO UPDATE SET
+                entradas = entradas + excluded.entradas,
+                salidas = salidas + excluded.salidas;
+        END"""
+
+# Migraciones de esquema en orden; PRAGMA user_version guarda cuántas se aplicaron.
+# Cada una es una lista de sentencias SQL o una función que recibe el cursor.
+MIGRACIONES = [
+    # 1: claves foráneas con borrado en cascada y contadores por equipo
+    [
+        # Usuario administrador al que se atribuyen las acciones sin sesión (su id se guarda en la migración 18)
+        SEMBRAR_ADMINISTRADOR,
+        
+        # Registros huérfanos de equipos o usuarios eliminados antes de activar las claves foráneas
+        "DELETE FROM reservas WHERE equipo_id NOT IN (SELECT id FROM equipos)",
+        "DELETE FROM mantenimientos WHERE equipo_id NOT IN (SELECT id FROM equipos)",
+        "UPDATE reportes SET equipo_id = NULL WHERE equipo_id NOT IN (SELECT id FROM equipos)",
+        "UPDATE reservas SET usuario_id = NULL WHERE usuario_id NOT IN (SELECT id FROM usuarios)",
+        "UPDATE accesos SET usuario_id = NULL WHERE usuario_id NOT IN (SELECT id FROM usuarios)",
+        
+        """CREATE TABLE reportes_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipo_id INTEGER,
+            tipo TEXT,
+            descripcion TEXT,
+            fecha TEXT,
+            estado TEXT,
+            solucion TEXT,
+            usuario TEXT,
+            prioridad TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos (id) ON DELETE CASCADE
+        )""",
+        "INSERT INTO reportes_nueva SELECT * FROM reportes",
+        "DROP TABLE reportes",
+        "ALTER TABLE reportes_nueva RENAME TO reportes",
+        
+        """CREATE TABLE reservas_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipo_id INTEGER,
+            usuario_id INTEGER,
+            fecha_inicio TEXT,
+            fecha_fin TEXT,
+            proposito TEXT,
+            estado TEXT,
+            fecha_solicitud TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos (id) ON DELETE CASCADE,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )""",
+        "INSERT INTO reservas_nueva SELECT * FROM reservas",
+        "DROP TABLE reservas",
+        "ALTER TABLE reservas_nueva RENAME TO reservas",
+        
+        """CREATE TABLE mantenimientos_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipo_id INTEGER,
+            tipo TEXT,
+            fecha_programada TEXT,
+            fecha_realizado TEXT,
+            descripcion TEXT,
+            tecnico TEXT,
+            estado TEXT,
+            costo REAL,
+            observaciones TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos (id) ON DELETE CASCADE
+        )""",
+        "INSERT INTO mantenimientos_nueva SELECT * FROM mantenimientos",
+        "DROP TABLE mantenimientos",
+        "ALTER TABLE mantenimientos_nueva RENAME TO mantenimientos",
+        
+        """CREATE TABLE accesos_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            fecha_hora TEXT,
+            accion TEXT,
+            detalles TEXT,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE SET NULL
+        )""",
+        "INSERT INTO accesos_nueva SELECT * FROM accesos",
+        "DROP TABLE accesos",
+        "ALTER TABLE accesos_nueva RENAME TO accesos",
+        
+        # Índices para que el borrado en cascada no recorra las tablas completas
+        "CREATE INDEX IF NOT EXISTS idx_reportes_equipo ON reportes (equipo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_equipo ON reservas (equipo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_usuario ON reservas (usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_mantenimientos_equipo ON mantenimientos (equipo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_usuario ON accesos (usuario_id)",
+        
+        # Contadores precalculados para la vista previa del impacto de un borrado
+        "ALTER TABLE equipos ADD COLUMN num_reportes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE equipos ADD COLUMN num_reservas INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE equipos ADD COLUMN num_mantenimientos INTEGER NOT NULL DEFAULT 0",
+        """UPDATE equipos SET
+            num_reportes = (SELECT COUNT(*) FROM reportes WHERE equipo_id = equipos.id),
+            num_reservas = (SELECT COUNT(*) FROM reservas WHERE equipo_id = equipos.id),
+            num_mantenimientos = (SELECT COUNT(*) FROM mantenimientos WHERE equipo_id = equipos.id)""",
+    ]
+    + sentencias_contador("reportes", "num_reportes")
+    + sentencias_contador("reservas", "num_reservas")
+    + sentencias_contador("mantenimientos", "num_mantenimientos"),
+    
+    # 2: tablas de archivo para reportes resueltos, reservas finalizadas y accesos antiguos
+    [
+        """CREATE TABLE IF NOT EXISTS configuracion (
+            clave TEXT PRIMARY KEY,
+            valor TEXT
+        )""",
+        "INSERT OR IGNORE INTO configuracion (clave, valor) VALUES ('dias_archivo', '365')",
+        
+        """CREATE TABLE reportes_archivo (
+            id INTEGER PRIMARY KEY,
+            equipo_id INTEGER,
+            tipo TEXT,
+            descripcion TEXT,
+            fecha TEXT,
+            estado TEXT,
+            solucion TEXT,
+            usuario TEXT,
+            prioridad TEXT,
+            fecha_archivado TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos (id) ON DELETE CASCADE
+        )""",
+        
+        """CREATE TABLE reservas_archivo (
+            id INTEGER PRIMARY KEY,
+            equipo_id INTEGER,
+            usuario_id INTEGER,
+            fecha_inicio TEXT,
+            fecha_fin TEXT,
+            proposito TEXT,
+            estado TEXT,
+            fecha_solicitud TEXT,
+            fecha_archivado TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos (id) ON DELETE CASCADE,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )""",
+        
+        """CREATE TABLE accesos_archivo (
+            id INTEGER PRIMARY KEY,
+            usuario_id INTEGER,
+            fecha_hora TEXT,
+            accion TEXT,
+            detalles TEXT,
+            fecha_archivado TEXT,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE SET NULL
+        )""",
+        
+        "CREATE INDEX IF NOT EXISTS idx_reportes_archivo_equipo ON reportes_archivo (equipo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reportes_archivo_fecha ON reportes_archivo (fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_archivo_equipo ON reservas_archivo (equipo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_archivo_usuario ON reservas_archivo (usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_archivo_usuario ON accesos_archivo (usuario_id)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_archivo_fecha ON accesos_archivo (fecha_hora)",
+        
+        # Índices de las tablas activas para seleccionar rápido lo que se archiva
+        "CREATE INDEX IF NOT EXISTS idx_reportes_fecha ON reportes (fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_fecha_fin ON reservas (fecha_fin)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_fecha ON accesos (fecha_hora)",
+    ]
+    + sentencias_vista_archivo("reportes", ["id", "equipo_id", "tipo", "descripcion", "fecha", "estado",
+                                            "solucion", "usuario", "prioridad"])
+    + sentencias_vista_archivo("reservas", ["id", "equipo_id", "usuario_id", "fecha_inicio", "fecha_fin",
+                                            "proposito", "estado", "fecha_solicitud"])
+    + sentencias_vista_archivo("accesos", ["id", "usuario_id", "fecha_hora", "accion", "detalles"])
+    # Los registros archivados siguen contando para la vista previa de eliminación de equipos
+    + sentencias_contador("reportes_archivo", "num_reportes")
+    + sentencias_contador("reservas_archivo", "num_reservas"),
+    
+    # 3: fechas normalizadas en segundos desde epoch para filtros por rango con índice
+    migrar_fechas_normalizadas,
+    
+    # 4: índices sobre las fechas normalizadas y vistas de archivo con las nuevas columnas
+    [
+        "DROP INDEX IF EXISTS idx_reportes_fecha",
+        "DROP INDEX IF EXISTS idx_reservas_fecha_fin",
+        "DROP INDEX IF EXISTS idx_accesos_fecha",
+        "DROP INDEX IF EXISTS idx_reportes_archivo_fecha",
+        "DROP INDEX IF EXISTS idx_accesos_archivo_fecha",
+        "CREATE INDEX IF NOT EXISTS idx_reportes_fecha_ts ON reportes (fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_fecha_inicio_ts ON reservas (fecha_inicio_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_fecha_fin_ts ON reservas (fecha_fin_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_equipo_fechas ON reservas (equipo_id, fecha_inicio_ts, fecha_fin_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_mantenimientos_fecha_programada_ts ON mantenimientos (fecha_programada_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_fecha_hora_ts ON accesos (fecha_hora_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reportes_archivo_fecha_ts ON reportes_archivo (fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_archivo_fecha_inicio_ts ON reservas_archivo (fecha_inicio_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_accesos_archivo_fecha_hora_ts ON accesos_archivo (fecha_hora_ts)",
+    ]
+    + sentencias_vista_archivo("reportes", ["id", "equipo_id", "tipo", "descripcion", "fecha", "estado",
+                                            "solucion", "usuario", "prioridad", "fecha_ts"])
+    + sentencias_vista_archivo("reservas", ["id", "equipo_id", "usuario_id", "fecha_inicio", "fecha_fin",
+                                            "proposito", "estado", "fecha_solicitud",
+                                            "fecha_inicio_ts", "fecha_fin_ts"])
+    + sentencias_vista_archivo("accesos", ["id", "usuario_id", "fecha_hora", "accion", "detalles",
+                                           "fecha_hora_ts"]),
+    
+    # 5: versión de los datos de las tablas que alimentan las listas en caché
+    [
+        """CREATE TABLE IF NOT EXISTS versiones_datos (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""",
+    ]
+    + sentencias_version_datos("equipos", ["nombre", "estado", "ubicacion"])
+    + sentencias_version_datos("usuarios", ["nombre"])
+    + sentencias_version_datos("inventario", ["ubicacion"]),
+    
+    # 6: versión de datos para todas las tablas publicadas por la API, cubriendo todas sus columnas visibles
+    [
+        "DROP TRIGGER IF EXISTS trg_equipos_version_update",
+        "DROP TRIGGER IF EXISTS trg_usuarios_version_update",
+        "DROP TRIGGER IF EXISTS trg_inventario_version_update",
+    ]
+    + sentencias_version_datos("equipos", ["nombre", "tipo", "modelo", "serial", "estado", "ubicacion",
+                                           "fecha_adquisicion", "ultimo_mantenimiento", "observaciones"])
+    + sentencias_version_datos("usuarios", ["nombre", "apellido", "email", "rol", "usuario", "contrasena",
+                                            "fecha_registro", "estado"])
+    + sentencias_version_datos("inventario", ["componente", "tipo", "cantidad", "minimo", "proveedor", "ubicacion",
+                                              "fecha_actualizacion", "observaciones"])
+    + sentencias_version_datos("reportes", ["equipo_id", "tipo", "descripcion", "fecha", "estado", "solucion",
+                                            "usuario", "prioridad"])
+    + sentencias_version_datos("reservas", ["equipo_id", "usuario_id", "fecha_inicio", "fecha_fin", "proposito",
+                                            "estado", "fecha_solicitud"])
+    + sentencias_version_datos("mantenimientos", ["equipo_id", "tipo", "fecha_programada", "fecha_realizado",
+                                                  "descripcion", "tecnico", "estado", "costo", "observaciones"]),
+    
+    # 7: planes de mantenimiento recurrentes e índice parcial de pendientes por fecha
+    [
+        """CREATE TABLE IF NOT EXISTS planes_mantenimiento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            equipo_id INTEGER REFERENCES equipos (id) ON DELETE CASCADE,
+            tipo_equipo TEXT,
+            tipo TEXT,
+            intervalo_dias INTEGER NOT NULL CHECK (intervalo_dias > 0),
+            fecha_inicio TEXT,
+            tecnico TEXT,
+            costo REAL,
+            descripcion TEXT,
+            activo INTEGER NOT NULL DEFAULT 1
+        )""",
+        "ALTER TABLE mantenimientos ADD COLUMN plan_id INTEGER REFERENCES planes_mantenimiento (id) ON DELETE SET NULL",
+        "CREATE INDEX IF NOT EXISTS idx_mantenimientos_plan ON mantenimientos (plan_id, equipo_id)",
+        # Como mucho una ocurrencia pendiente por plan y equipo, aunque dos procesos generen a la vez
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_mantenimientos_plan_pendiente ON mantenimientos (plan_id, equipo_id)
+           WHERE estado = 'Pendiente' AND plan_id IS NOT NULL""",
+        # Cola de vencimientos: solo contiene los pendientes, ordenados por fecha
+        """CREATE INDEX IF NOT EXISTS idx_mantenimientos_pendientes ON mantenimientos (fecha_programada_ts)
+           WHERE estado = 'Pendiente'""",
+        "CREATE INDEX IF NOT EXISTS idx_equipos_tipo ON equipos (tipo)",
+    ],
+    
+    # 8: componentes bajo el mínimo en un índice parcial y alertas al cruzar el umbral
+    [
+        # El índice solo contiene los componentes bajo el mínimo, agrupados por proveedor
+        """CREATE INDEX IF NOT EXISTS idx_inventario_bajo_minimo ON inventario (proveedor, componente)
+           WHERE cantidad < minimo""",
+        """CREATE TABLE IF NOT EXISTS alertas_stock (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            componente_id INTEGER REFERENCES inventario (id) ON DELETE CASCADE,
+            fecha TEXT,
+            cantidad INTEGER,
+            minimo INTEGER,
+            notificada INTEGER NOT NULL DEFAULT 0
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_alertas_stock_pendientes ON alertas_stock (id) WHERE notificada = 0",
+    ]
+    + sentencias_alerta_stock(),
+    
+    # 9: libro de movimientos de inventario con saldo acumulado y consumo agregado por día
+    [
+        """CREATE TABLE IF NOT EXISTS movimientos_inventario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            componente_id INTEGER NOT NULL REFERENCES inventario (id) ON DELETE CASCADE,
+            fecha TEXT,
+            fecha_ts INTEGER,
+            tipo TEXT NOT NULL CHECK (tipo IN ('Entrada', 'Salida', 'Ajuste')),
+            cantidad INTEGER NOT NULL,
+            saldo INTEGER NOT NULL,
+            reporte_id INTEGER,
+            mantenimiento_id INTEGER REFERENCES mantenimientos (id) ON DELETE SET NULL,
+            usuario_id INTEGER,
+            observaciones TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_componente ON movimientos_inventario (componente_id, fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_reporte ON movimientos_inventario (reporte_id)",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_mantenimiento ON movimientos_inventario (mantenimiento_id)",
+        # Entradas y salidas por componente y día: el consumo se calcula sobre unas pocas filas por componente.
+        # Los ajustes de recuento no cuentan como consumo
+        """CREATE TABLE IF NOT EXISTS consumo_diario (
+            componente_id INTEGER NOT NULL REFERENCES inventario (id) ON DELETE CASCADE,
+            dia TEXT NOT NULL,
+            entradas INTEGER NOT NULL DEFAULT 0,
+            salidas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (componente_id, dia)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_consumo_diario_dia ON consumo_diario (dia)",
+        TRIGGER_CONSUMO_DIARIO,
+        # Las existencias actuales quedan como saldo inicial de cada componente
+        """INSERT INTO movimientos_inventario (componente_id, fecha, fecha_ts, tipo, cantidad, saldo, observaciones)
+           SELECT id, fecha, CAST(strftime('%s', fecha, 'utc') AS INTEGER), 'Entrada', cantidad, cantidad, 'Saldo inicial'
+           FROM (SELECT id, cantidad, COALESCE(fecha_actualizacion, datetime('now', 'localtime')) AS fecha
+                 FROM inventario WHERE cantidad > 0)""",
+    ],
+    
+    # 10: índice de ocupación por día y equipo para el calendario de disponibilidad
+    [
+        "CREATE TABLE IF NOT EXISTS secuencia (n INTEGER PRIMARY KEY)",
+        f"""INSERT OR IGNORE INTO secuencia (n)
+            WITH RECURSIVE s(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM s WHERE n < {MAXIMO_DIAS_OCUPACION})
+            SELECT n FROM s""",
+        """CREATE TABLE IF NOT EXISTS ocupacion (
+            dia TEXT NOT NULL,
+            equipo_id INTEGER NOT NULL,
+            origen TEXT NOT NULL,
+            origen_id INTEGER NOT NULL,
+            inicio_ts INTEGER,
+            fin_ts INTEGER,
+            PRIMARY KEY (dia, equipo_id, origen, origen_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_ocupacion_origen ON ocupacion (origen, origen_id)",
+    ]
+    + sentencias_ocupacion("reservas", "reserva", "fecha_inicio_ts", "fecha_fin_ts", "estado != 'Cancelada'")
+    + sentencias_ocupacion("mantenimientos", "mantenimiento", "fecha_programada_ts", None, "estado != 'Cancelado'")
+    + [
+        # Los registros existentes se indexan forzando los triggers sobre sus fechas normalizadas
+        "UPDATE reservas SET fecha_inicio_ts = fecha_inicio_ts",
+        "UPDATE mantenimientos SET fecha_programada_ts = fecha_programada_ts",
+    ],
+    
+    # 11: estados En curso y Finalizada de las reservas, con colas por fecha de los próximos cambios
+    [
+        "UPDATE reservas SET estado = 'Finalizada' WHERE estado = 'Completada'",
+        "UPDATE reservas_archivo SET estado = 'Finalizada' WHERE estado = 'Completada'",
+        # Cada índice solo contiene las reservas que aún tienen un cambio de estado pendiente
+        "CREATE INDEX IF NOT EXISTS idx_reservas_confirmadas ON reservas (fecha_inicio_ts) WHERE estado = 'Confirmada'",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_en_curso ON reservas (fecha_fin_ts) WHERE estado = 'En curso'",
+    ],
+    
+    # 12: fechas de cambio de estado de los reportes y agregados incrementales de tiempos de resolución
+    [
+        "ALTER TABLE reportes ADD COLUMN fecha_en_progreso_ts INTEGER",
+        "ALTER TABLE reportes ADD COLUMN fecha_resuelto_ts INTEGER",
+        "ALTER TABLE reportes_archivo ADD COLUMN fecha_en_progreso_ts INTEGER",
+        "ALTER TABLE reportes_archivo ADD COLUMN fecha_resuelto_ts INTEGER",
+        """CREATE TABLE IF NOT EXISTS tiempos_resolucion (
+            dimension TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            resueltos INTEGER NOT NULL DEFAULT 0,
+            suma_s INTEGER NOT NULL DEFAULT 0,
+            dentro_sla INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, valor)
+        )""",
+    ]
+    + [f"INSERT OR IGNORE INTO configuracion (clave, valor) VALUES ('sla_horas_{prioridad}', '{horas}')"
+       for prioridad, horas in SLA_HORAS_POR_DEFECTO.items()]
+    + sentencias_sla_reportes()
+    + sentencias_vista_archivo("reportes", ["id", "equipo_id", "tipo", "descripcion", "fecha", "estado",
+                                            "solucion", "usuario", "prioridad", "fecha_ts",
+                                            "fecha_en_progreso_ts", "fecha_resuelto_ts"]),
+    
+    # 13: índices (equipo_id, fecha) para leer el historial de un equipo ya ordenado; reemplazan a los de solo equipo_id
+    [
+        "CREATE INDEX IF NOT EXISTS idx_reportes_equipo_fecha_ts ON reportes (equipo_id, fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reportes_archivo_equipo_fecha_ts ON reportes_archivo (equipo_id, fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_reservas_archivo_equipo_fecha_ts ON reservas_archivo (equipo_id, fecha_inicio_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_mantenimientos_equipo_fecha_ts ON mantenimientos (equipo_id, fecha_programada_ts)",
+        "DROP INDEX IF EXISTS idx_reportes_equipo",
+        "DROP INDEX IF EXISTS idx_reportes_archivo_equipo",
+        # idx_reservas_equipo_fechas ya empieza por (equipo_id, fecha_inicio_ts)
+        "DROP INDEX IF EXISTS idx_reservas_equipo",
+        "DROP INDEX IF EXISTS idx_reservas_archivo_equipo",
+        "DROP INDEX IF EXISTS idx_mantenimientos_equipo",
+    ],
+    
+    # 14: agregados incrementales de costos de mantenimiento por equipo, tipo, mes, técnico y antigüedad
+    [
+        """CREATE TABLE IF NOT EXISTS costos_mantenimiento (
+            dimension TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, valor)
+        )""",
+    ]
+    + sentencias_llenar_costos()
+    + sentencias_costos_mantenimiento(),
+    
+    # 15: informes de gestión que se generan solos en una carpeta (plantillas en informes.py)
+    [
+        """CREATE TABLE IF NOT EXISTS informes_programados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plantilla TEXT NOT NULL,
+            formato TEXT NOT NULL,
+            carpeta TEXT NOT NULL,
+            frecuencia TEXT NOT NULL,
+            ultima_ejecucion_ts INTEGER,
+            activo INTEGER NOT NULL DEFAULT 1
+        )""",
+    ],
+    
+    # 16: contraseñas de usuarios con hash PBKDF2 en lugar de texto plano (autenticacion.py). La migración se
+    # ejecuta al conectar, en el hilo de la interfaz, así que no calcula hashes: cada contraseña en texto plano
+    # se reemplaza por su hash en el siguiente inicio de sesión de su usuario, en un hilo de fondo
+    [
+        "UPDATE usuarios SET contrasena = NULL WHERE contrasena = ''",
+    ],
+    
+    # 17: permisos de cada rol, que la aplicación lee una vez al iniciar sesión
+    [
+        """CREATE TABLE IF NOT EXISTS permisos_rol (
+            rol TEXT NOT NULL,
+            permiso TEXT NOT NULL,
+            PRIMARY KEY (rol, permiso)
+        ) WITHOUT ROWID""",
+    ]
+    + [f"INSERT OR IGNORE INTO permisos_rol (rol, permiso) VALUES ('{rol}', '{permiso}')"
+       for rol, permisos in autenticacion.PERMISOS_POR_ROL.items() for permiso in permisos],
+    
+    # 18: administrador principal identificado por su nombre de usuario; la migración 1 lo omitía si el id 1
+    # ya era de otro usuario
+    [
+        SEMBRAR_ADMINISTRADOR,
+        """INSERT OR REPLACE INTO configuracion (clave, valor)
+           SELECT 'usuario_admin_id', id FROM usuarios WHERE usuario = 'admin'""",
+    ],
+    
+    # 19: los movimientos conservan el id del reporte que los originó aunque el reporte se archive (se
+    # resuelve en reportes_todos); la clave foránea con ON DELETE SET NULL lo borraba al archivar
+    [
+        """CREATE TABLE movimientos_inventario_nueva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            componente_id INTEGER NOT NULL REFERENCES inventario (id) ON DELETE CASCADE,
+            fecha TEXT,
+            fecha_ts INTEGER,
+            tipo TEXT NOT NULL CHECK (tipo IN ('Entrada', 'Salida', 'Ajuste')),
+            cantidad INTEGER NOT NULL,
+            saldo INTEGER NOT NULL,
+            reporte_id INTEGER,
+            mantenimiento_id INTEGER REFERENCES mantenimientos (id) ON DELETE SET NULL,
+            usuario_id INTEGER,
+            observaciones TEXT
+        )""",
+        "INSERT INTO movimientos_inventario_nueva SELECT * FROM movimientos_inventario",
+        "DROP TABLE movimientos_inventario",
+        "ALTER TABLE movimientos_inventario_nueva RENAME TO movimientos_inventario",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_componente ON movimientos_inventario (componente_id, fecha_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_reporte ON movimientos_inventario (reporte_id)",
+        "CREATE INDEX IF NOT EXISTS idx_movimientos_mantenimiento ON movimientos_inventario (mantenimiento_id)",
+        TRIGGER_CONSUMO_DIARIO,
+    ],
+    
+    # 20: la antigüedad de los costos sigue a la fecha de adquisición del equipo; los agregados que se
+    # desviaron al cambiarla o al borrar equipos se recalculan
+    sentencias_antiguedad_costos()
+    + ["DELETE FROM costos_mantenimiento"]
+    + sentencias_llenar_costos(),
+    
+    # 21: época de los datos, que distingue esta base de datos de un respaldo restaurado o de otra copia
+    [
+        "INSERT OR IGNORE INTO configuracion (clave, valor) VALUES ('epoca_datos', lower(hex(randomblob(16))))",
+    ],
+    
+    # 22: los tiempos de resolución siguen a los reportes resueltos que se editan, archivan o borran; los
+    # agregados que se desviaron se recalculan
+    sentencias_sla_ediciones()
+    + ["DELETE FROM tiempos_resolucion"]
+    + sentencias_llenar_tiempos_resolucion(),
+]
+
+# Esquema base (versión 0); los cambios posteriores se hacen con MIGRACIONES
+TABLAS_BASE = [
+    """CREATE TABLE IF NOT EXISTS equipos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        tipo TEXT,
+        modelo TEXT,
+        serial TEXT UNIQUE,
+        estado TEXT,
+        ubicacion TEXT,
+        fecha_adquisicion TEXT,
+        ultimo_mantenimiento TEXT,
+        observaciones TEXT
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS inventario (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        componente TEXT NOT NULL,
+        tipo TEXT,
+        cantidad INTEGER,
+        minimo INTEGER,
+        proveedor TEXT,
+        ubicacion TEXT,
+        fecha_actualizacion TEXT,
+        observaciones TEXT
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS reportes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        equipo_id INTEGER,
+        tipo TEXT,
+        descripcion TEXT,
+        fecha TEXT,
+        estado TEXT,
+        solucion TEXT,
+        usuario TEXT,
+        prioridad TEXT,
+        FOREIGN KEY (equipo_id) REFERENCES equipos (id)
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS reservas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        equipo_id INTEGER,
+        usuario_id INTEGER,
+        fecha_inicio TEXT,
+        fecha_fin TEXT,
+        proposito TEXT,
+        estado TEXT,
+        fecha_solicitud TEXT,
+        FOREIGN KEY (equipo_id) REFERENCES equipos (id),
+        FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS mantenimientos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        equipo_id INTEGER,
+        tipo TEXT,
+        fecha_programada TEXT,
+        fecha_realizado TEXT,
+        descripcion TEXT,
+        tecnico TEXT,
+        estado TEXT,
+        costo REAL,
+        observaciones TEXT,
+        FOREIGN KEY (equipo_id) REFERENCES equipos (id)
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        apellido TEXT,
+        email TEXT UNIQUE,
+        rol TEXT,
+        usuario TEXT UNIQUE,
+        contrasena TEXT,
+        fecha_registro TEXT,
+        estado TEXT
+    )""",
+    
+    """CREATE TABLE IF NOT EXISTS accesos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario_id INTEGER,
+        fecha_hora TEXT,
+        accion TEXT,
+        detalles TEXT,
+        FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    )"""
+]
+
+def conectar_lectura(ruta=RUTA_DB):
+    """Abre la base de datos en modo solo lectura, para usarla desde otros hilos"""
+    # El esquema debe estar ya migrado: una conexión de solo lectura no puede aplicar migraciones
+    return sqlite3.connect(f"file:{quote(ruta)}?mode=ro", uri=True, timeout=10, check_same_thread=False)
+
+def leer_version_datos(conn, tabla):
+    """Devuelve el número de versión de los datos de una tabla, que cambia con cada escritura"""
+    fila = conn.execute("SELECT version FROM versiones_datos WHERE tabla = ?", (tabla,)).fetchone()
+    return fila[0] if fila else 0
+
+def leer_epoca_datos(conn):
+    """Devuelve el identificador de esta copia de la base de datos, que cambia al restaurar un respaldo"""
+    return leer_configuracion(conn, 'epoca_datos', '')
+
+def conectar(ruta=RUTA_DB):
+    """Abre la base de datos, crea y migra el esquema si hace falta y activa las claves foráneas"""
+    conn = sqlite3.connect(ruta)
+    crear_tablas(conn)
+    migrar_esquema(conn)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def crear_tablas(conn):
+    """Crea las tablas del esquema base si no existen"""
+    for tabla in TABLAS_BASE:
+        conn.execute(tabla)
+    conn.commit()
+
+def migrar_esquema(conn):
+    """Aplica las migraciones de esquema pendientes según PRAGMA user_version"""
+    c = conn.cursor()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    
+    # Las reconstrucciones de tablas requieren las claves foráneas desactivadas
+    conn.commit()
+    c.execute("PRAGMA foreign_keys = OFF")
+    
+    for numero, migracion in enumerate(MIGRACIONES[version:], start=version + 1):
+        try:
+            c.execute("BEGIN")
+            if callable(migracion):
+                migracion(c)
+            else:
+                for sentencia in migracion:
+                    c.execute(sentencia)
+            c.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def leer_configuracion(conn, clave, defecto=None):
+    """Devuelve un valor guardado en la tabla de configuración"""
+    fila = conn.execute("SELECT valor FROM configuracion WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else defecto
+
+def guardar_valor_configuracion(conn, clave, valor):
+    """Guarda un valor en la tabla de configuración"""
+    conn.execute("INSERT OR REPLACE INTO configuracion (clave, valor) VALUES (?, ?)", (clave, str(valor)))
+    conn.commit()
+
+def id_administrador(conn):
+    """Devuelve el id del administrador principal, al que se atribuyen las acciones sin sesión"""
+    valor = leer_configuracion(conn, 'usuario_admin_id')
+    return int(valor) if valor is not None else None
+
+def archivar_registros(conn):
+    """Mueve a las tablas de archivo los registros cerrados más antiguos que el horizonte configurado"""
+    dias = int(leer_configuracion(conn, 'dias_archivo', 365))
+    limite = int((datetime.now() - timedelta(days=dias)).timestamp())
+    fecha_archivado = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Solo se archivan reportes resueltos, reservas terminadas y accesos antiguos
+    criterios = [
+        ("reportes", "estado = 'Resuelto' AND fecha_ts < ?"),
+        ("reservas", "fecha_fin_ts < ?"),
+        ("accesos", "fecha_hora_ts < ?"),
+    ]
+    
+    c = conn.cursor()
+    movidos = {}
+    try:
+        for tabla, condicion in criterios:
+            columnas = ", ".join(col[1] for col in c.execute(f"PRAGMA table_info({tabla})").fetchall())
+            c.execute(f"""INSERT INTO {tabla}_archivo ({columnas}, fecha_archivado)
+                          SELECT {columnas}, ? FROM {tabla} WHERE {condicion}""",
+                      (fecha_archivado, limite))
+            c.execute(f"DELETE FROM {tabla} WHERE {condicion}", (limite,))
+            movidos[tabla] = c.rowcount
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    
+    return movidos
+
+def leer_permisos(conn, rol):
+    """Devuelve el conjunto de permisos de un rol"""
+    return frozenset(fila[0] for fila in conn.execute("SELECT permiso FROM permisos_rol WHERE rol = ?", (rol,)))
+
+def registrar_acceso(conn, accion, detalles=None, usuario_id=None, commit=True):
+    """Registra una acción en el historial de accesos (sin usuario, a nombre del administrador principal)"""
+    if detalles is None:
+        detalles = accion
+    if usuario_id is None:
+        usuario_id = id_administrador(conn)
+    conn.execute("""INSERT INTO accesos 
+                    (usuario_id, fecha_hora, accion, detalles) 
+                    VALUES (?, ?, ?, ?)""",
+                 (usuario_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), accion, detalles))
+    if commit:
+        conn.commit()
+
+def generar_mantenimientos_planificados(conn, horizonte_dias=HORIZONTE_PLANES_DIAS):
+    """Crea la siguiente ocurrencia de cada plan activo que vence dentro del horizonte y devuelve cuántas creó"""
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    limite = hoy + timedelta(days=horizonte_dias)
+    c = conn.cursor()
+    
+    planes = c.execute("""SELECT id, equipo_id, tipo_equipo, tipo, intervalo_dias, fecha_inicio, tecnico, costo, descripcion
+                          FROM planes_mantenimiento WHERE activo = 1""").fetchall()
+    nuevas = []
+    for plan_id, equipo_id, tipo_equipo, tipo, intervalo, fecha_inicio, tecnico, costo, descripcion in planes:
+        # Solo se genera una ocurrencia a la vez: la siguiente aparece cuando se completa o cancela la anterior
+        filas = c.execute("""SELECT e.id, MAX(COALESCE(m.fecha_realizado_ts, m.fecha_programada_ts)),
+                                    COUNT(CASE WHEN m.estado = 'Pendiente' THEN 1 END)
+                             FROM equipos e
+                             LEFT JOIN mantenimientos m ON m.equipo_id = e.id AND m.plan_id = ?
+                             WHERE (e.id = ? OR e.tipo = ?) AND COALESCE(e.estado, '') != 'Retirado'
+                             GROUP BY e.id""", (plan_id, equipo_id, tipo_equipo)).fetchall()
+        for id_equipo, ultimo_ts, pendientes in filas:
+            if pendientes:
+                continue
+            if ultimo_ts is None:
+                proxima = parsear_fecha(fecha_inicio) or hoy
+            else:
+                proxima = datetime.fromtimestamp(ultimo_ts) + timedelta(days=intervalo)
+            if proxima <= limite:
+                nuevas.append((id_equipo, tipo, proxima.strftime("%Y-%m-%d"), descripcion, tecnico, costo, plan_id))
+    
+    if nuevas:
+        c.executemany("""INSERT OR IGNORE INTO mantenimientos 
+                         (equipo_id, tipo, fecha_programada, descripcion, tecnico, estado, costo, plan_id) 
+                         VALUES (?, ?, ?, ?, ?, 'Pendiente', ?, ?)""", nuevas)
+        conn.commit()
+    return len(nuevas)
+
+def rango_vencimiento(filtro):
+    """Devuelve los límites (desde_ts, hasta_ts) de los mantenimientos pendientes 'Vencidos' o 'Esta semana'"""
+    hoy = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if filtro == "Vencidos":
+        return None, int(hoy.timestamp())
+    return int(hoy.timestamp()), int((hoy + timedelta(days=7)).timestamp())
+
+def resumen_vencimientos(conn):
+    """Cuenta los mantenimientos pendientes vencidos y los que vencen esta semana"""
+    resumen = {}
+    for filtro in ("Vencidos", "Esta semana"):
+        desde, hasta = rango_vencimiento(filtro)
+        # La condición estado = 'Pendiente' literal permite usar el índice parcial de pendientes
+        resumen[filtro] = conn.execute("""SELECT COUNT(*) FROM mantenimientos 
+                                          WHERE estado = 'Pendiente' AND fecha_programada_ts >= ? AND fecha_programada_ts < ?""",
+                                       (desde or 0, hasta)).fetchone()[0]
+    return resumen
+
+def componentes_bajo_minimo(conn):
+    """Devuelve (id, componente, cantidad, minimo, proveedor) de los componentes bajo el mínimo"""
+    # La condición cantidad < minimo literal permite usar el índice parcial en lugar de recorrer el inventario
+    return conn.execute("""SELECT id, componente, cantidad, minimo, proveedor FROM inventario 
+                           WHERE cantidad < minimo ORDER BY proveedor, componente""").fetchall()
+
+def sugerencias_reposicion(conn):
+    """Agrupa por proveedor los componentes a pedir con la cantidad sugerida para cada uno"""
+    sugerencias = {}
+    for componente_id, componente, cantidad, minimo, proveedor in componentes_bajo_minimo(conn):
+        pedido = minimo * FACTOR_REPOSICION - (cantidad or 0)
+        sugerencias.setdefault(proveedor or "(sin proveedor)", []).append((componente_id, componente, cantidad, minimo, pedido))
+    return sugerencias
+
+def registrar_movimiento(conn, componente_id, tipo, cantidad, reporte_id=None, mantenimiento_id=None,
+                         observaciones=None, usuario_id=None, commit=True):
+    """Registra un movimiento de inventario, actualiza la cantidad del componente y devuelve el nuevo saldo"""
+    if tipo not in TIPOS_MOVIMIENTO:
+        raise ValueError(f"Tipo de movimiento no válido: {tipo}")
+    cantidad = int(cantidad)
+    if cantidad < 0 or (cantidad == 0 and tipo != "Ajuste"):
+        raise ValueError("La cantidad debe ser un número positivo")
+    
+    fila = conn.execute("SELECT cantidad FROM inventario WHERE id = ?", (componente_id,)).fetchone()
+    if fila is None:
+        raise ValueError(f"No existe el componente {componente_id}")
+    actual = fila[0] or 0
+    
+    # El movimiento guarda la variación con signo; el saldo se obtiene sumándola al saldo anterior
+    if tipo == "Entrada":
+        variacion = cantidad
+    elif tipo == "Salida":
+        if cantidad > actual:
+            raise ValueError(f"Stock insuficiente: hay {actual} unidades")
+        variacion = -cantidad
+    else:
+        variacion = cantidad - actual
+        if variacion == 0:
+            return actual
+    saldo = actual + variacion
+    if usuario_id is None:
+        usuario_id = id_administrador(conn)
+    
+    ahora = datetime.now()
+    conn.execute("UPDATE inventario SET cantidad = ?, fecha_actualizacion = ? WHERE id = ?",
+                 (saldo, ahora.strftime("%Y-%m-%d %H:%M:%S"), componente_id))
+    conn.execute("""INSERT INTO movimientos_inventario 
+                    (componente_id, fecha, fecha_ts, tipo, cantidad, saldo, reporte_id, mantenimiento_id, usuario_id, observaciones) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                 (componente_id, ahora.strftime("%Y-%m-%d %H:%M:%S"), int(ahora.timestamp()), tipo, variacion, saldo,
+                  reporte_id, mantenimiento_id, usuario_id, observaciones))
+    if commit:
+        conn.commit()
+    return saldo
+
+def registrar_saldo_inicial(conn, componente_id, usuario_id=None, commit=True):
+    """Registra la cantidad con la que se dio de alta un componente como su primer movimiento"""
+    ahora = datetime.now()
+    conn.execute("""INSERT INTO movimientos_inventario (componente_id, fecha, fecha_ts, tipo, cantidad, saldo, usuario_id, observaciones)
+                    SELECT id, ?, ?, 'Entrada', cantidad, cantidad, ?, 'Saldo inicial' FROM inventario
+                    WHERE id = ? AND cantidad > 0""",
+                 (ahora.strftime("%Y-%m-%d %H:%M:%S"), int(ahora.timestamp()), usuario_id, componente_id))
+    if commit:
+        conn.commit()
+
+def pronostico_consumo(conn, dias=DIAS_CONSUMO, componente_id=None):
+    """Calcula el consumo diario de cada componente y los días que faltan para llegar al mínimo y a cero"""
+    desde = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d")
+    params = [desde]
+    filtro = ""
+    if componente_id is not None:
+        filtro = " WHERE i.id = ?"
+        params.append(componente_id)
+    
+    # Se lee el agregado diario, no los movimientos individuales
+    filas = conn.execute(f"""SELECT i.id, i.componente, i.cantidad, i.minimo, i.proveedor, COALESCE(c.salidas, 0)
+                             FROM inventario i
+                             LEFT JOIN (SELECT componente_id, SUM(salidas) AS salidas FROM consumo_diario
+                                        WHERE dia >= ? GROUP BY componente_id) c ON c.componente_id = i.id{filtro}
+                             ORDER BY i.componente""", params).fetchall()
+    pronostico = []
+    for componente_id, componente, cantidad, minimo, proveedor, salidas in filas:
+        consumo = salidas / dias
+        cantidad = cantidad or 0
+        if consumo > 0:
+            dias_minimo = max(cantidad - (minimo or 0), 0) / consumo
+            dias_agotado = cantidad / consumo
+        else:
+            dias_minimo = dias_agotado = None
+        pronostico.append((componente_id, componente, cantidad, minimo, proveedor, round(consumo, 2),
+                           None if dias_minimo is None else int(dias_minimo),
+                           None if dias_agotado is None else int(dias_agotado)))
+    return pronostico
+
+def actualizar_estados_reservas(conn):
+    """Pasa a En curso las reservas que empezaron y a Finalizada las que terminaron; devuelve cuántas cambió"""
+    ahora = int(datetime.now().timestamp())
+    try:
+        # Dos actualizaciones en lote servidas por los índices parciales; una reserva ya terminada pasa por ambas
+        en_curso = conn.execute("""UPDATE reservas SET estado = 'En curso' 
+                                   WHERE estado = 'Confirmada' AND fecha_inicio_ts <= ?""", (ahora,)).rowcount
+        finalizadas = conn.execute("""UPDATE reservas SET estado = 'Finalizada' 
+                                      WHERE estado = 'En curso' AND fecha_fin_ts <= ?""", (ahora,)).rowcount
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return {"En curso": en_curso, "Finalizada": finalizadas}
+
+def expandir_recurrencia(desde, hasta, hora_inicio, hora_fin, dias_semana, cada_semanas=1):
+    """Devuelve los intervalos (inicio, fin) de una reserva semanal entre dos fechas incluidas"""
+    # dias_semana usa la numeración de weekday(): 0 es lunes
+    inicio_hora = datetime.strptime(hora_inicio, "%H:%M").time()
+    fin_hora = datetime.strptime(hora_fin, "%H:%M").time()
+    if fin_hora <= inicio_hora:
+        raise ValueError("La hora de fin debe ser posterior a la de inicio")
+    if cada_semanas < 1:
+        raise ValueError("La frecuencia debe ser de al menos una semana")
+    
+    lunes_inicial = desde - timedelta(days=desde.weekday())
+    ocurrencias = []
+    dia = desde
+    while dia <= hasta:
+        semana = (dia - lunes_inicial).days // 7
+        if dia.weekday() in dias_semana and semana % cada_semanas == 0:
+            ocurrencias.append((datetime.combine(dia, inicio_hora), datetime.combine(dia, fin_hora)))
+        dia += timedelta(days=1)
+    return ocurrencias
+
+def reservar_en_lote(conn, equipo_ids, usuario_id, ocurrencias, proposito, commit=True):
+    """Crea todas las reservas de varios equipos y ocurrencias, o ninguna si alguna choca; devuelve (creadas, conflictos)"""
+    formato = "%Y-%m-%d %H:%M"
+    fecha_solicitud = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    filas = [[equipo_id, inicio.strftime(formato), fin.strftime(formato)]
+             for equipo_id in equipo_ids for inicio, fin in ocurrencias]
+    if len(filas) > MAXIMO_RESERVAS_LOTE:
+        raise ValueError(f"Demasiadas reservas en un solo lote ({len(filas)}, máximo {MAXIMO_RESERVAS_LOTE})")
+    
+    # Un choque deshace solo el lote, no lo que el llamador tenga pendiente en la misma transacción. El punto
+    # de guardado no se libera al terminar bien: si abrió la transacción, liberarlo la confirmaría, y con
+    # commit=False eso queda a cargo del llamador (su commit o rollback lo cierra)
+    conn.execute("SAVEPOINT lote")
+    try:
+        # Se inserta primero: la escritura bloquea la base, así la comprobación posterior no puede quedar obsoleta
+        nuevas = [fila[0] for fila in conn.execute(
+            """INSERT INTO reservas (equipo_id, usuario_id, fecha_inicio, fecha_fin, proposito, estado, fecha_solicitud)
+               SELECT json_extract(value, '$[0]'), ?, json_extract(value, '$[1]'), json_extract(value, '$[2]'),
+                      ?, 'Confirmada', ?
+               FROM json_each(?)
+               RETURNING id""",
+            (usuario_id, proposito, fecha_solicitud, json.dumps(filas))).fetchall()]
+        
+        # Una sola consulta por conjuntos contra las reservas existentes y entre las propias reservas del lote;
+        # un choque entre dos reservas nuevas se informa una sola vez
+        conflictos = conn.execute(
+            """SELECT e.nombre, n.fecha_inicio, n.fecha_fin, r.fecha_inicio, r.fecha_fin
+               FROM reservas n
+               JOIN reservas r ON r.equipo_id = n.equipo_id AND r.id != n.id
+                              AND r.estado IN ('Confirmada', 'En curso')
+                              AND r.fecha_inicio_ts < n.fecha_fin_ts AND r.fecha_fin_ts > n.fecha_inicio_ts
+                              AND (r.id NOT IN (SELECT value FROM json_each(:nuevas)) OR r.id > n.id)
+               JOIN equipos e ON e.id = n.equipo_id
+               WHERE n.id IN (SELECT value FROM json_each(:nuevas))
+               ORDER BY n.fecha_inicio_ts, e.nombre""",
+            {"nuevas": json.dumps(nuevas)}).fetchall()
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO lote")
+        conn.execute("RELEASE lote")
+        raise
+    
+    if conflictos:
+        conn.execute("ROLLBACK TO lote")
+        conn.execute("RELEASE lote")
+        return 0, conflictos
+    if commit:
+        conn.commit()
+    return len(nuevas), []
+
+def segundos_hasta_cambio_reservas(conn):
+    """Devuelve los segundos hasta el próximo inicio o fin de reserva, sin pasar de MAXIMA_ESPERA_ESTADOS_S"""
+    # El primer elemento de cada cola es el mínimo de su índice parcial
+    proximo = conn.execute("""SELECT MIN(ts) FROM (
+                                  SELECT MIN(fecha_inicio_ts) AS ts FROM reservas WHERE estado = 'Confirmada'
+                                  UNION ALL
+                                  SELECT MIN(fecha_fin_ts) FROM reservas WHERE estado = 'En curso')""").fetchone()[0]
+    if proximo is None:
+        return MAXIMA_ESPERA_ESTADOS_S
+    return max(1, min(proximo - int(datetime.now().timestamp()), MAXIMA_ESPERA_ESTADOS_S))
+
+def resumen_sla(conn, dimension):
+    """Devuelve [(valor, resueltos, horas_promedio, porcentaje_dentro_sla)] de una dimensión de los agregados"""
+    filas = conn.execute("""SELECT valor, resueltos, suma_s, dentro_sla FROM tiempos_resolucion 
+                            WHERE dimension = ? AND resueltos > 0 ORDER BY valor""", (dimension,)).fetchall()
+    return [(valor, resueltos, round(suma_s / resueltos / 3600, 1), round(100 * dentro_sla / resueltos, 1))
+            for valor, resueltos, suma_s, dentro_sla in filas]
+
+def recalcular_tiempos_resolucion(conn):
+    """Reconstruye los agregados de tiempos de resolución desde los reportes, tras cambiar los objetivos"""
+    # Es el único recorrido completo: los triggers mantienen los agregados en el uso normal
+    try:
+        conn.execute("DELETE FROM tiempos_resolucion")
+        for sentencia in sentencias_llenar_tiempos_resolucion():
+            conn.execute(sentencia)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+def historial_equipo(conn, equipo_id, desplazamiento=0, limite=HISTORIAL_POR_PAGINA):
+    """Devuelve una página [(origen, id, fecha, resumen, estado)] de reportes, reservas y mantenimientos de un equipo, del más reciente al más antiguo"""
+    # Cada rama recorre su índice (equipo_id, fecha) hacia atrás y se detiene en las filas que pueden entrar en la página
+    ramas = []
+    for origen, tablas, columna_ts, columna_fecha, resumen in RAMAS_HISTORIAL:
+        for tabla in tablas:
+            ramas.append(f"""SELECT * FROM (SELECT '{origen}' AS origen, id, {columna_ts} AS ts, {columna_fecha} AS fecha,
+                                             {resumen} AS resumen, estado FROM {tabla}
+                                      WHERE equipo_id = :equipo ORDER BY {columna_ts} DESC, id DESC LIMIT :hasta)""")
+    filas = conn.execute(f"""SELECT origen, id, fecha, resumen, estado FROM ({" UNION ALL ".join(ramas)})
+                             ORDER BY ts DESC, origen, id DESC LIMIT :limite OFFSET :desplazamiento""",
+                         {"equipo": equipo_id, "hasta": desplazamiento + limite, "limite": limite,
+                          "desplazamiento": desplazamiento}).fetchall()
+    return filas
+
+def resumen_costos(conn, dimension):
+    """Devuelve [(valor, cantidad, total, promedio)] de una dimensión de los agregados de costos"""
+    # Los equipos se muestran por nombre y la antigüedad se ordena como número
+    if dimension == "equipo":
+        consulta = """SELECT COALESCE(e.nombre, 'ID ' || c.valor), c.cantidad, c.total FROM costos_mantenimiento c
+                      LEFT JOIN equipos e ON e.id = CAST(c.valor AS INTEGER)
+                      WHERE c.dimension = ? AND c.cantidad > 0 ORDER BY c.total DESC"""
+    else:
+        orden = "CAST(valor AS INTEGER)" if dimension == "antiguedad" else "valor"
+        consulta = f"""SELECT valor, cantidad, total FROM costos_mantenimiento
+                       WHERE dimension = ? AND cantidad > 0 ORDER BY {orden}"""
+    filas = conn.execute(consulta, (dimension,)).fetchall()
+    return [(valor, cantidad, round(total, 2), round(total / cantidad, 2)) for valor, cantidad, total in filas]
+
+def recalcular_costos_mantenimiento(conn):
+    """Reconstruye los agregados de costos desde los mantenimientos, por ejemplo tras corregir fechas de adquisición"""
+    try:
+        conn.execute("DELETE FROM costos_mantenimiento")
+        for sentencia in sentencias_llenar_costos():
+            conn.execute(sentencia)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+def leer_ocupacion(conn, desde, hasta):
+    """Devuelve {(equipo_id, dia): [(origen, origen_id, inicio_ts, fin_ts), ...]} entre dos fechas AAAA-MM-DD incluidas"""
+    # Solo se leen los días visibles, usando la clave primaria de ocupacion
+    ocupacion = {}
+    for dia, equipo_id, origen, origen_id, inicio_ts, fin_ts in conn.execute(
+            """SELECT dia, equipo_id, origen, origen_id, inicio_ts, fin_ts FROM ocupacion
+               WHERE dia BETWEEN ? AND ? ORDER BY inicio_ts""", (desde, hasta)):
+        ocupacion.setdefault((equipo_id, dia), []).append((origen, origen_id, inicio_ts, fin_ts))
+    return ocupacion
+
+def leer_alertas_stock(conn):
+    """Devuelve las alertas de stock aún no notificadas y las marca como notificadas"""
+    alertas = conn.execute("""SELECT a.id, i.componente, a.cantidad, a.minimo, i.proveedor 
+                              FROM alertas_stock a 
+                              JOIN inventario i ON a.componente_id = i.id 
+                              WHERE a.notificada = 0 ORDER BY a.id""").fetchall()
+    if alertas:
+        conn.execute("UPDATE alertas_stock SET notificada = 1 WHERE notificada = 0 AND id <= ?", (alertas[-1][0],))
+        conn.commit()
+    return [alerta[1:] for alerta in alertas]
+
+def respaldar(conn, destino):
+    """Copia la base de datos abierta a otro archivo sin cerrar la conexión"""
+    # La API de respaldo de SQLite produce una copia consistente aunque haya otras conexiones escribiendo
+    copia = sqlite3.connect(destino)
+    try:
+        conn.backup(copia)
+    finally:
+        copia.close()
+
+def restaurar(ruta_respaldo, ruta=RUTA_DB):
+    """Reemplaza la base de datos por una copia de seguridad"""
+    shutil.copy2(ruta_respaldo, ruta)
+    # Las versiones de datos vuelven a las del respaldo: una época nueva invalida los resultados guardados
+    # con las anteriores (los respaldos previos a la migración 21 la reciben al migrar)
+    conn = sqlite3.connect(ruta)
+    try:
+        conn.execute("UPDATE configuracion SET valor = lower(hex(randomblob(16))) WHERE clave = 'epoca_datos'")
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass  # Respaldo anterior a la tabla de configuración
+    finally:
+        conn.close()
@@ -0,0 +1,133 @@
+"""Puntaje de riesgo de falla de cada equipo a partir de su historial de reportes y mantenimientos.
+
+Cada equipo recibe un puntaje de 0 a 100 que combina tres indicadores:
+    - reportes del último año, ponderados por prioridad
+    - días desde el último mantenimiento (o desde la adquisición si nunca tuvo uno)
+    - costo de los mantenimientos correctivos del último año
+
+Los datos se leen en una sola consulta por tabla y los cálculos se hacen por columnas con pandas.
+CacheRiesgo guarda los indicadores y, cuando solo llegaron reportes nuevos, suma únicamente esos.
+"""
+import time
+import numpy as np
+import pandas as pd
+import laboratorio_db as db
+
+# Ventana de los indicadores de reportes y costos
+DIAS_VENTANA = 365
+
+# Peso de cada reporte según su prioridad
+PESOS_PRIORIDAD = {"Alta": 2.0, "Media": 1.0, "Baja": 0.5}
+
+# Valores con los que cada indicador llega a su aporte máximo
+REPORTES_MAXIMO = 8.0
+DIAS_SIN_MANTENIMIENTO_MAXIMO = 180.0
+
+# Aporte de cada indicador al puntaje (suman 100)
+PESO_REPORTES = 50
+PESO_DIAS = 30
+PESO_COSTO = 20
+
+# Límites inferiores de cada nivel de riesgo
+NIVELES_RIESGO = [(60, "Alto"), (30, "Medio"), (0, "Bajo")]
+
+# Los equipos retirados no se puntúan
+ESTADOS_SIN_RIESGO = ["Retirado"]
+
+# Tablas de las que dependen los indicadores
+TABLAS_RIESGO = ("equipos", "reportes", "mantenimientos")
+
+def leer_reportes(conn, desde_ts, despues_de_id=0):
+    """Devuelve un DataFrame (id, equipo_id, peso) de los reportes desde una fecha, incluidos los archivados"""
+    filas = conn.execute("""SELECT id, equipo_id, prioridad FROM reportes_todos
+                            WHERE fecha_ts >= ? AND id > ? AND equipo_id IS NOT NULL""",
+                         (desde_ts, despues_de_id)).fetchall()
+    reportes = pd.DataFrame(filas, columns=["id", "equipo_id", "prioridad"])
+    reportes["peso"] = reportes["prioridad"].map(PESOS_PRIORIDAD).fillna(1.0)
+    return reportes[["id", "equipo_id", "peso"]]
+
+def calcular_indicadores(conn, ahora=None):
+    """Lee los datos en bloque y devuelve un DataFrame de indicadores por equipo_id"""
+    ahora = ahora or time.time()
+    desde_ts = ahora - DIAS_VENTANA * 86400
+    
+    equipos = pd.DataFrame(conn.execute("""SELECT id, estado, COALESCE(ultimo_mantenimiento_ts, fecha_adquisicion_ts)
+                                           FROM equipos""").fetchall(),
+                           columns=["equipo_id", "estado", "referencia_ts"]).set_index("equipo_id")
+    
+    reportes = leer_reportes(conn, desde_ts)
+    costos = pd.DataFrame(conn.execute("""SELECT equipo_id, SUM(costo) FROM mantenimientos
+                                          WHERE tipo = 'Correctivo' AND costo > 0
+                                          AND COALESCE(fecha_realizado_ts, fecha_programada_ts) >= ?
+                                          GROUP BY equipo_id""", (desde_ts,)).fetchall(),
+                          columns=["equipo_id", "costo"]).set_index("equipo_id")
+    
+    indicadores = pd.DataFrame(index=equipos.index)
+    indicadores["estado"] = equipos["estado"]
+    indicadores["reportes"] = reportes.groupby("equipo_id")["peso"].sum().reindex(equipos.index, fill_value=0.0)
+    # Sin fecha de referencia se asume el máximo: no hay constancia de ningún mantenimiento
+    referencia = pd.to_numeric(equipos["referencia_ts"], errors="coerce")
+    indicadores["dias_sin_mantenimiento"] = ((ahora - referencia) / 86400).clip(lower=0).fillna(DIAS_SIN_MANTENIMIENTO_MAXIMO)
+    indicadores["costo"] = costos["costo"].reindex(equipos.index, fill_value=0.0)
+    return indicadores
+
+def calcular_puntajes(indicadores):
+    """Agrega a los indicadores las columnas riesgo (0 a 100) y nivel"""
+    # El costo se compara con el percentil 90 de la flota, para que no dependa de la moneda
+    costos_positivos = indicadores["costo"][indicadores["costo"] > 0]
+    costo_maximo = costos_positivos.quantile(0.9) if len(costos_positivos) else 1.0
+    
+    riesgo = (PESO_REPORTES * np.minimum(indicadores["reportes"] / REPORTES_MAXIMO, 1)
+              + PESO_DIAS * np.minimum(indicadores["dias_sin_mantenimiento"] / DIAS_SIN_MANTENIMIENTO_MAXIMO, 1)
+              + PESO_COSTO * np.minimum(indicadores["costo"] / costo_maximo, 1))
+    riesgo = riesgo.round().where(~indicadores["estado"].isin(ESTADOS_SIN_RIESGO))
+    
+    puntajes = indicadores.copy()
+    puntajes["riesgo"] = riesgo
+    limites = [limite for limite, _ in NIVELES_RIESGO]
+    puntajes["nivel"] = np.select([riesgo >= limite for limite in limites], [nivel for _, nivel in NIVELES_RIESGO], default="")
+    return puntajes
+
+class CacheRiesgo:
+    """Puntajes de riesgo en memoria, que se recalculan solo cuando cambian los datos"""
+    def __init__(self):
+        self.versiones = None
+        self.dia = None
+        self.indicadores = None
+        self.puntajes = None
+        # Cantidad de reportes y último id ya incluidos en los indicadores
+        self.total_reportes = 0
+        self.ultimo_reporte_id = 0
+    
+    def obtener(self, conn):
+        """Devuelve el DataFrame de puntajes por equipo_id, actualizado con los datos actuales"""
+        versiones = {tabla: db.leer_version_datos(conn, tabla) for tabla in TABLAS_RIESGO}
+        # Los indicadores dependen de la fecha: al cambiar de día se recalculan completos
+        dia = time.strftime("%Y-%m-%d")
+        if self.versiones == versiones and self.dia == dia:
+            return self.puntajes
+        
+        total, ultimo_id = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM reportes_todos").fetchone()
+        solo_reportes = (self.versiones is not None and self.dia == dia
+                         and all(self.versiones[t] == versiones[t] for t in TABLAS_RIESGO if t != "reportes"))
+        if not (solo_reportes and self.sumar_reportes_nuevos(conn, total)):
+            self.indicadores = calcular_indicadores(conn)
+        
+        self.versiones = versiones
+        self.dia = dia
+        self.total_reportes = total
+        self.ultimo_reporte_id = ultimo_id
+        self.puntajes = calcular_puntajes(self.indicadores)
+        return self.puntajes
+    
+    def sumar_reportes_nuevos(self, conn, total):
+        """Suma a los indicadores solo los reportes creados desde la última lectura; devuelve False si hay que recalcular"""
+        nuevos = leer_reportes(conn, time.time() - DIAS_VENTANA * 86400, self.ultimo_reporte_id)
+        recientes = conn.execute("SELECT COUNT(*) FROM reportes_todos WHERE id > ?", (self.ultimo_reporte_id,)).fetchone()[0]
+        # Si el total no cuadra con las altas hubo bajas; los cambios de fecha o prioridad se recogen al cambiar de día
+        if total != self.total_reportes + recientes or not nuevos["equipo_id"].isin(self.indicadores.index).all():
+            return False
+        
+        suma = nuevos.groupby("equipo_id")["peso"].sum()
+        self.indicadores.loc[suma.index, "reportes"] += suma
+        return True
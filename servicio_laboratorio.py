@@ -0,0 +1,532 @@
+"""Modo cliente/servidor: un único proceso es dueño de laboratorio.db y atiende a varias estaciones.
+
+El servicio se inicia en el equipo que guarda la base de datos, escuchando solo en la dirección
+de la red interna del laboratorio (nunca en una interfaz expuesta a otras redes):
+    python gestionlab.py servicio --host 192.168.1.10 --puerto 5050 --clave-archivo clave.txt
+
+y cada estación abre la aplicación contra él con la misma clave compartida:
+    python GestionLAB2.0.py --servidor 192.168.1.10:5050 --clave-archivo clave.txt
+
+La clave también puede darse en la variable de entorno GESTIONLAB_CLAVE_SERVICIO. Al conectarse,
+el servicio envía un reto y la estación responde con su HMAC-SHA256 bajo la clave; si no coincide,
+el servicio cierra la conexión sin ejecutar ninguna petición (ni consultas ni respaldos).
+
+Protocolo: mensajes JSON, uno por línea, sobre TCP. Cada petición lleva un id creciente y el
+servicio responde en el mismo orden. Las escrituras se envían sin esperar respuesta (pipelining),
+de modo que una transacción completa viaja en un solo viaje de ida y vuelta.
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import laboratorio_db as db
+import informes
+
+PUERTO_POR_DEFECTO = 5050
+
+# Variable de entorno con la clave compartida, si no se indica un archivo
+VARIABLE_CLAVE = "GESTIONLAB_CLAVE_SERVICIO"
+
+# Segundos que tiene una estación para autenticarse después de conectarse
+TIEMPO_MAXIMO_AUTENTICACION = 10
+
+# Segundos que una estación puede tener una transacción abierta sin enviar nada antes de que se cancele
+TIEMPO_MAXIMO_TRANSACCION = 30
+
+# Peticiones sin respuesta que un cliente acumula antes de esperar, para no llenar los búferes del socket
+MAXIMO_PENDIENTES = 200
+
+# El servicio archiva los registros antiguos en lugar de las estaciones
+INTERVALO_ARCHIVO_S = 6 * 60 * 60
+
+# Cada cuánto se revisa si hay informes programados pendientes
+INTERVALO_INFORMES_S = 15 * 60
+
+# Palabras con las que empieza la sentencia principal que sigue a las CTE de un WITH
+VERBOS_SENTENCIA = ("SELECT", "VALUES", "INSERT", "REPLACE", "UPDATE", "DELETE")
+
+# Delimitadores de textos e identificadores entre comillas en SQLite
+CIERRES_COMILLAS = {"'": "'", '"': '"', "`": "`", "[": "]"}
+
+def palabras_nivel_superior(sql):
+    """Devuelve en mayúsculas las palabras de una sentencia que están fuera de paréntesis, comillas y comentarios"""
+    palabras = []
+    nivel = 0
+    i = 0
+    while i < len(sql):
+        caracter = sql[i]
+        if caracter in CIERRES_COMILLAS:
+            fin = sql.find(CIERRES_COMILLAS[caracter], i + 1)
+            i = len(sql) if fin < 0 else fin + 1
+        elif sql.startswith("--", i):
+            fin = sql.find("\n", i)
+            i = len(sql) if fin < 0 else fin + 1
+        elif sql.startswith("/*", i):
+            fin = sql.find("*/", i + 2)
+            i = len(sql) if fin < 0 else fin + 2
+        elif caracter in "()":
+            nivel += 1 if caracter == "(" else -1
+            i += 1
+        elif caracter.isalpha() or caracter == "_":
+            fin = i + 1
+            while fin < len(sql) and (sql[fin].isalnum() or sql[fin] in "_$"):
+                fin += 1
+            if nivel == 0:
+                palabras.append(sql[i:fin].upper())
+            i = fin
+        else:
+            i += 1
+    return palabras
+
+def es_lectura(sql):
+    """Indica si una sentencia solo lee datos y puede ejecutarse fuera de la transacción de escritura"""
+    palabras = sql.lstrip().split(None, 1)
+    if not palabras:
+        return True
+    primera = palabras[0].upper()
+    if primera == "SELECT":
+        return True
+    if primera == "WITH":
+        # Lo que decide es la sentencia que sigue a las CTE: WITH ... INSERT/UPDATE/DELETE escribe
+        verbo = next((palabra for palabra in palabras_nivel_superior(sql) if palabra in VERBOS_SENTENCIA), None)
+        return verbo in ("SELECT", "VALUES")
+    # PRAGMA sin asignación (table_info, user_version...) solo consulta
+    return primera == "PRAGMA" and "=" not in sql
+
+def leer_clave(archivo=None):
+    """Devuelve la clave compartida del archivo indicado o de la variable de entorno ("" si no hay)"""
+    if archivo:
+        with open(archivo, encoding="utf-8") as f:
+            return f.read().strip()
+    return os.environ.get(VARIABLE_CLAVE, "").strip()
+
+def prueba_clave(clave, reto):
+    """Devuelve la respuesta al reto del servicio que demuestra conocer la clave sin enviarla"""
+    return hmac.new(clave.encode("utf-8"), reto.encode("ascii"), hashlib.sha256).hexdigest()
+
+def ejecutar(conn, op, sql, params):
+    """Ejecuta una sentencia en una conexión local y devuelve el resultado serializable"""
+    if op == "executemany":
+        cursor = conn.executemany(sql, params)
+    else:
+        cursor = conn.execute(sql, params)
+    filas = [list(fila) for fila in cursor.fetchall()] if cursor.description else []
+    return {
+        "filas": filas,
+        "rowcount": cursor.rowcount,
+        "lastrowid": cursor.lastrowid,
+        "descripcion": [d[0] for d in cursor.description] if cursor.description else None,
+    }
+
+# ------------------------- Servicio -------------------------
+
+class Servicio:
+    """Proceso central que ejecuta las lecturas y serializa las escrituras de todas las estaciones"""
+    def __init__(self, ruta=db.RUTA_DB, clave=""):
+        if not clave:
+            raise ValueError("El servicio necesita una clave compartida")
+        self.ruta = ruta
+        self.clave = clave
+        # Crea y migra el esquema antes de abrir las conexiones del servicio
+        db.conectar(ruta).close()
+        # Una sola conexión escribe, siempre desde el mismo hilo; así no hay contención de bloqueos entre estaciones
+        self.escritor = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+        self.escritor.execute("PRAGMA foreign_keys = ON")
+        self.hilo_escritura = ThreadPoolExecutor(max_workers=1)
+        self.candado_escritura = asyncio.Lock()
+        # Resultados de las plantillas de informes por versión de datos
+        self.cache_informes = {}
+    
+    async def escribir(self, funcion, *args):
+        """Ejecuta una función sobre la conexión de escritura en su hilo dedicado"""
+        return await asyncio.get_running_loop().run_in_executor(self.hilo_escritura, funcion, *args)
+    
+    async def autenticar(self, entrada, salida):
+        """Envía un reto y comprueba que la estación responde con la prueba de la clave compartida"""
+        reto = secrets.token_hex(16)
+        salida.write(json.dumps({"reto": reto}).encode("utf-8") + b"\n")
+        await salida.drain()
+        linea = await asyncio.wait_for(entrada.readline(), TIEMPO_MAXIMO_AUTENTICACION)
+        peticion = json.loads(linea) if linea else {}
+        if not isinstance(peticion, dict):
+            peticion = {}
+        prueba = peticion.get("prueba")
+        valida = (peticion.get("op") == "autenticar" and isinstance(prueba, str)
+                  and hmac.compare_digest(prueba, prueba_clave(self.clave, reto)))
+        respuesta = {"id": peticion.get("id", 0), "ok": valida}
+        if not valida:
+            respuesta.update({"tipo": "OperationalError", "mensaje": "La clave del servicio no es correcta"})
+        salida.write(json.dumps(respuesta).encode("utf-8") + b"\n")
+        await salida.drain()
+        return valida
+    
+    async def atender(self, entrada, salida):
+        """Atiende a una estación hasta que se desconecta"""
+        # La conexión de lectura solo se abre para estaciones autenticadas
+        try:
+            autenticada = await self.autenticar(entrada, salida)
+        except (ConnectionError, json.JSONDecodeError, UnicodeDecodeError, asyncio.TimeoutError):
+            autenticada = False
+        if not autenticada:
+            salida.close()
+            return
+        sesion = Sesion(self)
+        try:
+            while True:
+                try:
+                    if sesion.en_transaccion:
+                        linea = await asyncio.wait_for(entrada.readline(), TIEMPO_MAXIMO_TRANSACCION)
+                    else:
+                        linea = await entrada.readline()
+                except asyncio.TimeoutError:
+                    await sesion.cancelar_transaccion(
+                        sqlite3.OperationalError("Transacción cancelada por inactividad"))
+                    continue
+                if not linea:
+                    break
+                
+                respuesta = await sesion.procesar(json.loads(linea))
+                salida.write(json.dumps(respuesta).encode("utf-8") + b"\n")
+                await salida.drain()
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            # Una estación que se desconecta a mitad de transacción no deja la escritura bloqueada
+            await sesion.cancelar_transaccion(None)
+            sesion.lectura.close()
+            salida.close()
+    
+    async def archivar_periodicamente(self):
+        """Archiva los registros antiguos cada cierto tiempo, esperando su turno de escritura"""
+        while True:
+            await asyncio.sleep(INTERVALO_ARCHIVO_S)
+            async with self.candado_escritura:
+                try:
+                    await self.escribir(db.archivar_registros, self.escritor)
+                except sqlite3.Error as e:
+                    print(f"Error al archivar registros: {e}")  # Se reintentará en el próximo ciclo
+    
+    async def actualizar_estados_reservas(self):
+        """Cambia los estados de las reservas en cada inicio o fin, esperando su turno de escritura"""
+        while True:
+            espera = db.MAXIMA_ESPERA_ESTADOS_S
+            async with self.candado_escritura:
+                try:
+                    await self.escribir(db.actualizar_estados_reservas, self.escritor)
+                    espera = await self.escribir(db.segundos_hasta_cambio_reservas, self.escritor)
+                except sqlite3.Error as e:
+                    print(f"Error al actualizar estados de reservas: {e}")  # Se reintentará en el próximo ciclo
+            await asyncio.sleep(espera)
+    
+    async def generar_informes_periodicamente(self):
+        """Escribe los informes programados pendientes; las consultas esperan su turno, los archivos no"""
+        while True:
+            try:
+                async with self.candado_escritura:
+                    trabajos = await self.escribir(informes.preparar_programados, self.escritor, self.cache_informes)
+                if trabajos:
+                    resultados = await asyncio.get_running_loop().run_in_executor(
+                        None, informes.escribir_programados, trabajos)
+                    for programa_id, error in resultados.items():
+                        if error:
+                            print(f"Error al generar el informe programado {programa_id}: {error}")
+                    async with self.candado_escritura:
+                        await self.escribir(informes.marcar_ejecutados, self.escritor, resultados)
+            except sqlite3.Error as e:
+                print(f"Error al generar informes programados: {e}")  # Se reintentará en el próximo ciclo
+            await asyncio.sleep(INTERVALO_INFORMES_S)
+    
+    async def ejecutar(self, host, puerto):
+        """Acepta estaciones hasta que se interrumpe el proceso"""
+        servidor = await asyncio.start_server(self.atender, host, puerto)
+        tarea_archivo = asyncio.create_task(self.archivar_periodicamente())
+        tarea_estados = asyncio.create_task(self.actualizar_estados_reservas())
+        tarea_informes = asyncio.create_task(self.generar_informes_periodicamente())
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            tarea_archivo.cancel()
+            tarea_estados.cancel()
+            tarea_informes.cancel()
+            self.escritor.close()
+
+class Sesion:
+    """Estado de una estación conectada: su conexión de lectura y su transacción de escritura"""
+    def __init__(self, servicio):
+        self.servicio = servicio
+        self.lectura = db.conectar_lectura(servicio.ruta)
+        self.en_transaccion = False
+        # Error de escritura que invalida las peticiones que la estación envió antes de conocerlo
+        self.error = None
+        self.id_error = None
+    
+    async def procesar(self, peticion):
+        """Ejecuta una petición y devuelve la respuesta"""
+        id_peticion = peticion["id"]
+        op = peticion["op"]
+        try:
+            if self.error is not None:
+                if self.id_error is None:
+                    self.id_error = id_peticion
+                if peticion.get("confirmado", 0) < self.id_error:
+                    if op == "rollback":
+                        return {"id": id_peticion, "ok": True}
+                    raise self.error
+                self.error = None
+                self.id_error = None
+            
+            if op in ("execute", "executemany"):
+                resultado = await self.ejecutar_sentencia(id_peticion, op, peticion["sql"], peticion.get("params") or [])
+            elif op == "commit":
+                resultado = await self.terminar_transaccion("commit")
+            elif op == "rollback":
+                resultado = await self.terminar_transaccion("rollback")
+            elif op == "respaldo":
+                datos = await asyncio.get_running_loop().run_in_executor(None, self.lectura.serialize)
+                resultado = {"datos": base64.b64encode(datos).decode("ascii")}
+            else:
+                raise sqlite3.ProgrammingError(f"Operación desconocida: {op}")
+        except sqlite3.Error as e:
+            return {"id": id_peticion, "ok": False, "tipo": type(e).__name__, "mensaje": str(e)}
+        
+        resultado.update({"id": id_peticion, "ok": True})
+        return resultado
+    
+    async def ejecutar_sentencia(self, id_peticion, op, sql, params):
+        """Ejecuta una sentencia: las lecturas en la conexión propia y las escrituras en la compartida"""
+        if not self.en_transaccion and es_lectura(sql):
+            return await asyncio.get_running_loop().run_in_executor(None, ejecutar, self.lectura, op, sql, params)
+        
+        if not self.en_transaccion:
+            await self.servicio.candado_escritura.acquire()
+            self.en_transaccion = True
+        try:
+            resultado = await self.servicio.escribir(ejecutar, self.servicio.escritor, op, sql, params)
+        except sqlite3.Error as e:
+            # Como en SQLite, la sentencia que falla no se aplica; el resto de la transacción se descarta
+            await self.cancelar_transaccion(e)
+            self.id_error = id_peticion
+            raise
+        
+        # Las sentencias que no abren transacción (CREATE, PRAGMA...) liberan la escritura enseguida
+        if not self.servicio.escritor.in_transaction:
+            self.liberar()
+        return resultado
+    
+    async def terminar_transaccion(self, op):
+        """Confirma o deshace la transacción de la estación y libera la escritura"""
+        if self.en_transaccion:
+            try:
+                await self.servicio.escribir(getattr(self.servicio.escritor, op))
+            finally:
+                if self.servicio.escritor.in_transaction:
+                    await self.servicio.escribir(self.servicio.escritor.rollback)
+                self.liberar()
+        return {}
+    
+    async def cancelar_transaccion(self, error):
+        """Deshace la transacción abierta y deja el error pendiente de informar a la estación"""
+        if self.en_transaccion:
+            await self.servicio.escribir(self.servicio.escritor.rollback)
+            self.liberar()
+            if error is not None:
+                self.error = error
+                self.id_error = None
+    
+    def liberar(self):
+        """Cede la escritura a la siguiente estación"""
+        self.en_transaccion = False
+        self.servicio.candado_escritura.release()
+
+def iniciar_servicio(ruta=db.RUTA_DB, host="127.0.0.1", puerto=PUERTO_POR_DEFECTO, clave=""):
+    """Inicia el servicio y lo mantiene activo hasta Ctrl+C"""
+    async def principal():
+        await Servicio(ruta, clave).ejecutar(host, puerto)
+    try:
+        asyncio.run(principal())
+    except KeyboardInterrupt:
+        pass
+
+# ------------------------- Cliente -------------------------
+
+class CursorRemoto:
+    """Cursor con la interfaz de sqlite3.Cursor que usa la aplicación, respaldado por el servicio"""
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.id_pendiente = None
+        self.filas = []
+        self.posicion = 0
+        self.datos = {"rowcount": -1, "lastrowid": None, "descripcion": None}
+    
+    def execute(self, sql, params=()):
+        """Envía una sentencia; solo las lecturas esperan la respuesta"""
+        return self.enviar("execute", sql, params if isinstance(params, dict) else list(params))
+    
+    def executemany(self, sql, params):
+        """Envía una sentencia con varios juegos de parámetros"""
+        return self.enviar("executemany", sql, [p if isinstance(p, dict) else list(p) for p in params])
+    
+    def enviar(self, op, sql, params):
+        """Envía la petición y, si es una lectura, espera las filas"""
+        self.filas = []
+        self.posicion = 0
+        self.id_pendiente = self.conexion.enviar(op, cursor=self, sql=sql, params=params)
+        if es_lectura(sql):
+            self.esperar()
+        return self
+    
+    def recibir(self, respuesta):
+        """Guarda el resultado que llegó del servicio"""
+        if self.id_pendiente == respuesta["id"]:
+            self.id_pendiente = None
+            self.filas = [tuple(fila) for fila in respuesta.get("filas", [])]
+            self.datos = respuesta
+    
+    def esperar(self):
+        """Espera la respuesta de la última sentencia enviada por este cursor"""
+        if self.id_pendiente is not None:
+            self.conexion.esperar(self.id_pendiente)
+    
+    @property
+    def rowcount(self):
+        self.esperar()
+        return self.datos.get("rowcount", -1)
+    
+    @property
+    def lastrowid(self):
+        self.esperar()
+        return self.datos.get("lastrowid")
+    
+    @property
+    def description(self):
+        self.esperar()
+        nombres = self.datos.get("descripcion")
+        return [(nombre, None, None, None, None, None, None) for nombre in nombres] if nombres else None
+    
+    def fetchone(self):
+        self.esperar()
+        if self.posicion >= len(self.filas):
+            return None
+        self.posicion += 1
+        return self.filas[self.posicion - 1]
+    
+    def fetchmany(self, size=1):
+        self.esperar()
+        filas = self.filas[self.posicion:self.posicion + size]
+        self.posicion += len(filas)
+        return filas
+    
+    def fetchall(self):
+        self.esperar()
+        filas = self.filas[self.posicion:]
+        self.posicion = len(self.filas)
+        return filas
+    
+    def __iter__(self):
+        return iter(self.fetchall())
+
+class ConexionRemota:
+    """Conexión al servicio con la interfaz de sqlite3.Connection que usa la aplicación"""
+    def __init__(self, host, puerto=PUERTO_POR_DEFECTO, clave=""):
+        self.socket = socket.create_connection((host, puerto))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.archivo = self.socket.makefile("rwb")
+        self.ultimo_id = 0
+        self.ultimo_leido = 0
+        # Peticiones enviadas cuya respuesta no se ha leído: id -> cursor que la espera (o None)
+        self.pendientes = collections.OrderedDict()
+        try:
+            self.autenticar(clave)
+        except sqlite3.Error:
+            self.close()
+            raise
+    
+    def autenticar(self, clave):
+        """Responde al reto del servicio con la prueba de la clave compartida"""
+        if not clave:
+            raise sqlite3.OperationalError(f"Falta la clave del servicio (archivo o variable {VARIABLE_CLAVE})")
+        try:
+            reto = json.loads(self.archivo.readline())["reto"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise sqlite3.OperationalError(f"El servicio no respondió al saludo: {e}")
+        self.esperar(self.enviar("autenticar", prueba=prueba_clave(clave, reto)))
+    
+    def enviar(self, op, cursor=None, **datos):
+        """Envía una petición sin esperar la respuesta y devuelve su id"""
+        if len(self.pendientes) >= MAXIMO_PENDIENTES:
+            self.esperar(next(iter(self.pendientes)))
+        self.ultimo_id += 1
+        peticion = dict(datos, id=self.ultimo_id, op=op, confirmado=self.ultimo_leido)
+        try:
+            self.archivo.write(json.dumps(peticion).encode("utf-8") + b"\n")
+            self.archivo.flush()
+        except OSError as e:
+            raise sqlite3.OperationalError(f"Se perdió la conexión con el servicio: {e}")
+        self.pendientes[self.ultimo_id] = cursor
+        return self.ultimo_id
+    
+    def esperar(self, id_peticion):
+        """Lee las respuestas hasta la indicada; si alguna escritura anterior falló, lanza ese error"""
+        primer_error = None
+        respuesta = None
+        while id_peticion in self.pendientes:
+            try:
+                linea = self.archivo.readline()
+            except OSError as e:
+                raise sqlite3.OperationalError(f"Se perdió la conexión con el servicio: {e}")
+            if not linea:
+                raise sqlite3.OperationalError("Se perdió la conexión con el servicio")
+            respuesta = json.loads(linea)
+            self.ultimo_leido = respuesta["id"]
+            cursor = self.pendientes.pop(respuesta["id"])
+            if not respuesta["ok"]:
+                primer_error = primer_error or respuesta
+            elif cursor is not None:
+                cursor.recibir(respuesta)
+        
+        if primer_error is not None:
+            tipo = getattr(sqlite3, primer_error["tipo"], None)
+            if not (isinstance(tipo, type) and issubclass(tipo, sqlite3.Error)):
+                tipo = sqlite3.OperationalError
+            raise tipo(primer_error["mensaje"])
+        return respuesta
+    
+    def cursor(self):
+        return CursorRemoto(self)
+    
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+    
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+    
+    def commit(self):
+        self.esperar(self.enviar("commit"))
+    
+    def rollback(self):
+        self.esperar(self.enviar("rollback"))
+    
+    def backup(self, destino):
+        """Copia la base de datos del servicio en la conexión local indicada"""
+        respuesta = self.esperar(self.enviar("respaldo"))
+        copia = sqlite3.connect(":memory:")
+        try:
+            copia.deserialize(base64.b64decode(respuesta["datos"]))
+            copia.backup(destino)
+        finally:
+            copia.close()
+    
+    def close(self):
+        try:
+            self.archivo.close()
+            self.socket.close()
+        except OSError:
+            pass
@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# Los módulos del sistema están en la raíz del repositorio, sin paquete
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import laboratorio_db as db
+
+@pytest.fixture
+def conn(tmp_path):
+    """Base de datos nueva con todas las migraciones aplicadas"""
+    conexion = db.conectar(str(tmp_path / "laboratorio.db"))
+    yield conexion
+    conexion.close()
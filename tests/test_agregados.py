@@ -0,0 +1,137 @@
+"""Los agregados que mantienen los triggers deben coincidir con un recálculo completo tras cualquier edición"""
+from datetime import date, datetime, timedelta
+import laboratorio_db as db
+
+def crear_equipo(conn, nombre, fecha_adquisicion="2020-01-15"):
+    cursor = conn.execute("INSERT INTO equipos (nombre, tipo, fecha_adquisicion) VALUES (?, 'PC', ?)",
+                          (nombre, fecha_adquisicion))
+    conn.commit()
+    return cursor.lastrowid
+
+def crear_reporte(conn, equipo_id, prioridad="Alta", tipo="Falla", fecha=None):
+    # Por defecto, reportes recientes que el archivo no mueve
+    fecha = fecha or (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S")
+    cursor = conn.execute("""INSERT INTO reportes (equipo_id, tipo, descripcion, fecha, estado, prioridad)
+                             VALUES (?, ?, 'No enciende', ?, 'Abierto', ?)""", (equipo_id, tipo, fecha, prioridad))
+    conn.commit()
+    return cursor.lastrowid
+
+def cambiar_estado(conn, reporte_id, estado):
+    conn.execute("UPDATE reportes SET estado = ? WHERE id = ?", (estado, reporte_id))
+    conn.commit()
+
+def tiempos_resolucion(conn):
+    return sorted(fila for fila in conn.execute(
+        "SELECT dimension, valor, resueltos, suma_s, dentro_sla FROM tiempos_resolucion") if any(fila[2:]))
+
+def verificar_tiempos_resolucion(conn):
+    incrementales = tiempos_resolucion(conn)
+    db.recalcular_tiempos_resolucion(conn)
+    assert incrementales == tiempos_resolucion(conn)
+
+def verificar_contadores(conn):
+    # Los contadores incluyen los registros archivados
+    for tabla, contador in (("reportes_todos", "num_reportes"), ("reservas_todos", "num_reservas"),
+                            ("mantenimientos", "num_mantenimientos")):
+        diferencias = conn.execute(f"""SELECT e.id, e.{contador}, (SELECT COUNT(*) FROM {tabla} t WHERE t.equipo_id = e.id)
+                                       FROM equipos e""").fetchall()
+        assert [(equipo, guardado) for equipo, guardado, real in diferencias if guardado != real] == []
+
+def ocupacion_esperada(conn):
+    """Calcula en Python los días ocupados de cada reserva y mantenimiento, sin usar los triggers"""
+    esperada = set()
+    for origen, sql in (("reserva", """SELECT id, equipo_id, fecha_inicio_ts, fecha_fin_ts FROM reservas
+                                       WHERE estado != 'Cancelada' AND equipo_id IS NOT NULL"""),
+                        ("mantenimiento", """SELECT id, equipo_id, fecha_programada_ts, fecha_programada_ts + 86400
+                                             FROM mantenimientos
+                                             WHERE estado != 'Cancelado' AND equipo_id IS NOT NULL""")):
+        for origen_id, equipo_id, inicio, fin in conn.execute(sql):
+            if inicio is None or fin is None:
+                continue
+            dia = datetime.fromtimestamp(inicio).date()
+            ultimo = datetime.fromtimestamp(fin - 1).date()
+            while dia <= ultimo:
+                esperada.add((dia.isoformat(), equipo_id, origen, origen_id, inicio, fin))
+                dia += timedelta(days=1)
+    return esperada
+
+def verificar_ocupacion(conn):
+    guardada = set(conn.execute("SELECT dia, equipo_id, origen, origen_id, inicio_ts, fin_ts FROM ocupacion"))
+    assert guardada == ocupacion_esperada(conn)
+
+def test_tiempos_resolucion_al_resolver_reabrir_y_editar(conn):
+    equipo = crear_equipo(conn, "PC-01")
+    reportes = [crear_reporte(conn, equipo, prioridad) for prioridad in ("Alta", "Media", "Baja", "Alta")]
+    for reporte in reportes:
+        cambiar_estado(conn, reporte, "En Progreso")
+        cambiar_estado(conn, reporte, "Resuelto")
+    verificar_tiempos_resolucion(conn)
+    
+    cambiar_estado(conn, reportes[0], "Abierto")
+    conn.execute("UPDATE reportes SET prioridad = 'Baja', tipo = 'Software' WHERE id = ?", (reportes[1],))
+    conn.execute("UPDATE reportes SET equipo_id = ? WHERE id = ?", (crear_equipo(conn, "PC-02"), reportes[2]))
+    conn.execute("UPDATE reportes SET fecha = '2000-01-01 09:00:00' WHERE id = ?", (reportes[3],))
+    conn.commit()
+    verificar_tiempos_resolucion(conn)
+
+def test_tiempos_resolucion_al_borrar_y_archivar(conn):
+    equipo = crear_equipo(conn, "PC-01")
+    otro = crear_equipo(conn, "PC-02")
+    reportes = [crear_reporte(conn, equipo), crear_reporte(conn, equipo, "Media"),
+                crear_reporte(conn, otro, fecha="2000-01-01 09:00:00")]
+    for reporte in reportes:
+        cambiar_estado(conn, reporte, "Resuelto")
+    
+    # Archivar mueve el reporte antiguo a reportes_archivo, que también cuenta para los tiempos
+    assert db.archivar_registros(conn)["reportes"] == 1
+    verificar_tiempos_resolucion(conn)
+    
+    conn.execute("DELETE FROM reportes WHERE id = ?", (reportes[0],))
+    conn.commit()
+    verificar_tiempos_resolucion(conn)
+    
+    # Borrar el equipo borra sus reportes en cascada
+    conn.execute("DELETE FROM equipos WHERE id = ?", (equipo,))
+    conn.commit()
+    verificar_tiempos_resolucion(conn)
+
+def test_contadores_por_equipo(conn):
+    equipos = [crear_equipo(conn, "PC-01"), crear_equipo(conn, "PC-02")]
+    reporte = crear_reporte(conn, equipos[0])
+    crear_reporte(conn, equipos[0])
+    conn.execute("""INSERT INTO mantenimientos (equipo_id, tipo, fecha_programada, estado)
+                    VALUES (?, 'Preventivo', '2024-06-01', 'Pendiente')""", (equipos[1],))
+    db.reservar_en_lote(conn, equipos, None, [(datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 10))], "Clase")
+    verificar_contadores(conn)
+    
+    conn.execute("UPDATE reportes SET equipo_id = ? WHERE id = ?", (equipos[1], reporte))
+    conn.execute("DELETE FROM reservas WHERE equipo_id = ?", (equipos[0],))
+    conn.commit()
+    cambiar_estado(conn, reporte, "Resuelto")
+    conn.execute("UPDATE reportes SET fecha = '2000-01-01 09:00:00' WHERE id = ?", (reporte,))
+    conn.commit()
+    db.archivar_registros(conn)
+    verificar_contadores(conn)
+
+def test_ocupacion_al_reservar_editar_cancelar_y_borrar(conn):
+    equipos = [crear_equipo(conn, "PC-01"), crear_equipo(conn, "PC-02")]
+    ocurrencias = db.expandir_recurrencia(date(2030, 1, 7), date(2030, 1, 20), "08:00", "10:00", {0, 2})
+    db.reservar_en_lote(conn, equipos, None, ocurrencias, "Clase")
+    conn.execute("""INSERT INTO reservas (equipo_id, fecha_inicio, fecha_fin, estado)
+                    VALUES (?, '2030-02-01 22:00', '2030-02-04 02:00', 'Confirmada')""", (equipos[0],))
+    conn.execute("""INSERT INTO mantenimientos (equipo_id, tipo, fecha_programada, estado)
+                    VALUES (?, 'Preventivo', '2030-01-08', 'Pendiente')""", (equipos[1],))
+    conn.commit()
+    verificar_ocupacion(conn)
+    
+    primera, segunda, tercera = [fila[0] for fila in conn.execute("SELECT id FROM reservas ORDER BY id LIMIT 3")]
+    conn.execute("UPDATE reservas SET fecha_fin = '2030-01-09 12:00' WHERE id = ?", (primera,))
+    conn.execute("UPDATE reservas SET estado = 'Cancelada' WHERE id = ?", (segunda,))
+    conn.execute("UPDATE reservas SET equipo_id = ? WHERE id = ?", (equipos[1], tercera))
+    conn.execute("UPDATE mantenimientos SET fecha_programada = '2030-01-10'")
+    conn.commit()
+    verificar_ocupacion(conn)
+    
+    conn.execute("DELETE FROM equipos WHERE id = ?", (equipos[0],))
+    conn.commit()
+    verificar_ocupacion(conn)
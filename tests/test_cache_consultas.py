@@ -0,0 +1,29 @@
+import shutil
+import laboratorio_db as db
+from cache_consultas import CacheConsultas
+
+def test_restaurar_invalida_los_resultados_guardados(tmp_path):
+    ruta = str(tmp_path / "laboratorio.db")
+    respaldo = str(tmp_path / "respaldo.db")
+    sql = "SELECT componente, cantidad FROM inventario"
+    cache = CacheConsultas("servidor:5050", str(tmp_path / "cache.db"))
+    
+    conn = db.conectar(ruta)
+    conn.close()
+    shutil.copy2(ruta, respaldo)
+    
+    # Una escritura después del respaldo, consultada y guardada en la caché
+    conn = db.conectar(ruta)
+    conn.execute("INSERT INTO inventario (componente, cantidad) VALUES ('Cable', 5)")
+    conn.commit()
+    assert cache.consultar(conn, sql, tablas=["inventario"]) == [("Cable", 5)]
+    conn.close()
+    
+    # Se restaura el respaldo y una escritura distinta deja inventario en la misma versión de antes
+    db.restaurar(respaldo, ruta)
+    conn = db.conectar(ruta)
+    conn.execute("INSERT INTO inventario (componente, cantidad) VALUES ('Switch', 2)")
+    conn.commit()
+    assert cache.consultar(conn, sql, tablas=["inventario"]) == [("Switch", 2)]
+    conn.close()
+    cache.cerrar()
@@ -0,0 +1,55 @@
+import laboratorio_db as db
+
+def agregados(conn):
+    """Devuelve los agregados de costos sin los grupos vacíos, que el recálculo no genera"""
+    return sorted((dimension, valor, cantidad, round(total, 2)) for dimension, valor, cantidad, total
+                  in conn.execute("SELECT dimension, valor, cantidad, total FROM costos_mantenimiento")
+                  if cantidad or round(total, 2))
+
+def verificar_contra_recalculo(conn):
+    incrementales = agregados(conn)
+    db.recalcular_costos_mantenimiento(conn)
+    assert incrementales == agregados(conn)
+
+def crear_equipo(conn, fecha_adquisicion="2020-01-15"):
+    cursor = conn.execute("INSERT INTO equipos (nombre, tipo, fecha_adquisicion) VALUES ('Router', 'Red', ?)",
+                          (fecha_adquisicion,))
+    conn.commit()
+    return cursor.lastrowid
+
+def crear_mantenimiento(conn, equipo_id, costo, fecha="2024-03-01"):
+    cursor = conn.execute("""INSERT INTO mantenimientos (equipo_id, tipo, fecha_programada, fecha_realizado, tecnico,
+                             estado, costo) VALUES (?, 'Preventivo', ?, ?, 'Luis', 'Completado', ?)""",
+                          (equipo_id, fecha, fecha, costo))
+    conn.commit()
+    return cursor.lastrowid
+
+def test_cambio_de_fecha_de_adquisicion_y_costo(conn):
+    equipo = crear_equipo(conn)
+    mantenimiento = crear_mantenimiento(conn, equipo, 100)
+    assert ("antiguedad", "4", 1, 100.0) in agregados(conn)
+    
+    conn.execute("UPDATE equipos SET fecha_adquisicion = '2023-01-15' WHERE id = ?", (equipo,))
+    conn.execute("UPDATE mantenimientos SET costo = 50 WHERE id = ?", (mantenimiento,))
+    conn.commit()
+    assert ("antiguedad", "1", 1, 50.0) in agregados(conn)
+    verificar_contra_recalculo(conn)
+
+def test_borrar_equipo_en_cascada(conn):
+    equipo = crear_equipo(conn)
+    crear_mantenimiento(conn, equipo, 100)
+    crear_mantenimiento(conn, crear_equipo(conn, "2022-06-01"), 30)
+    conn.execute("DELETE FROM equipos WHERE id = ?", (equipo,))
+    conn.commit()
+    assert not [fila for fila in agregados(conn) if fila[1] == "4"]
+    verificar_contra_recalculo(conn)
+
+def test_equipo_sin_fecha_de_adquisicion(conn):
+    equipo = crear_equipo(conn, None)
+    crear_mantenimiento(conn, equipo, 70)
+    conn.execute("UPDATE equipos SET fecha_adquisicion = '2021-02-01' WHERE id = ?", (equipo,))
+    conn.commit()
+    verificar_contra_recalculo(conn)
+    conn.execute("UPDATE equipos SET fecha_adquisicion = NULL WHERE id = ?", (equipo,))
+    conn.commit()
+    verificar_contra_recalculo(conn)
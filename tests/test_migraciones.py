@@ -0,0 +1,63 @@
+"""Una base de datos con el esquema original debe migrar hasta la última versión con los agregados al día"""
+import sqlite3
+import pytest
+import laboratorio_db as db
+from test_agregados import verificar_contadores, verificar_ocupacion, verificar_tiempos_resolucion
+from test_costos_mantenimiento import verificar_contra_recalculo
+
+@pytest.fixture
+def ruta_original(tmp_path):
+    """Base de datos de la versión 0 con datos, en la que el id 1 es de un usuario que no es el administrador"""
+    ruta = str(tmp_path / "original.db")
+    conn = sqlite3.connect(ruta)
+    for tabla in db.TABLAS_BASE:
+        conn.execute(tabla)
+    conn.execute("""INSERT INTO usuarios (id, nombre, rol, usuario, contrasena, estado)
+                    VALUES (1, 'Ana', 'Técnico', 'ana', 'x', 'Activo')""")
+    conn.executemany("INSERT INTO equipos (id, nombre, tipo, fecha_adquisicion) VALUES (?, ?, 'PC', ?)",
+                     [(1, "PC-01", "2019-03-10"), (2, "PC-02", "2022-11-01")])
+    conn.executemany("""INSERT INTO reportes (equipo_id, tipo, descripcion, fecha, estado, prioridad)
+                        VALUES (?, 'Falla', 'No enciende', ?, ?, ?)""",
+                     [(1, "2024-05-01 09:00:00", "Resuelto", "Alta"), (1, "2024-05-02 10:30:00", "Abierto", "Media"),
+                      (2, "2024-05-03 08:00:00", "En Progreso", "Baja")])
+    conn.executemany("""INSERT INTO reservas (equipo_id, usuario_id, fecha_inicio, fecha_fin, proposito, estado)
+                        VALUES (?, 1, ?, ?, 'Clase', ?)""",
+                     [(1, "2030-01-07 08:00", "2030-01-07 10:00", "Confirmada"),
+                      (2, "2030-01-08 22:00", "2030-01-10 02:00", "Confirmada"),
+                      (2, "2030-01-09 08:00", "2030-01-09 10:00", "Cancelada")])
+    conn.executemany("""INSERT INTO mantenimientos (equipo_id, tipo, fecha_programada, fecha_realizado, tecnico,
+                        estado, costo) VALUES (?, 'Preventivo', ?, ?, 'Luis', ?, ?)""",
+                     [(1, "2024-03-01", "2024-03-02", "Completado", 120.5), (2, "2030-01-15", None, "Pendiente", 0)])
+    conn.execute("INSERT INTO accesos (usuario_id, fecha_hora, accion) VALUES (1, '2024-05-01 09:00:00', 'Inicio de sesión')")
+    conn.commit()
+    conn.close()
+    return ruta
+
+def verificar_agregados(conn):
+    verificar_contadores(conn)
+    verificar_ocupacion(conn)
+    verificar_contra_recalculo(conn)
+    verificar_tiempos_resolucion(conn)
+
+def test_migracion_completa_desde_version_0(ruta_original):
+    conn = db.conectar(ruta_original)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRACIONES)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    
+    # El administrador se crea con un id nuevo y el usuario existente conserva el suyo
+    administrador = db.id_administrador(conn)
+    assert conn.execute("SELECT usuario FROM usuarios WHERE id = ?", (administrador,)).fetchone() == ("admin",)
+    assert conn.execute("SELECT usuario FROM usuarios WHERE id = 1").fetchone() == ("ana",)
+    
+    assert conn.execute("SELECT num_reportes, num_reservas, num_mantenimientos FROM equipos ORDER BY id").fetchall() \
+        == [(2, 1, 1), (1, 2, 1)]
+    verificar_agregados(conn)
+    conn.close()
+
+def test_volver_a_abrir_no_repite_migraciones(ruta_original):
+    db.conectar(ruta_original).close()
+    conn = db.conectar(ruta_original)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRACIONES)
+    assert conn.execute("SELECT COUNT(*) FROM usuarios WHERE usuario = 'admin'").fetchone() == (1,)
+    verificar_agregados(conn)
+    conn.close()
@@ -0,0 +1,74 @@
+from datetime import date, datetime
+import pytest
+import laboratorio_db as db
+
+def crear_equipo(conn, nombre="PC-01"):
+    cursor = conn.execute("INSERT INTO equipos (nombre, tipo) VALUES (?, 'PC')", (nombre,))
+    conn.commit()
+    return cursor.lastrowid
+
+def contar_reservas(conn):
+    return conn.execute("SELECT COUNT(*) FROM reservas").fetchone()[0]
+
+def test_expandir_recurrencia_dias_y_frecuencia():
+    # Lunes y miércoles, cada dos semanas, del lunes 2024-03-04 al domingo 2024-03-31
+    ocurrencias = db.expandir_recurrencia(date(2024, 3, 4), date(2024, 3, 31), "08:00", "10:00", {0, 2}, 2)
+    assert [inicio.date() for inicio, _ in ocurrencias] == [
+        date(2024, 3, 4), date(2024, 3, 6), date(2024, 3, 18), date(2024, 3, 20)]
+    assert all((fin - inicio).seconds == 2 * 3600 for inicio, fin in ocurrencias)
+
+def test_expandir_recurrencia_rango_que_empieza_a_mitad_de_semana():
+    # Las semanas se cuentan desde el lunes de la semana inicial
+    ocurrencias = db.expandir_recurrencia(date(2024, 3, 6), date(2024, 3, 12), "14:00", "15:00", {0, 2})
+    assert [inicio.date() for inicio, _ in ocurrencias] == [date(2024, 3, 6), date(2024, 3, 11)]
+
+@pytest.mark.parametrize("hora_fin, cada_semanas", [("08:00", 1), ("07:00", 1), ("09:00", 0)])
+def test_expandir_recurrencia_invalida(hora_fin, cada_semanas):
+    with pytest.raises(ValueError):
+        db.expandir_recurrencia(date(2024, 3, 4), date(2024, 3, 10), "08:00", hora_fin, {0}, cada_semanas)
+
+def test_reservar_en_lote_crea_todas(conn):
+    equipos = [crear_equipo(conn, "PC-01"), crear_equipo(conn, "PC-02")]
+    ocurrencias = db.expandir_recurrencia(date(2030, 1, 7), date(2030, 1, 20), "08:00", "10:00", {0, 3})
+    creadas, conflictos = db.reservar_en_lote(conn, equipos, None, ocurrencias, "Clase")
+    assert (creadas, conflictos) == (8, [])
+    assert contar_reservas(conn) == 8
+
+def test_reservar_en_lote_con_conflicto_no_crea_ninguna(conn):
+    equipo = crear_equipo(conn)
+    db.reservar_en_lote(conn, [equipo], None, [(datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 11))], "Previa")
+    ocurrencias = db.expandir_recurrencia(date(2030, 1, 7), date(2030, 1, 20), "08:00", "10:00", {0})
+    creadas, conflictos = db.reservar_en_lote(conn, [equipo], None, ocurrencias, "Clase")
+    assert creadas == 0
+    assert conflictos == [("PC-01", "2030-01-07 08:00", "2030-01-07 10:00", "2030-01-07 09:00", "2030-01-07 11:00")]
+    assert contar_reservas(conn) == 1
+
+def test_reservar_en_lote_conserva_lo_pendiente_del_llamador(conn):
+    equipo = crear_equipo(conn)
+    db.reservar_en_lote(conn, [equipo], None, [(datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 11))], "Previa")
+    
+    # Trabajo sin confirmar del llamador en la misma transacción
+    conn.execute("UPDATE equipos SET ubicacion = 'Sala 2' WHERE id = ?", (equipo,))
+    creadas, conflictos = db.reservar_en_lote(
+        conn, [equipo], None, [(datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 12))], "Clase", commit=False)
+    assert creadas == 0 and conflictos
+    conn.commit()
+    assert conn.execute("SELECT ubicacion FROM equipos WHERE id = ?", (equipo,)).fetchone()[0] == "Sala 2"
+    assert contar_reservas(conn) == 1
+
+def test_reservar_en_lote_sin_commit_queda_a_cargo_del_llamador(conn):
+    equipo = crear_equipo(conn)
+    creadas, _ = db.reservar_en_lote(
+        conn, [equipo], None, [(datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 9))], "Clase", commit=False)
+    assert creadas == 1
+    conn.rollback()
+    assert contar_reservas(conn) == 0
+
+def test_reservar_en_lote_informa_una_vez_los_choques_entre_reservas_nuevas(conn):
+    equipo = crear_equipo(conn)
+    ocurrencias = [(datetime(2030, 1, 7, 8), datetime(2030, 1, 7, 10)),
+                   (datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 11))]
+    creadas, conflictos = db.reservar_en_lote(conn, [equipo], None, ocurrencias, "Clase")
+    assert creadas == 0
+    assert conflictos == [("PC-01", "2030-01-07 08:00", "2030-01-07 10:00", "2030-01-07 09:00", "2030-01-07 11:00")]
+    assert contar_reservas(conn) == 0
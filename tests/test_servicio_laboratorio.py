@@ -0,0 +1,27 @@
+import pytest
+from servicio_laboratorio import es_lectura
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM reportes",
+    "  select id from equipos",
+    "WITH x AS (SELECT 1) SELECT * FROM x",
+    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 5) SELECT x FROM n",
+    "WITH a AS (SELECT 'DELETE (' AS t), b AS MATERIALIZED (SELECT * FROM a) SELECT * FROM b",
+    "WITH \"update\" AS (SELECT 1) -- DELETE\nSELECT * FROM \"update\"",
+    "PRAGMA table_info(reportes)",
+    "PRAGMA user_version",
+])
+def test_sentencias_de_lectura(sql):
+    assert es_lectura(sql)
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO equipos (nombre) VALUES ('PC')",
+    "UPDATE reportes SET estado = 'Resuelto'",
+    "WITH viejos AS (SELECT id FROM accesos WHERE fecha_hora_ts < 0) DELETE FROM accesos WHERE id IN viejos",
+    "WITH v(x) AS (VALUES (1)) INSERT INTO equipos (nombre) SELECT x FROM v",
+    "with t as (select 1) update equipos set estado = 'Activo'",
+    "PRAGMA user_version = 3",
+    "SAVEPOINT lote",
+])
+def test_sentencias_de_escritura(sql):
+    assert not es_lectura(sql)